@@ -0,0 +1,190 @@
+"""
+Two-tier cache for rendered payloads.
+
+Each ``TieredCache`` is a namespace with a small per-process LRU in front of
+the ``shared`` cache alias (files on local disk by default, see ``CACHES``),
+so a value computed by one worker is reused by the others and survives a
+restart of any of them.
+
+Keys are versioned per namespace. ``bump()`` stores a new random version in
+the shared tier, which orphans every key of the old one at once, and
+``delete(key)`` drops a single key. Both clear this process's LRU straight
+away; other processes stop serving their local copy within
+``CACHE_LOCAL_TTL`` seconds.
+
+A miss is computed once. Threads of one process wait for the first caller,
+and processes race for a short-lived ``add()`` lock in the shared tier; the
+losers poll for the winner's value for up to ``CACHE_LOCK_TIMEOUT`` seconds
+before computing it themselves.
+"""
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+
+_MISSING = object()
+LOCK_POLL_INTERVAL = 0.05
+
+
+class LocalLRU:
+    """Size-bounded in-process store with per-entry expiry"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[1] < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TieredCache:
+    """Versioned cache namespace: per-process LRU over the shared cache"""
+
+    def __init__(self, namespace, timeout=300):
+        self.namespace = namespace
+        self.timeout = timeout
+        self._local = None
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[getattr(settings, 'CACHE_SHARED_ALIAS', 'shared')]
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = LocalLRU(getattr(settings, 'CACHE_LOCAL_SIZE', 1024))
+        return self._local
+
+    @property
+    def local_ttl(self):
+        return getattr(settings, 'CACHE_LOCAL_TTL', 2.0)
+
+    @property
+    def lock_timeout(self):
+        return getattr(settings, 'CACHE_LOCK_TIMEOUT', 5.0)
+
+    def _version_key(self):
+        return f'{self.namespace}:version'
+
+    def _shared_version(self):
+        version = self.shared.get(self._version_key())
+        if version is None:
+            self.shared.add(self._version_key(), secrets.token_hex(4), timeout=None)
+            version = self.shared.get(self._version_key())
+        return version
+
+    def cached_version(self):
+        """The namespace version as this process last saw it, or None once that is stale"""
+        version = self.local.get(self._version_key())
+        return None if version is _MISSING else version
+
+    def version(self):
+        version = self.cached_version()
+        if version is None:
+            version = self._shared_version()
+            self.local.set(self._version_key(), version, self.local_ttl)
+        return version
+
+    def _key(self, version, key):
+        return f'{self.namespace}:{version}:{key}'
+
+    def get_or_set(self, key, compute, timeout=None):
+        """Cached value for ``key``, calling ``compute()`` at most once per miss"""
+        value = self.local.get(key)
+        if value is not _MISSING:
+            return value
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = threading.Event()
+        if not leader:
+            flight.wait(self.lock_timeout)
+            value = self.local.get(key)
+            if value is not _MISSING:
+                return value
+            return self._load(key, compute, timeout)
+        try:
+            return self._load(key, compute, timeout)
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.set()
+
+    async def aget_or_set(self, key, compute, timeout=None):
+        value = self.local.get(key)
+        if value is not _MISSING:
+            return value
+        return await sync_to_async(self.get_or_set)(key, compute, timeout)
+
+    def _load(self, key, compute, timeout):
+        shared = self.shared
+        shared_key = self._key(self.version(), key)
+        value = shared.get(shared_key, _MISSING)
+        if value is _MISSING:
+            lock_key = f'{shared_key}:lock'
+            if shared.add(lock_key, 1, timeout=self.lock_timeout):
+                try:
+                    value = compute()
+                    shared.set(shared_key, value, timeout=timeout or self.timeout)
+                finally:
+                    shared.delete(lock_key)
+            else:
+                deadline = time.monotonic() + self.lock_timeout
+                while value is _MISSING and time.monotonic() < deadline:
+                    time.sleep(LOCK_POLL_INTERVAL)
+                    value = shared.get(shared_key, _MISSING)
+                if value is _MISSING:
+                    # The lock holder died or is slow; don't make the caller wait any longer.
+                    value = compute()
+        self.local.set(key, value, self.local_ttl)
+        return value
+
+    def delete(self, key):
+        # Read the version from the shared tier: this process's copy may be stale.
+        self.shared.delete(self._key(self._shared_version(), key))
+        self.local.delete(key)
+
+    def delete_many(self, keys):
+        version = self._shared_version()
+        self.shared.delete_many([self._key(version, key) for key in keys])
+        for key in keys:
+            self.local.delete(key)
+
+    def bump(self):
+        """Invalidate every key in the namespace"""
+        self.shared.set(self._version_key(), secrets.token_hex(4), timeout=None)
+        self.local.clear()
@@ -0,0 +1,134 @@
+"""
+Serialized database writes.
+
+SQLite allows one writer at a time. When request threads write directly,
+they queue on the file lock. A transaction that read before writing can
+also fail outright with "database is locked" if another writer committed
+in between. With ``SQLITE_SERIALIZE_WRITES`` on, write transactions are
+instead handed to ``writer``: a single thread with its own connection that
+runs them one after another. Reads stay on the request threads, which WAL
+lets proceed alongside the writer.
+
+Jobs that queue up while a transaction is running are committed together
+(up to ``SQLITE_WRITER_BATCH`` per commit), each inside its own savepoint,
+so one failing job doesn't roll back the others. A caller sees its result
+or exception only once the commit has succeeded. If another process holds
+the write lock past the busy timeout, the batch is retried up to
+``SQLITE_WRITER_RETRIES`` times; nothing has run at that point.
+
+With the setting off, ``run`` and ``arun`` simply call the function on the
+current thread, as before.
+"""
+
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+
+class _NotStarted(Exception):
+    pass
+
+
+class SerializedWriter:
+    """Single thread that runs every write transaction of this process"""
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.metrics = {'jobs': 0, 'commits': 0, 'failed_commits': 0}
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'SQLITE_SERIALIZE_WRITES', False)
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'SQLITE_WRITER_BATCH', 64)
+
+    def submit(self, func, *args, **kwargs):
+        """Queue ``func(*args, **kwargs)``; returns a Future settled after commit"""
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def run(self, func, *args, **kwargs):
+        if not self.enabled or threading.current_thread() is self._thread:
+            return func(*args, **kwargs)
+        return self.submit(func, *args, **kwargs).result()
+
+    async def arun(self, func, *args, **kwargs):
+        if not self.enabled:
+            return await sync_to_async(func)(*args, **kwargs)
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        connection.immediate_transactions = True
+        while True:
+            jobs = [self._queue.get()]
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(jobs)
+            connection.close_if_unusable_or_obsolete()
+
+    def _commit(self, jobs):
+        jobs = [job for job in jobs if job[0].set_running_or_notify_cancel()]
+        retries = getattr(settings, 'SQLITE_WRITER_RETRIES', 3)
+        for attempt in range(retries + 1):
+            try:
+                outcomes = self._transaction(jobs)
+                break
+            except _NotStarted as e:
+                # BEGIN IMMEDIATE gave up waiting for another process's writer; nothing ran yet.
+                if attempt == retries:
+                    return self._fail(jobs, e.__cause__)
+            except Exception as e:
+                return self._fail(jobs, e)
+
+        self.metrics['jobs'] += len(outcomes)
+        self.metrics['commits'] += 1
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _transaction(self, jobs):
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for future, func, args, kwargs in jobs:
+                    try:
+                        with transaction.atomic():
+                            outcomes.append((future, func(*args, **kwargs), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+        except OperationalError as e:
+            if not outcomes:
+                raise _NotStarted() from e
+            raise
+        return outcomes
+
+    def _fail(self, jobs, error):
+        self.metrics['failed_commits'] += 1
+        for future, *_ in jobs:
+            future.set_exception(error)
+
+
+writer = SerializedWriter()
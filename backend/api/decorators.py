@@ -0,0 +1,53 @@
+"""
+Async-aware versions of Django's view decorators.
+
+Django 4.2's ``csrf_exempt`` and ``require_http_methods`` wrap views in a
+plain function, which turns an ``async def`` view back into a sync one and
+forces a thread hop per request. These keep coroutine views coroutines.
+"""
+
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.http import HttpResponseNotAllowed
+from django.utils.log import log_response
+from django.views.decorators import csrf, http
+
+
+def csrf_exempt(view_func):
+    """Mark a view function as being exempt from the CSRF view protection."""
+    if not iscoroutinefunction(view_func):
+        return csrf.csrf_exempt(view_func)
+
+    @wraps(view_func)
+    async def wrapper_view(*args, **kwargs):
+        return await view_func(*args, **kwargs)
+
+    wrapper_view.csrf_exempt = True
+    return wrapper_view
+
+
+def require_http_methods(request_method_list):
+    """Decorator to make a view only accept particular request methods."""
+
+    def decorator(func):
+        if not iscoroutinefunction(func):
+            return http.require_http_methods(request_method_list)(func)
+
+        @wraps(func)
+        async def inner(request, *args, **kwargs):
+            if request.method not in request_method_list:
+                response = HttpResponseNotAllowed(request_method_list)
+                log_response(
+                    "Method Not Allowed (%s): %s",
+                    request.method,
+                    request.path,
+                    response=response,
+                    request=request,
+                )
+                return response
+            return await func(request, *args, **kwargs)
+
+        return inner
+
+    return decorator
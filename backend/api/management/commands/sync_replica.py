@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import replicas
+
+
+class Command(BaseCommand):
+    help = "Refresh the local stand-in read replica (DB_REPLICA) from the primary database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='replica', help="Replica alias to refresh")
+        parser.add_argument('--interval', type=float, default=None,
+                            help="Keep refreshing every N seconds (default: REPLICA_SYNC_INTERVAL)")
+        parser.add_argument('--once', action='store_true', help="Copy once and exit")
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in settings.DATABASES:
+            raise CommandError(f"No database '{alias}'; set DB_REPLICA to a file path to add the stand-in")
+        if 'sqlite3' not in settings.DATABASES[alias]['ENGINE']:
+            raise CommandError(f"Database '{alias}' is not SQLite; a real replica is kept in sync by its server")
+        interval = options['interval'] or getattr(settings, 'REPLICA_SYNC_INTERVAL', 2.0)
+
+        while True:
+            started = time.perf_counter()
+            try:
+                replicas.sync(alias)
+            except ValueError as e:
+                raise CommandError(str(e))
+            elapsed = time.perf_counter() - started
+            if options['verbosity'] > 1 or options['once']:
+                self.stdout.write(f"Copied the primary to '{alias}' in {elapsed * 1000:.0f}ms")
+            if options['once']:
+                return
+            time.sleep(max(interval - elapsed, 0))
@@ -0,0 +1,102 @@
+"""
+In-memory request metrics in Prometheus text format.
+
+Histograms are sharded per thread: each thread (or the event loop thread,
+for async views) only ever writes to its own bucket counts, so recording
+takes no lock. Shards are merged when the metrics are scraped.
+"""
+
+import threading
+from bisect import bisect_left
+
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+BYTES_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRICS = {
+    # name: (help, buckets)
+    'http_request_duration_seconds': ('Wall time per request', SECONDS_BUCKETS),
+    'http_request_db_seconds': ('Time spent in SQL per request', SECONDS_BUCKETS),
+    'http_request_queries': ('SQL queries per request', COUNT_BUCKETS),
+    'http_request_duplicate_queries': ('Queries per request repeating an earlier statement', COUNT_BUCKETS),
+    'http_response_size_bytes': ('Response body size', BYTES_BUCKETS),
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one shard of counts per writing thread"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._shards = []
+        self._local = threading.local()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            # [per-bucket counts (+Inf last), sum]; list.append is atomic.
+            shard = self._local.shard = [[0] * (len(self.buckets) + 1), 0.0]
+            self._shards.append(shard)
+        return shard
+
+    def observe(self, value):
+        shard = self._shard()
+        shard[0][bisect_left(self.buckets, value)] += 1
+        shard[1] += value
+
+    def snapshot(self):
+        """(cumulative bucket counts, sum, count) across all shards"""
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for shard in list(self._shards):
+            for index, count in enumerate(shard[0]):
+                counts[index] += count
+            total += shard[1]
+        cumulative, running = [], 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total, running
+
+
+class Registry:
+    def __init__(self):
+        # (metric name, endpoint) -> Histogram
+        self._histograms = {}
+
+    def histogram(self, name, endpoint):
+        key = (name, endpoint)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms.setdefault(key, Histogram(METRICS[name][1]))
+        return histogram
+
+    def observe(self, endpoint, **values):
+        for name, value in values.items():
+            if value is not None:
+                self.histogram(name, endpoint).observe(value)
+
+    def render(self):
+        """Prometheus text exposition of every histogram"""
+        lines = []
+        histograms = sorted(self._histograms.items())
+        for name, (help_text, buckets) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (metric, endpoint), histogram in histograms:
+                if metric != name:
+                    continue
+                cumulative, total, count = histogram.snapshot()
+                label = endpoint.replace('\\', '\\\\').replace('"', '\\"')
+                for bound, value in zip((*buckets, '+Inf'), cumulative):
+                    lines.append(f'{name}_bucket{{endpoint="{label}",le="{bound}"}} {value}')
+                lines.append(f'{name}_sum{{endpoint="{label}"}} {total}')
+                lines.append(f'{name}_count{{endpoint="{label}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        self._histograms = {}
+
+
+registry = Registry()
@@ -0,0 +1,122 @@
+"""
+Per-request performance instrumentation.
+
+``PerformanceMiddleware`` records wall time, SQL time, query count,
+duplicate queries and response size for every request, labelled with the
+resolved URL name (``game-list``, ``user-stats``, ``admin:games_gamesession_changelist``).
+A query counts as a duplicate when its SQL, ignoring parameters, already
+ran earlier in the same request, which is the signature of an N+1 loop.
+
+SQL is observed through an execute wrapper installed on every database
+connection. It reads the active request from a context variable, which
+``sync_to_async`` carries into the ORM's worker thread, so async views are
+measured the same way as sync ones. With ``PERF_SERVER_TIMING = True`` the
+figures are also returned in a ``Server-Timing`` header.
+"""
+
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .metrics import registry
+
+
+_current = ContextVar('perf_request', default=None)
+
+
+class RequestProfile:
+    __slots__ = ('queries', 'db_time', 'statements', 'duplicates')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = set()
+        self.duplicates = 0
+
+    def record(self, sql, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        if sql in self.statements:
+            self.duplicates += 1
+        else:
+            self.statements.add(sql)
+
+
+def _profile_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.record(sql, time.perf_counter() - started)
+
+
+def install_query_profiler(connection, **kwargs):
+    if _profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_profile_query)
+
+
+connection_created.connect(install_query_profiler, dispatch_uid='api.perf.install_query_profiler')
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'PERF_SERVER_TIMING', False)
+        for connection in connections.all(initialized_only=True):
+            install_query_profiler(connection)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile, time.perf_counter() - started)
+
+    def finish(self, request, response, profile, elapsed):
+        match = request.resolver_match
+        endpoint = (match.view_name if match else None) or '<unresolved>'
+        size = None
+        if not response.streaming:
+            size = len(response.content)
+        registry.observe(
+            endpoint,
+            http_request_duration_seconds=elapsed,
+            http_request_db_seconds=profile.db_time,
+            http_request_queries=profile.queries,
+            http_request_duplicate_queries=profile.duplicates,
+            http_response_size_bytes=size,
+        )
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'app;dur={elapsed * 1000:.1f}, '
+                f'db;dur={profile.db_time * 1000:.1f};desc="{profile.queries} queries, '
+                f'{profile.duplicates} duplicate"'
+            )
+        return response
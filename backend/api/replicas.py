@@ -0,0 +1,142 @@
+"""
+Read-replica routing.
+
+Views wrapped in ``read_replica`` run their queries against one of the
+``REPLICA_DATABASES`` aliases; every other query, and every write, goes to
+``default`` (``ReplicaRouter``). Inside such a view, ``primary()`` sends a
+block back to ``default`` for reads that must not lag, such as loading
+state that is later written back.
+
+A replica trails the primary, so a player who has just written is pinned to
+the primary for ``REPLICA_PIN_SECONDS`` (``pin``), which covers the
+submission flush plus the replica's lag. They always see their own writes;
+everyone else may read a few seconds behind. Pins live in the ``shared``
+cache, so they hold whichever worker process serves the next request.
+
+Without a real replica, ``DB_REPLICA`` adds a local stand-in: a second
+SQLite file that ``sync`` (run by ``manage.py sync_replica``) refreshes from
+the primary with SQLite's online backup API.
+"""
+
+import random
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+
+_read_alias = ContextVar('replica_read_alias', default=None)
+
+
+def aliases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def _pin_key(user_id):
+    return f'replica:pin:{user_id}'
+
+
+def _shared():
+    return caches[getattr(settings, 'CACHE_SHARED_ALIAS', 'shared')]
+
+
+def pin(user_id):
+    """Send ``user_id``'s replica reads to the primary for ``REPLICA_PIN_SECONDS``"""
+    if aliases():
+        _shared().set(_pin_key(user_id), 1, timeout=getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+
+def pinned(user_id):
+    return user_id is not None and _shared().get(_pin_key(user_id)) is not None
+
+
+def choose(user_id=None):
+    """Replica alias for a reader, or None when they should read the primary"""
+    replicas = aliases()
+    if not replicas or pinned(user_id):
+        return None
+    return random.choice(replicas)
+
+
+@contextmanager
+def reading_from(alias):
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
+
+
+def primary():
+    """Route the reads of a block to the primary, even inside a ``read_replica`` view"""
+    return reading_from(None)
+
+
+def _resolve_user_id(request):
+    # Resolved before routing starts: the session and user lookups stay on the primary,
+    # so a player who has just registered or logged in is never read as anonymous.
+    user = request.user
+    return user.pk if user.is_authenticated else None
+
+
+def read_replica(view_func):
+    """Serve the view's reads from a replica unless the requesting user is pinned"""
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_view(request, *args, **kwargs):
+            alias = choose(await sync_to_async(_resolve_user_id)(request)) if aliases() else None
+            with reading_from(alias):
+                return await view_func(request, *args, **kwargs)
+
+        return async_view
+
+    @wraps(view_func)
+    def view(request, *args, **kwargs):
+        alias = choose(_resolve_user_id(request)) if aliases() else None
+        with reading_from(alias):
+            return view_func(request, *args, **kwargs)
+
+    return view
+
+
+class ReplicaRouter:
+    """Reads inside ``read_replica`` go to its replica; all writes go to the primary"""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema with the data.
+        return False if db in aliases() else None
+
+
+def sync(alias='replica'):
+    """Copy the primary into a local SQLite stand-in replica"""
+    primary_name = str(settings.DATABASES[DEFAULT_DB_ALIAS]['NAME'])
+    replica_name = str(settings.DATABASES[alias]['NAME'])
+    if primary_name == replica_name:
+        raise ValueError(f"Database '{alias}' is the primary file itself")
+    timeout = getattr(settings, 'SQLITE_PRAGMAS', {}).get('busy_timeout', 5000) / 1000
+    source = sqlite3.connect(primary_name, timeout=timeout)
+    target = sqlite3.connect(replica_name, timeout=timeout)
+    try:
+        # One step: the copy is a consistent snapshot, and replica readers wait on the
+        # busy timeout while it is written instead of seeing a half-copied file.
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
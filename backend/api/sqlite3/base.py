@@ -0,0 +1,34 @@
+"""
+SQLite backend for the production database profile.
+
+The stock backend plus two things:
+
+* every new connection runs the ``SQLITE_PRAGMAS`` from settings (WAL
+  journal, ``synchronous=NORMAL``, memory-mapped reads, busy timeout) from a
+  ``connection_created`` hook;
+* connections flagged ``immediate_transactions`` open their transactions with
+  ``BEGIN IMMEDIATE``. The serialized writer (``api.db.writer``) sets it, so
+  its transactions take the write lock up front and wait out the busy
+  timeout, instead of failing with "database is locked" when a read
+  snapshot cannot be upgraded to a write.
+"""
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    immediate_transactions = False
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.immediate_transactions else 'BEGIN')
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+connection_created.connect(apply_pragmas, sender=DatabaseWrapper, dispatch_uid='api.sqlite3.apply_pragmas')
@@ -0,0 +1,372 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import Future
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.models import AnonymousUser
+from django.db import OperationalError, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from games.models import Game
+from users.models import User
+
+from .db import SerializedWriter, _NotStarted
+from .decorators import csrf_exempt, require_http_methods
+from . import replicas
+from .metrics import Histogram, Registry, registry
+from .middleware import PerformanceMiddleware
+from .sqlite3.base import DatabaseWrapper
+
+
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'api-tests-shared'},
+}
+
+
+def _game(title):
+    return Game.objects.create(title=title, description='', game_type='quiz', difficulty='easy').title
+
+
+def _fail(message):
+    raise ValueError(message)
+
+
+# Saving a Game invalidates the catalogue in the shared cache.
+@override_settings(CACHES=LOCAL_CACHES)
+class SerializedWriterTests(TestCase):
+    def _jobs(self, *calls):
+        return [(Future(), func, args, {}) for func, *args in calls]
+
+    def test_a_failing_job_does_not_roll_back_the_batch(self):
+        writer = SerializedWriter()
+        jobs = self._jobs((_game, 'first'), (_fail, 'bad row'), (_game, 'second'))
+        writer._commit(jobs)
+
+        self.assertEqual([jobs[0][0].result(), jobs[2][0].result()], ['first', 'second'])
+        with self.assertRaisesMessage(ValueError, 'bad row'):
+            jobs[1][0].result()
+        self.assertEqual(sorted(Game.objects.values_list('title', flat=True)), ['first', 'second'])
+        self.assertEqual(writer.metrics, {'jobs': 3, 'commits': 1, 'failed_commits': 0})
+
+    @override_settings(SQLITE_WRITER_RETRIES=2)
+    def test_a_locked_database_is_retried_before_anything_runs(self):
+        writer = SerializedWriter()
+        attempts = []
+
+        def locked(jobs):
+            attempts.append(len(jobs))
+            raise _NotStarted() from OperationalError('database is locked')
+
+        jobs = self._jobs((_game, 'never'))
+        with mock.patch.object(writer, '_transaction', side_effect=locked):
+            writer._commit(jobs)
+        self.assertEqual(attempts, [1, 1, 1])
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            jobs[0][0].result()
+        self.assertEqual(writer.metrics['failed_commits'], 1)
+
+        real, attempts = writer._transaction, []
+
+        def locked_once(jobs):
+            attempts.append(len(jobs))
+            if len(attempts) == 1:
+                raise _NotStarted() from OperationalError('database is locked')
+            return real(jobs)
+
+        jobs = self._jobs((_game, 'eventually'))
+        with mock.patch.object(writer, '_transaction', side_effect=locked_once):
+            writer._commit(jobs)
+        self.assertEqual(jobs[0][0].result(), 'eventually')
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class SerializedWriterThreadTests(TransactionTestCase):
+    def test_jobs_run_on_the_writer_thread(self):
+        writer = SerializedWriter()
+        with override_settings(SQLITE_SERIALIZE_WRITES=False):
+            self.assertIs(writer.run(threading.current_thread), threading.current_thread())
+        with override_settings(SQLITE_SERIALIZE_WRITES=True):
+            self.assertEqual(writer.run(threading.current_thread).name, 'db-writer')
+            self.assertEqual(async_to_sync(writer.arun)(_game, 'from async'), 'from async')
+            # Nested calls from a job run inline instead of waiting on their own thread.
+            self.assertEqual(writer.run(writer.run, _game, 'nested'), 'nested')
+        self.assertEqual(sorted(Game.objects.values_list('title', flat=True)), ['from async', 'nested'])
+
+
+class ProductionBackendTests(SimpleTestCase):
+    alias = 'sqlite3-production-test'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+        self.connection = DatabaseWrapper(
+            {**connections['default'].settings_dict, 'ENGINE': 'api.sqlite3', 'NAME': self.path}, self.alias
+        )
+        connections[self.alias] = self.connection
+        self.addCleanup(self._close)
+
+    def _close(self):
+        self.connection.close()
+        del connections[self.alias]
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'WAL', 'busy_timeout': 1234, 'synchronous': 'NORMAL'})
+    def test_new_connections_apply_the_pragmas(self):
+        with self.connection.cursor() as cursor:
+            values = []
+            for name in ('journal_mode', 'busy_timeout', 'synchronous'):
+                cursor.execute(f'PRAGMA {name}')
+                values.append(cursor.fetchone()[0])
+        self.assertEqual(values, ['wal', 1234, 1])
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'WAL'})
+    def test_immediate_transactions_take_the_write_lock_up_front(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (value INTEGER)')
+        other = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+
+        def other_can_write():
+            try:
+                other.execute('BEGIN IMMEDIATE')
+            except sqlite3.OperationalError:
+                return False
+            other.execute('ROLLBACK')
+            return True
+
+        with transaction.atomic(using=self.alias):
+            # A deferred BEGIN takes no lock until the first write.
+            self.assertTrue(other_can_write())
+        self.connection.immediate_transactions = True
+        with transaction.atomic(using=self.alias):
+            self.assertFalse(other_can_write())
+        self.assertTrue(other_can_write())
+
+
+@replicas.read_replica
+def _routed(request):
+    with replicas.primary():
+        pinned_read = Game.objects.all().db
+    return Game.objects.all().db, pinned_read, replicas.ReplicaRouter().db_for_write(Game)
+
+
+@override_settings(CACHES=LOCAL_CACHES, REPLICA_DATABASES=['replica'], REPLICA_PIN_SECONDS=60)
+class ReplicaRoutingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'replica-{n}', email=f'replica-{n}@example.com', password=None)
+            for n in range(2)
+        ]
+
+    def setUp(self):
+        replicas._shared().clear()
+
+    def _request(self, user=None):
+        request = RequestFactory().get('/')
+        request.user = user or AnonymousUser()
+        return request
+
+    def test_reads_go_to_the_replica_and_writes_to_the_primary(self):
+        self.assertEqual(_routed(self._request()), ('replica', 'default', 'default'))
+        self.assertEqual(_routed(self._request(self.users[0])), ('replica', 'default', 'default'))
+        # Outside a read_replica view everything reads the primary.
+        self.assertEqual(Game.objects.all().db, 'default')
+
+    def test_async_views_are_routed(self):
+        @replicas.read_replica
+        async def view(request):
+            return Game.objects.all().db
+
+        self.assertTrue(iscoroutinefunction(view))
+        self.assertEqual(async_to_sync(view)(self._request(self.users[0])), 'replica')
+
+    def test_a_writer_is_pinned_to_the_primary(self):
+        replicas.pin(self.users[0].pk)
+        self.assertEqual(_routed(self._request(self.users[0]))[0], 'default')
+        self.assertEqual(_routed(self._request(self.users[1]))[0], 'replica')
+
+    def test_submitting_pins_the_player(self):
+        game = Game.objects.create(title='replica game', description='', game_type='quiz', difficulty='easy')
+        self.client.force_login(self.users[0])
+        with mock.patch('games.views.submission_buffer._ensure_flusher'), \
+                mock.patch('games.views.session_sweeper.ensure_running'), \
+                mock.patch('games.views.submission_buffer._queue', []):
+            response = self.client.post(reverse('game-submit', args=[game.id]), {'score': 10},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(replicas.pinned(self.users[0].pk))
+        self.assertFalse(replicas.pinned(self.users[1].pk))
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_without_replicas_nothing_is_routed_or_pinned(self):
+        replicas.pin(self.users[0].pk)
+        self.assertFalse(replicas.pinned(self.users[0].pk))
+        self.assertEqual(_routed(self._request(self.users[1]))[0], 'default')
+
+    def test_replicas_are_never_migrated(self):
+        router = replicas.ReplicaRouter()
+        self.assertIs(router.allow_migrate('replica', 'games'), False)
+        self.assertIsNone(router.allow_migrate('default', 'games'))
+
+
+class ReplicaSyncTests(SimpleTestCase):
+    def test_sync_copies_the_primary(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        primary_path, replica_path = (os.path.join(directory.name, name) for name in ('primary.db', 'replica.db'))
+        source = sqlite3.connect(primary_path)
+        source.execute('CREATE TABLE score (value INTEGER)')
+        source.execute('INSERT INTO score VALUES (42)')
+        source.commit()
+        source.close()
+
+        # Only the file names are read; overriding DATABASES itself would reconfigure the test connections.
+        databases = {'default': {'NAME': primary_path}, 'replica': {'NAME': replica_path}}
+        with mock.patch('api.replicas.settings', SimpleNamespace(DATABASES=databases)):
+            replicas.sync('replica')
+        copy = sqlite3.connect(replica_path)
+        self.addCleanup(copy.close)
+        self.assertEqual(copy.execute('SELECT value FROM score').fetchall(), [(42,)])
+
+        databases['replica']['NAME'] = primary_path
+        with mock.patch('api.replicas.settings', SimpleNamespace(DATABASES=databases)), \
+                self.assertRaises(ValueError):
+            replicas.sync('replica')
+
+
+class DecoratorTests(SimpleTestCase):
+    def test_async_views_stay_coroutines(self):
+        @csrf_exempt
+        @require_http_methods(['POST'])
+        async def view(request):
+            return HttpResponse(b'ok')
+
+        self.assertTrue(iscoroutinefunction(view))
+        self.assertTrue(view.csrf_exempt)
+        self.assertEqual(async_to_sync(view)(RequestFactory().post('/')).content, b'ok')
+        with self.assertLogs('django.request', 'WARNING'):
+            refused = async_to_sync(view)(RequestFactory().get('/'))
+        self.assertEqual((refused.status_code, refused['Allow']), (405, 'POST'))
+
+    def test_sync_views_use_django_decorators(self):
+        @csrf_exempt
+        @require_http_methods(['GET'])
+        def view(request):
+            return HttpResponse(b'ok')
+
+        self.assertFalse(iscoroutinefunction(view))
+        self.assertTrue(view.csrf_exempt)
+        self.assertEqual(view(RequestFactory().get('/')).content, b'ok')
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(view(RequestFactory().post('/')).status_code, 405)
+
+
+class HistogramTests(SimpleTestCase):
+    def test_threads_write_their_own_shards(self):
+        histogram = Histogram((1, 10))
+        barrier = threading.Barrier(4)
+
+        def observe():
+            barrier.wait()
+            for value in (0.5, 5, 50):
+                histogram.observe(value)
+
+        threads = [threading.Thread(target=observe) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(histogram._shards), 4)
+        self.assertEqual(histogram.snapshot(), ([4, 8, 12], 4 * 55.5, 12))
+
+    def test_bounds_are_inclusive(self):
+        histogram = Histogram((1, 10))
+        histogram.observe(1)
+        histogram.observe(10)
+        self.assertEqual(histogram.snapshot()[0], [1, 2, 2])
+
+    def test_prometheus_output(self):
+        metrics = Registry()
+        metrics.observe('game-list', http_request_queries=3, http_response_size_bytes=None)
+        metrics.observe('say "hi"', http_request_queries=0)
+        lines = metrics.render().splitlines()
+
+        self.assertIn('# TYPE http_request_queries histogram', lines)
+        self.assertIn('http_request_queries_bucket{endpoint="game-list",le="2"} 0', lines)
+        self.assertIn('http_request_queries_bucket{endpoint="game-list",le="3"} 1', lines)
+        self.assertIn('http_request_queries_bucket{endpoint="game-list",le="+Inf"} 1', lines)
+        self.assertIn('http_request_queries_sum{endpoint="game-list"} 3.0', lines)
+        self.assertIn('http_request_queries_count{endpoint="game-list"} 1', lines)
+        self.assertIn('http_request_queries_count{endpoint="say \\"hi\\""} 1', lines)
+        # A missing value records nothing.
+        self.assertFalse([line for line in lines if line.startswith('http_response_size_bytes_')])
+
+
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        registry.clear()
+        self.addCleanup(registry.clear)
+
+    def _queries(self, request):
+        with connection.cursor() as cursor:
+            for value in (1, 2, 3):
+                cursor.execute('SELECT %s', [value])
+            cursor.execute('SELECT 1 + 1')
+        return HttpResponse(b'four')
+
+    def test_profiles_queries_and_duplicates(self):
+        middleware = PerformanceMiddleware(self._queries)
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        middleware(request)
+
+        # (sum, count) of each histogram: two of the four statements repeat 'SELECT %s'.
+        for name, expected in [('http_request_queries', (4.0, 1)), ('http_request_duplicate_queries', (2.0, 1)),
+                               ('http_response_size_bytes', (4.0, 1))]:
+            with self.subTest(name):
+                self.assertEqual(registry.histogram(name, '<unresolved>').snapshot()[1:], expected)
+
+    @override_settings(PERF_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('api-info'))
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="0 queries, 0 duplicate"$')
+        self.assertEqual(registry.histogram('http_request_duration_seconds', 'api-info').snapshot()[2], 1)
+
+    @override_settings(PERF_SERVER_TIMING=False)
+    def test_server_timing_is_opt_in(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('api-info')))
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class MetricsViewTests(TestCase):
+    def test_anonymous_requests_are_refused(self):
+        # Behind a proxy every request arrives from 127.0.0.1.
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+    def test_wrong_token_is_refused(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+
+    def test_token_or_staff_can_scrape(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE http_request_duration_seconds histogram', response.content)
+
+        staff = User.objects.create_user(username='metrics-staff', email='metrics-staff@example.com',
+                                         password=None, is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_no_token_configured(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, 403)
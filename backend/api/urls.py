@@ -4,4 +4,5 @@ from . import views
 urlpatterns = [
     path('health/', views.health_check, name='health-check'),
     path('info/', views.api_info, name='api-info'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
@@ -1,8 +1,13 @@
-from django.http import JsonResponse
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
+from .metrics import registry
+
 
-def health_check(request):
+async def health_check(request):
     """Health check endpoint"""
     return JsonResponse({
         'status': 'healthy',
@@ -19,3 +24,19 @@ def api_info(request):
         'description': 'Backend API for the Sparkle gaming platform',
         'message': 'Basic Django backend is running. Install djangorestframework for full API functionality.'
     })
+
+
+def _has_metrics_token(request):
+    expected = getattr(settings, 'METRICS_TOKEN', None)
+    if not expected:
+        return False
+    scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.encode(), expected.encode())
+
+
+def metrics_view(request):
+    """Per-endpoint request metrics in Prometheus text format (staff or METRICS_TOKEN)"""
+    # Not by address: behind a proxy every request comes from 127.0.0.1.
+    if not (request.user.is_staff or _has_metrics_token(request)):
+        return JsonResponse({'error': 'Not allowed'}, status=403)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,234 @@
+"""
+Rule-indexed achievement evaluation.
+
+Active achievements are indexed by ``achievement_type`` into sorted
+threshold lists, so a completed session only bisects to the achievements
+it could newly unlock instead of looping over every rule:
+
+* ``score``      - a single session scoring at least ``requirement_value``
+* ``completion`` - at least ``requirement_value`` completed sessions
+* ``streak``     - playing on ``requirement_value`` consecutive days
+* ``time``       - completing a session within ``requirement_value`` seconds
+
+Awards are written with ``bulk_create(ignore_conflicts=True)`` so the
+``unique_together`` on ``UserAchievement`` absorbs duplicates.
+
+The rules live in the ``achievements`` namespace of the shared cache, whose
+version ``Achievement`` saves bump, so an edit made in one worker process
+reaches every other one within ``CACHE_LOCAL_TTL`` seconds.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+import numpy as np
+from django.db.models.functions import TruncDate
+
+from api.cache import TieredCache
+from api.replicas import primary
+
+from . import archive
+from .models import Achievement, GameSession, UserAchievement, UserStats
+
+
+class AchievementIndex:
+    """Sorted (requirement_value, achievement_id) lists per achievement type"""
+
+    def __init__(self, achievements):
+        rules = defaultdict(list)
+        for achievement_id, achievement_type, requirement in achievements:
+            rules[achievement_type].append((requirement, achievement_id))
+        self.thresholds = {}
+        self.ids = {}
+        for achievement_type, pairs in rules.items():
+            pairs.sort()
+            self.thresholds[achievement_type] = [requirement for requirement, _ in pairs]
+            self.ids[achievement_type] = [achievement_id for _, achievement_id in pairs]
+
+    def reached(self, achievement_type, value, previous=None):
+        """Ids with ``previous < requirement <= value``"""
+        thresholds = self.thresholds.get(achievement_type)
+        if not thresholds or value is None:
+            return []
+        low = bisect_right(thresholds, previous) if previous is not None else 0
+        return self.ids[achievement_type][low:bisect_right(thresholds, value)]
+
+    def within(self, achievement_type, value):
+        """Ids whose requirement is an upper bound that ``value`` satisfies"""
+        thresholds = self.thresholds.get(achievement_type)
+        if not thresholds or value is None:
+            return []
+        return self.ids[achievement_type][bisect_left(thresholds, value):]
+
+
+rules = TieredCache('achievements', timeout=None)
+# (cache version, AchievementIndex) built in this process
+_index = (None, None)
+_index_lock = threading.Lock()
+
+
+def _active_rules():
+    # A lagging replica would cache the pre-edit rules under the version the edit just bumped.
+    with primary():
+        return list(
+            Achievement.objects.filter(is_active=True).values_list('id', 'achievement_type', 'requirement_value')
+        )
+
+
+def get_index():
+    global _index
+    version = rules.version()
+    if _index[0] != version:
+        with _index_lock:
+            if _index[0] != version:
+                _index = (version, AchievementIndex(rules.get_or_set('active', _active_rules)))
+    return _index[1]
+
+
+def invalidate_index():
+    rules.bump()
+
+
+def candidates_for_session(session, stats, index=None):
+    """Achievement ids this completed session could newly unlock"""
+    index = index or get_index()
+    ids = []
+    # Counters only ever grow by one per session, so only thresholds crossed by this step qualify.
+    ids += index.reached('completion', stats.total_games, stats.total_games - 1)
+    ids += index.reached('streak', stats.current_streak, stats.current_streak - 1)
+    # A score below the user's best cannot unlock anything the best did not.
+    if session.score >= stats.best_score:
+        ids += index.reached('score', session.score)
+    ids += index.within('time', session.duration)
+    return ids
+
+
+def award(pairs, batch_size=1000):
+    """Insert (user_id, achievement_id) pairs, skipping ones already earned"""
+    UserAchievement.objects.bulk_create(
+        [UserAchievement(user_id=user_id, achievement_id=achievement_id) for user_id, achievement_id in pairs],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+
+
+def evaluate_session(session):
+    stats = UserStats.objects.filter(pk=session.user_id).first()
+    if stats is None:
+        return []
+    ids = candidates_for_session(session, stats)
+    if ids:
+        award([(session.user_id, achievement_id) for achievement_id in ids])
+    return ids
+
+
+class _UserMetrics:
+    """Running achievement metrics over one user's sessions"""
+
+    def __init__(self):
+        self.completion = 0
+        self.score = None
+        self.time = None
+        self.days = set()
+
+    def add(self, score, duration, played_on, count=1):
+        self.completion += count
+        if self.score is None or score > self.score:
+            self.score = score
+        if duration is not None and (self.time is None or duration < self.time):
+            self.time = duration
+        if played_on is not None:
+            self.days.add(played_on)
+
+    @property
+    def streak(self):
+        longest = run = 0
+        previous = None
+        for day in sorted(self.days):
+            run = run + 1 if previous is not None and (day - previous).days == 1 else 1
+            longest = max(longest, run)
+            previous = day
+        return longest
+
+    def achievement_ids(self, index):
+        return (
+            index.reached('completion', self.completion)
+            + index.reached('streak', self.streak)
+            + index.reached('score', self.score)
+            + index.within('time', self.time)
+        )
+
+
+def _archived_metrics(user_ids=None):
+    """``{user_id: _UserMetrics}`` over archived completed sessions"""
+    metrics, quarters = {}, []
+    for batch in archive.completed(user_ids):
+        order = np.argsort(batch['user_id'], kind='stable')
+        users = batch['user_id'][order]
+        scores = batch['score'][order].astype(np.int64)
+        durations = batch['duration'][order].astype(np.int64)
+        timed = durations != archive.NO_DURATION
+        starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+        groups = zip(
+            users[starts].tolist(), np.diff(np.r_[starts, len(users)]).tolist(),
+            np.maximum.reduceat(scores, starts).tolist(),
+            np.minimum.reduceat(np.where(timed, durations, np.iinfo(np.int64).max), starts).tolist(),
+            np.logical_or.reduceat(timed, starts).tolist(),
+        )
+        for user_id, count, best, fastest, any_timed in groups:
+            metrics.setdefault(user_id, _UserMetrics()).add(best, fastest if any_timed else None, None, count)
+        quarters.append(archive.quarter_hours(batch))
+    for user_id, played_on in archive.play_days(quarters):
+        metrics[user_id].days.add(played_on)
+    return metrics
+
+
+def backfill(chunk_size=5000, user_ids=None, index=None):
+    """
+    Award achievements retroactively by streaming completed sessions.
+
+    Live sessions are read in user order with ``iterator()`` and folded into
+    running metrics on top of the user's archived sessions (``games.archive``),
+    so memory stays bounded by ``chunk_size`` plus a summary per archived user.
+    Returns the number of (user, achievement) pairs submitted.
+    """
+    index = index or get_index()
+    archived = _archived_metrics(user_ids)
+    sessions = GameSession.objects.filter(status='completed')
+    if user_ids:
+        sessions = sessions.filter(user_id__in=user_ids)
+    rows = (
+        sessions.annotate(played_on=TruncDate('end_time'))
+        .order_by('user_id', 'end_time', 'id')
+        .values_list('user_id', 'score', 'duration', 'played_on')
+        .iterator(chunk_size=chunk_size)
+    )
+
+    pending, submitted = [], 0
+
+    def finish(user_id, metrics):
+        nonlocal pending, submitted
+        pending.extend((user_id, achievement_id) for achievement_id in metrics.achievement_ids(index))
+        if len(pending) >= chunk_size:
+            award(pending, chunk_size)
+            submitted += len(pending)
+            pending = []
+
+    current_user, metrics = None, None
+    for user_id, score, duration, played_on in rows:
+        if user_id != current_user:
+            if current_user is not None:
+                finish(current_user, metrics)
+            current_user, metrics = user_id, archived.pop(user_id, None) or _UserMetrics()
+        metrics.add(score, duration, played_on)
+
+    if current_user is not None:
+        finish(current_user, metrics)
+    # Users whose every completed session is archived.
+    for user_id, metrics in archived.items():
+        finish(user_id, metrics)
+    if pending:
+        award(pending, chunk_size)
+        submitted += len(pending)
+    return submitted
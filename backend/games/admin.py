@@ -1,5 +1,29 @@
 from django.contrib import admin
-from .models import Game, GameSession, Achievement, UserAchievement, Leaderboard
+from django.contrib.admin.views.main import ChangeList
+from django.db.models import F
+from django.utils import timezone
+from .models import Game, GameSession, Achievement, UserAchievement, Leaderboard, UserStats, UserGameStats, ScoreEvent, Question, ScoreBaseline, SessionFlag
+
+
+class ProjectedChangeList(ChangeList):
+    """Changelist that only loads the admin's ``list_only`` columns"""
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return queryset.only(*self.model_admin.list_only)
+
+
+class ProjectedListMixin:
+    """
+    Keep changelists at a constant number of queries: relations shown in
+    ``list_display`` come from ``list_select_related`` joins, and ``list_only``
+    limits the loaded columns (change views still load whole rows).
+    """
+
+    list_only = ()
+
+    def get_changelist(self, request, **kwargs):
+        return ProjectedChangeList if self.list_only else super().get_changelist(request, **kwargs)
 
 
 @admin.register(Game)
@@ -10,10 +34,48 @@ class GameAdmin(admin.ModelAdmin):
     ordering = ('title',)
 
 
+@admin.register(Question)
+class QuestionAdmin(ProjectedListMixin, admin.ModelAdmin):
+    list_display = ('question_text', 'game', 'difficulty', 'correct_answer', 'is_active')
+    list_select_related = ('game',)
+    list_only = ('question_text', 'game', 'difficulty', 'correct_answer', 'is_active', 'game__title')
+    list_filter = ('difficulty', 'is_active', 'game')
+    search_fields = ('question_text',)
+
+
+def sessions_of_game_type(sessions, game_type):
+    """
+    Sessions of games of one type, for pages in start_time order.
+
+    Joining on ``game__game_type`` makes SQLite fetch each game's sessions
+    through session_game_start_idx and sort them all. ``game_id + 0`` cannot
+    use that index, so the page is read along session_start_time_idx instead
+    and stops as soon as it is full.
+    """
+    return sessions.alias(game_key=F('game_id') + 0).filter(
+        game_key__in=Game.objects.filter(game_type=game_type).values('id')
+    )
+
+
+class GameTypeListFilter(admin.SimpleListFilter):
+    title = 'game type'
+    parameter_name = 'game_type'
+
+    def lookups(self, request, model_admin):
+        return Game.GAME_TYPES
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return sessions_of_game_type(queryset, self.value())
+        return queryset
+
+
 @admin.register(GameSession)
-class GameSessionAdmin(admin.ModelAdmin):
+class GameSessionAdmin(ProjectedListMixin, admin.ModelAdmin):
     list_display = ('user', 'game', 'score', 'status', 'start_time', 'duration')
-    list_filter = ('status', 'game__game_type', 'start_time')
+    list_select_related = ('user', 'game')
+    list_only = ('user', 'game', 'score', 'status', 'start_time', 'duration', 'user__username', 'game__title')
+    list_filter = ('status', GameTypeListFilter, 'start_time')
     search_fields = ('user__username', 'game__title')
     ordering = ('-start_time',)
 
@@ -26,15 +88,87 @@ class AchievementAdmin(admin.ModelAdmin):
 
 
 @admin.register(UserAchievement)
-class UserAchievementAdmin(admin.ModelAdmin):
+class UserAchievementAdmin(ProjectedListMixin, admin.ModelAdmin):
     list_display = ('user', 'achievement', 'earned_at')
+    list_select_related = ('user', 'achievement')
+    list_only = ('user', 'achievement', 'earned_at', 'user__username', 'achievement__name')
     list_filter = ('achievement__achievement_type', 'earned_at')
     search_fields = ('user__username', 'achievement__name')
 
 
 @admin.register(Leaderboard)
-class LeaderboardAdmin(admin.ModelAdmin):
+class LeaderboardAdmin(ProjectedListMixin, admin.ModelAdmin):
     list_display = ('user', 'game', 'period', 'total_score', 'rank', 'period_start')
+    list_select_related = ('user', 'game')
+    list_only = ('user', 'game', 'period', 'total_score', 'rank', 'period_start', 'user__username', 'game__title')
     list_filter = ('period', 'game')
     search_fields = ('user__username', 'game__title')
     ordering = ('period', 'rank')
+
+
+@admin.register(UserStats)
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'total_games', 'total_score', 'best_score', 'updated_at')
+    list_select_related = ('user',)
+    search_fields = ('user__username',)
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(UserGameStats)
+class UserGameStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'game', 'total_games', 'total_score', 'best_score')
+    list_select_related = ('user', 'game')
+    list_filter = ('game',)
+    search_fields = ('user__username', 'game__title')
+
+
+@admin.register(ScoreEvent)
+class ScoreEventAdmin(ProjectedListMixin, admin.ModelAdmin):
+    list_display = ('user', 'game', 'kind', 'score', 'experience', 'occurred_at')
+    list_filter = ('kind',)
+    search_fields = ('user__username', 'game__title')
+    ordering = ('-occurred_at',)
+    list_select_related = ('user', 'game')
+    list_only = ('user', 'game', 'kind', 'score', 'experience', 'occurred_at', 'user__username', 'game__title')
+
+    # The log is append-only; corrections are new adjustment events.
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ScoreBaseline)
+class ScoreBaselineAdmin(admin.ModelAdmin):
+    list_display = ('game', 'sessions', 'score_median', 'score_mad', 'score_ceiling', 'rate_median', 'rate_ceiling',
+                    'computed_at')
+    list_select_related = ('game',)
+    search_fields = ('game__title',)
+
+    # Baselines are recomputed by flag_anomalies, not edited.
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SessionFlag)
+class SessionFlagAdmin(ProjectedListMixin, admin.ModelAdmin):
+    list_display = ('session_id', 'user', 'game', 'reason', 'source', 'score', 'duration', 'value', 'threshold',
+                    'status', 'flagged_at')
+    list_select_related = ('user', 'game')
+    list_only = ('session_id', 'user', 'game', 'reason', 'source', 'score', 'duration', 'value', 'threshold',
+                 'status', 'flagged_at', 'user__username', 'game__title')
+    list_filter = ('status', 'reason', 'source', 'game')
+    search_fields = ('user__username', 'game__title')
+    ordering = ('-flagged_at',)
+    readonly_fields = ('session', 'user', 'game', 'reason', 'source', 'score', 'duration', 'value', 'threshold',
+                       'flagged_at', 'reviewed_at')
+    actions = ['confirm', 'dismiss']
+
+    @admin.action(description="Confirm selected flags as cheating")
+    def confirm(self, request, queryset):
+        queryset.update(status='confirmed', reviewed_at=timezone.now())
+
+    @admin.action(description="Dismiss selected flags")
+    def dismiss(self, request, queryset):
+        queryset.update(status='dismissed', reviewed_at=timezone.now())
@@ -0,0 +1,294 @@
+"""
+Anomaly detection over completed sessions.
+
+Any client can claim any score, so completed sessions are checked against
+per-game robust statistics:
+
+* score: the median and the median absolute deviation (MAD). A session is
+  flagged above ``median + ANTICHEAT_SCORE_Z * 1.4826 * MAD`` (1.4826 scales
+  the MAD to a standard deviation for normal data), and always above the
+  game's ``max_score``.
+* points per second: the same on ``log10(score / duration)``, so the ceiling
+  is a multiple of the median rate rather than an offset from it.
+
+``scan`` makes two passes over ``GameSession`` in primary-key ranges. Each
+chunk is loaded into NumPy arrays; the first pass adds it into fixed-size
+per-game histograms (``HISTOGRAM_BINS`` bins over ``[0, max_score]`` for
+scores and over ``RATE_RANGE`` decades for rates), from which the medians
+and MADs are read off, and the second pass flags a whole chunk with one
+vectorized comparison and one bulk insert. Memory depends on the chunk size
+and the number of games, not on the number of sessions, at the cost of
+quantiles accurate to one bin (1/4096 of ``max_score``, about 0.5% of a
+rate).
+
+The resulting ceilings are stored as ``ScoreBaseline`` rows and cached per
+process in the ``anticheat`` namespace of the shared cache, so ``check``
+flags a new submission with one dictionary lookup and two comparisons.
+Flags are ``SessionFlag`` rows, reviewed from the admin.
+"""
+
+import math
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Max, Min, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from api.cache import TieredCache
+from api.replicas import primary
+
+from .models import Game, GameSession, ScoreBaseline, SessionFlag
+
+
+HISTOGRAM_BINS = 4096
+# log10 of points per second: from one point in ~17 minutes to a million a second.
+RATE_RANGE = (-3.0, 6.0)
+MAD_SCALE = 1.4826
+SCAN_CHUNK_SIZE = 100000
+# Sessions without a duration are loaded with this in its place and skip the rate check.
+NO_DURATION = -1
+
+thresholds_cache = TieredCache('anticheat', timeout=None)
+
+
+def _settings():
+    return (
+        getattr(settings, 'ANTICHEAT_SCORE_Z', 3.5),
+        getattr(settings, 'ANTICHEAT_RATE_Z', 3.5),
+        getattr(settings, 'ANTICHEAT_MIN_SAMPLES', 100),
+    )
+
+
+def _rate(score, duration):
+    # Instant finishes count as one second rather than dividing by zero.
+    return np.maximum(score, 0) / np.maximum(duration, 1)
+
+
+def _chunks(chunk_size):
+    """``(ids, games, users, scores, durations)`` arrays of completed sessions, by id range"""
+    sessions = GameSession.objects.filter(status='completed')
+    bounds = sessions.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return
+    for low in range(bounds['low'], bounds['high'] + 1, chunk_size):
+        queryset = sessions.filter(id__gte=low, id__lt=low + chunk_size).values_list(
+            'id', 'game_id', 'user_id', 'score', Coalesce('duration', Value(NO_DURATION))
+        )
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+        # Straight from the cursor into one array: no model layer and no list of row tuples.
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = np.fromiter(chain.from_iterable(cursor), dtype=np.int64).reshape(-1, 5)
+        if len(rows):
+            yield rows.T
+
+
+class _Histograms:
+    """Per-game score and log-rate histograms, one row per game"""
+
+    def __init__(self, games):
+        self.game_ids = np.array([game_id for game_id, _ in games], dtype=np.int64)
+        self.max_scores = np.array([max(max_score, 1) for _, max_score in games], dtype=np.float64)
+        # Game id -> row; ids are small and dense, so a lookup array beats a dict per session.
+        self.index = np.full(int(self.game_ids.max()) + 1 if len(games) else 1, -1, dtype=np.int64)
+        self.index[self.game_ids] = np.arange(len(games))
+        self.scores = np.zeros((len(games), HISTOGRAM_BINS), dtype=np.int64)
+        self.rates = np.zeros((len(games), HISTOGRAM_BINS), dtype=np.int64)
+
+    def rows(self, game_ids):
+        rows = np.full(len(game_ids), -1, dtype=np.int64)
+        known = game_ids < len(self.index)
+        rows[known] = self.index[game_ids[known]]
+        return rows
+
+    def _add(self, histogram, rows, bins):
+        # One bincount over (row, bin) pairs fills every game's histogram at once.
+        histogram += np.bincount(rows * HISTOGRAM_BINS + bins, minlength=histogram.size).reshape(histogram.shape)
+
+    def add(self, game_ids, scores, durations):
+        rows = self.rows(game_ids)
+        known = rows >= 0
+        rows, scores, durations = rows[known], scores[known], durations[known]
+        fraction = np.clip(scores / self.max_scores[rows], 0.0, 1.0)
+        self._add(self.scores, rows, np.minimum((fraction * HISTOGRAM_BINS).astype(np.int64), HISTOGRAM_BINS - 1))
+        timed = durations != NO_DURATION
+        low, high = RATE_RANGE
+        with np.errstate(divide='ignore'):
+            log_rate = np.log10(_rate(scores[timed], durations[timed]))
+        position = (np.clip(log_rate, low, high) - low) / (high - low)
+        self._add(self.rates, rows[timed], np.minimum((position * HISTOGRAM_BINS).astype(np.int64), HISTOGRAM_BINS - 1))
+
+    @staticmethod
+    def _median_mad(histogram, centers):
+        """Median and MAD per row of ``histogram`` over bin ``centers`` (NaN for empty rows)"""
+        counts = histogram.sum(axis=1)
+        half = counts / 2.0
+        median_bin = np.argmax(np.cumsum(histogram, axis=1) >= half[:, None], axis=1)
+        median = centers[median_bin]
+        deviation = np.abs(centers[None, :] - median[:, None])
+        order = np.argsort(deviation, axis=1, kind='stable')
+        cumulative = np.cumsum(np.take_along_axis(histogram, order, axis=1), axis=1)
+        mad_position = np.argmax(cumulative >= half[:, None], axis=1)
+        mad = np.take_along_axis(np.take_along_axis(deviation, order, axis=1), mad_position[:, None], axis=1)[:, 0]
+        empty = counts == 0
+        median[empty] = mad[empty] = np.nan
+        return counts, median, mad
+
+    def score_stats(self):
+        """Counts, medians and MADs of the scores, in points"""
+        centers = (np.arange(HISTOGRAM_BINS) + 0.5) / HISTOGRAM_BINS
+        counts, median, mad = self._median_mad(self.scores, centers)
+        return counts, median * self.max_scores, mad * self.max_scores
+
+    def rate_stats(self):
+        """Counts, medians and MADs of log10(points per second)"""
+        low, high = RATE_RANGE
+        centers = low + (np.arange(HISTOGRAM_BINS) + 0.5) * (high - low) / HISTOGRAM_BINS
+        return self._median_mad(self.rates, centers)
+
+
+def _nullable(value):
+    return None if math.isnan(value) else float(value)
+
+
+def compute_baselines(games, chunk_size=SCAN_CHUNK_SIZE):
+    """Unsaved ``ScoreBaseline`` rows for ``(id, max_score)`` games from every completed session"""
+    score_z, rate_z, min_samples = _settings()
+    histograms = _Histograms(games)
+    for _, game_ids, _, scores, durations in _chunks(chunk_size):
+        histograms.add(game_ids, scores, durations)
+
+    sessions, score_median, score_mad = histograms.score_stats()
+    timed, log_rate_median, log_rate_mad = histograms.rate_stats()
+    score_ceiling = score_median + score_z * MAD_SCALE * score_mad
+    rate_ceiling = 10 ** (log_rate_median + rate_z * MAD_SCALE * log_rate_mad)
+    # With no spread there is no scale to call anything an outlier against.
+    score_ceiling[score_mad == 0] = np.nan
+    rate_ceiling[log_rate_mad == 0] = np.nan
+    rate_ceiling[timed < min_samples] = np.nan
+
+    now = timezone.now()
+    baselines = []
+    for row in np.flatnonzero(sessions >= min_samples).tolist():
+        baselines.append(ScoreBaseline(
+            game_id=int(histograms.game_ids[row]),
+            sessions=int(sessions[row]),
+            score_median=float(score_median[row]),
+            score_mad=float(score_mad[row]),
+            score_ceiling=_nullable(score_ceiling[row]),
+            rate_median=_nullable(10 ** log_rate_median[row]) if timed[row] else None,
+            rate_ceiling=_nullable(rate_ceiling[row]),
+            computed_at=now,
+        ))
+    return baselines
+
+
+def _combine(games, ceilings):
+    """``{game_id: (score limit, points-per-second limit)}`` with inf for no limit"""
+    limits = {game_id: (float(max_score), math.inf) for game_id, max_score in games}
+    for game_id, score_ceiling, rate_ceiling in ceilings:
+        if game_id in limits:
+            max_score = limits[game_id][0]
+            limits[game_id] = (
+                max_score if score_ceiling is None else min(score_ceiling, max_score),
+                math.inf if rate_ceiling is None else rate_ceiling,
+            )
+    return limits
+
+
+def _limits():
+    with primary():
+        return _combine(
+            Game.objects.values_list('id', 'max_score'),
+            ScoreBaseline.objects.values_list('game_id', 'score_ceiling', 'rate_ceiling'),
+        )
+
+
+def limits():
+    return thresholds_cache.get_or_set('limits', _limits)
+
+
+def invalidate():
+    transaction.on_commit(thresholds_cache.bump)
+
+
+def check(game_id, score, duration):
+    """Flag reasons for one submission: ``[(reason, value, threshold), ...]``, usually empty"""
+    score_limit, rate_limit = limits().get(game_id, (math.inf, math.inf))
+    reasons = []
+    if score > score_limit:
+        reasons.append(('score', float(score), score_limit))
+    if duration is not None:
+        rate = max(score, 0) / max(duration, 1)
+        if rate > rate_limit:
+            reasons.append(('rate', rate, rate_limit))
+    return reasons
+
+
+def flag_session(session):
+    """Check a just-completed session and queue any flags for review"""
+    reasons = check(session.game_id, session.score, session.duration)
+    if reasons:
+        SessionFlag.objects.bulk_create([
+            SessionFlag(
+                session_id=session.pk, user_id=session.user_id, game_id=session.game_id,
+                reason=reason, source='submission', score=session.score, duration=session.duration,
+                value=value, threshold=threshold,
+            )
+            for reason, value, threshold in reasons
+        ], ignore_conflicts=True)
+    return reasons
+
+
+def _flags(chunk, rows, score_limit, rate_limit):
+    """Unsaved flags for one chunk, found with whole-array comparisons"""
+    ids, game_ids, user_ids, scores, durations = chunk
+    known = rows >= 0
+    score_threshold = np.where(known, score_limit[rows], np.inf)
+    rate_threshold = np.where(known & (durations != NO_DURATION), rate_limit[rows], np.inf)
+    rates = _rate(scores, durations)
+    flags = []
+    for reason, values, threshold in (('score', scores, score_threshold), ('rate', rates, rate_threshold)):
+        for i in np.flatnonzero(values > threshold).tolist():
+            flags.append(SessionFlag(
+                session_id=int(ids[i]), user_id=int(user_ids[i]), game_id=int(game_ids[i]),
+                reason=reason, source='scan', score=int(scores[i]),
+                duration=None if durations[i] == NO_DURATION else int(durations[i]),
+                value=float(values[i]), threshold=float(threshold[i]),
+            ))
+    return flags
+
+
+def scan(chunk_size=SCAN_CHUNK_SIZE, dry_run=False):
+    """
+    Recompute every game's baseline, then flag the completed sessions above it.
+
+    Returns ``(baselines, scanned, flagged)``. Flags already raised for a
+    session and reason, including reviewed ones, are left as they are.
+    """
+    games = list(Game.objects.order_by('id').values_list('id', 'max_score'))
+    baselines = compute_baselines(games, chunk_size)
+    if not dry_run:
+        with transaction.atomic():
+            ScoreBaseline.objects.all().delete()
+            ScoreBaseline.objects.bulk_create(baselines)
+            invalidate()
+
+    histograms = _Histograms(games)
+    game_limits = _combine(games, [
+        (baseline.game_id, baseline.score_ceiling, baseline.rate_ceiling) for baseline in baselines
+    ])
+    score_limit = np.array([game_limits[game_id][0] for game_id, _ in games], dtype=np.float64)
+    rate_limit = np.array([game_limits[game_id][1] for game_id, _ in games], dtype=np.float64)
+
+    scanned = flagged = 0
+    for chunk in _chunks(chunk_size):
+        scanned += chunk.shape[1]
+        flags = _flags(chunk, histograms.rows(chunk[1]), score_limit, rate_limit)
+        flagged += len(flags)
+        if flags and not dry_run:
+            SessionFlag.objects.bulk_create(flags, ignore_conflicts=True)
+    return baselines, scanned, flagged
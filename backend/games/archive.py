@@ -0,0 +1,479 @@
+"""
+Cold storage for old game sessions.
+
+``archive`` moves finished sessions that started before a cutoff out of
+``GameSession`` into append-only segment files under ``ARCHIVE_DIR``, one
+or more per calendar month (UTC). A segment is columnar: a small JSON
+header, then each column of each block of ``BLOCK_ROWS`` rows compressed on
+its own with zlib. Rows are sorted by user, and the header records every
+block's user-id range, so reading one player's history decompresses one or
+two blocks of the columns it needs. Segments are read through ``mmap``;
+only the requested column blocks are decompressed.
+
+A run writes a segment, deletes its rows from the live table in one short
+transaction, then lists the segment in ``manifest.json``. Readers only see
+listed segments. If a run dies between the delete and the listing, the
+next run finds the unlisted file and lists it (or discards it if the
+delete never committed), so no session is ever visible twice or lost.
+Runs hold an exclusive ``flock`` on ``ARCHIVE_DIR/.lock``, so a second run
+(or a recovery) waits rather than racing for the same rows and manifest.
+
+``SessionQuery`` reads the archive with the same filters as the live
+history (``games.history`` unions the two), and ``completed`` feeds
+archived sessions to the stats rebuild and the achievement backfill. Score events, and so every
+projection of the log, keep referring to archived sessions by id.
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import secrets
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from api.db import writer
+from users.models import User
+
+from .models import Game, GameSession
+
+
+MAGIC = b'SPKARC01'
+MANIFEST_NAME = 'manifest.json'
+LOCK_NAME = '.lock'
+BLOCK_ROWS = 4096
+SEGMENT_ROWS = 50000
+COLUMNS = [
+    ('id', '<i8'),
+    ('user_id', '<i8'),
+    ('game_id', '<i8'),
+    ('score', '<i4'),
+    ('status', 'u1'),
+    ('start_time', '<i8'),
+    ('end_time', '<i8'),
+    ('duration', '<i4'),
+]
+DTYPES = dict(COLUMNS)
+STATUSES = [status for status, _ in GameSession.STATUS_CHOICES]
+# Stand-ins for NULL end_time and duration.
+NO_TIME = np.iinfo(np.int64).min
+NO_DURATION = np.iinfo(np.int32).min
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def archive_dir():
+    return str(getattr(settings, 'ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archive')))
+
+
+def to_micros(value):
+    return NO_TIME if value is None else (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value):
+    return None if value == NO_TIME else EPOCH + timedelta(microseconds=int(value))
+
+
+def _month_start(value):
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def _next_month(start):
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+class Segment:
+    """One memory-mapped segment file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an archive segment")
+        (header_length,) = struct.unpack_from('<I', self._map, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self._map[start:start + header_length])
+        self._payload = start + header_length
+
+    def close(self):
+        self._map.close()
+
+    def column(self, block, name):
+        offset, length = block['columns'][name]
+        start = self._payload + offset
+        return np.frombuffer(zlib.decompress(memoryview(self._map)[start:start + length]), dtype=DTYPES[name])
+
+    def blocks(self, user_id=None):
+        for block in self.header['blocks']:
+            if user_id is None or block['user_min'] <= user_id <= block['user_max']:
+                yield block
+
+    @staticmethod
+    def write(path, columns, month):
+        """Write ``columns`` (arrays in ``COLUMNS`` order, sorted by user) as a segment at ``path``"""
+        rows = len(columns['id'])
+        blocks, payload, offset = [], [], 0
+        for start in range(0, rows, BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, rows)
+            block = {
+                'rows': end - start,
+                'user_min': int(columns['user_id'][start]),
+                'user_max': int(columns['user_id'][end - 1]),
+                'columns': {},
+            }
+            for name, dtype in COLUMNS:
+                data = zlib.compress(np.ascontiguousarray(columns[name][start:end], dtype=dtype).tobytes())
+                block['columns'][name] = [offset, len(data)]
+                payload.append(data)
+                offset += len(data)
+            blocks.append(block)
+        header = json.dumps({
+            'month': month,
+            'rows': rows,
+            'min_id': int(columns['id'].min()),
+            'max_id': int(columns['id'].max()),
+            'min_start': int(columns['start_time'].min()),
+            'max_start': int(columns['start_time'].max()),
+            'blocks': blocks,
+        }).encode()
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            for data in payload:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+        return header
+
+
+class Archive:
+    """The listed segments, reopened whenever the manifest changes"""
+
+    def __init__(self, directory=None):
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.segments = []
+
+    @property
+    def directory(self):
+        return self._directory or archive_dir()
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def read_manifest(self):
+        try:
+            with open(self._manifest_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'segments': []}
+
+    def current(self):
+        """Listed segments, newest first"""
+        try:
+            mtime = os.stat(self._manifest_path()).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    names = [entry['file'] for entry in self.read_manifest()['segments']]
+                    opened = {segment.path: segment for segment in self.segments}
+                    segments = []
+                    for name in names:
+                        path = os.path.join(self.directory, name)
+                        segments.append(opened.pop(path, None) or Segment(path))
+                    segments.sort(key=lambda segment: segment.header['max_start'], reverse=True)
+                    self.segments, self._mtime = segments, mtime
+        return self.segments
+
+    def max_start(self):
+        """Newest archived start_time, or None for an empty archive"""
+        segments = self.current()
+        return from_micros(segments[0].header['max_start']) if segments else None
+
+    def publish(self, name):
+        manifest = self.read_manifest()
+        manifest['segments'].append({'file': name})
+        temporary = os.path.join(self.directory, f'.{MANIFEST_NAME}.{secrets.token_hex(4)}')
+        with open(temporary, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self._manifest_path())
+
+
+store = Archive()
+
+
+def _names(values, model, field):
+    names = {}
+    ids = list(values)
+    for start in range(0, len(ids), 500):
+        names.update(model.objects.filter(id__in=ids[start:start + 500]).values_list('id', field))
+    return names
+
+
+def _rows(columns):
+    """History rows (``games.history`` format) for matched column arrays"""
+    usernames = _names(set(columns['user_id'].tolist()), User, 'username')
+    titles = _names(set(columns['game_id'].tolist()), Game, 'title')
+    rows = []
+    for session_id, user_id, game_id, score, status, start, end, duration in zip(
+        *(columns[name].tolist() for name, _ in COLUMNS)
+    ):
+        rows.append({
+            'id': session_id,
+            'user_id': user_id,
+            'username': usernames.get(user_id),
+            'game_id': game_id,
+            'game_title': titles.get(game_id),
+            'score': score,
+            'status': STATUSES[status],
+            'start_time': from_micros(start),
+            'end_time': from_micros(end),
+            'duration': None if duration == NO_DURATION else duration,
+        })
+    return rows
+
+
+class SessionQuery:
+    """Archived sessions matching the history filters"""
+
+    def __init__(self, user_id=None, game_id=None, status=None, archive=None):
+        self.user_id = user_id
+        self.game_id = game_id
+        self.status = STATUSES.index(status) if status in STATUSES else None
+        self.unmatched = bool(status) and status not in STATUSES
+        self.archive = archive or store
+
+    def _matches(self, segment, before=None):
+        """``{column: array}`` of one segment's matching rows, per candidate block"""
+        for block in segment.blocks(self.user_id):
+            mask = np.ones(block['rows'], dtype=bool)
+            for name, value in (('user_id', self.user_id), ('game_id', self.game_id), ('status', self.status)):
+                if value is not None:
+                    mask &= segment.column(block, name) == value
+            if before is not None:
+                start, session_id = before
+                starts = segment.column(block, 'start_time')
+                mask &= (starts < start) | ((starts == start) & (segment.column(block, 'id') < session_id))
+            if mask.any():
+                yield {name: segment.column(block, name)[mask] for name, _ in COLUMNS}
+
+    @staticmethod
+    def _newest_first(parts):
+        columns = {name: np.concatenate([part[name] for part in parts]) for name, _ in COLUMNS}
+        order = np.lexsort((-columns['id'], -columns['start_time']))
+        return {name: values[order] for name, values in columns.items()}
+
+    def page(self, before=None, limit=50):
+        """Up to ``limit`` rows newest first, strictly after the ``(start_time, id)`` cursor"""
+        if self.unmatched:
+            return []
+        before = (to_micros(before[0]), before[1]) if before else None
+        parts, found, oldest_kept = [], 0, None
+        for segment in self.archive.current():
+            # Segments are newest first: stop once none can hold a row newer than those kept.
+            if found >= limit and segment.header['max_start'] < oldest_kept:
+                break
+            if before is not None and segment.header['min_start'] > before[0]:
+                continue
+            for part in self._matches(segment, before):
+                parts.append(part)
+                found += len(part['id'])
+            if found >= limit:
+                oldest_kept = self._newest_first(parts)['start_time'][limit - 1]
+        if not parts:
+            return []
+        columns = self._newest_first(parts)
+        return _rows({name: values[:limit] for name, values in columns.items()})
+
+    def rows(self):
+        """Every matching row, month by month newest first"""
+        if self.unmatched:
+            return
+        by_month = {}
+        for segment in self.archive.current():
+            by_month.setdefault(segment.header['month'], []).append(segment)
+        for month in sorted(by_month, reverse=True):
+            parts = [part for segment in by_month[month] for part in self._matches(segment)]
+            if parts:
+                columns = self._newest_first(parts)
+                for start in range(0, len(columns['id']), 2000):
+                    yield from _rows({name: values[start:start + 2000] for name, values in columns.items()})
+
+
+def completed(user_ids=None, target=None):
+    """``{column: array}`` batches of archived completed sessions, for rebuilding aggregates"""
+    wanted = np.array(sorted(user_ids), dtype=np.int64) if user_ids else None
+    completed_code = STATUSES.index('completed')
+    for segment in (target or store).current():
+        for block in segment.blocks():
+            if wanted is not None and not (
+                (wanted >= block['user_min']) & (wanted <= block['user_max'])
+            ).any():
+                continue
+            mask = segment.column(block, 'status') == completed_code
+            if wanted is not None:
+                mask &= np.isin(segment.column(block, 'user_id'), wanted)
+            if mask.any():
+                yield {name: segment.column(block, name)[mask] for name, _ in COLUMNS}
+
+
+def quarter_hours(batch):
+    """Distinct (user_id, end_time quarter hour) pairs of a ``completed`` batch"""
+    ends = batch['end_time'] != NO_TIME
+    return np.unique(np.stack([batch['user_id'][ends], batch['end_time'][ends] // 900_000_000], axis=1), axis=0)
+
+
+def play_days(quarters):
+    """Sorted distinct (user_id, local date) pairs from ``quarter_hours`` arrays"""
+    if not quarters:
+        return []
+    # Quarter hours map to one local day in every real time zone, as TruncDate would.
+    pairs = np.unique(np.concatenate(quarters), axis=0)
+    zone = timezone.get_current_timezone()
+    day_of = {
+        quarter: from_micros(quarter * 900_000_000).astimezone(zone).date().toordinal()
+        for quarter in np.unique(pairs[:, 1]).tolist()
+    }
+    days = sorted({(user_id, day_of[quarter]) for user_id, quarter in pairs.tolist()})
+    return [(user_id, date.fromordinal(day)) for user_id, day in days]
+
+
+def _columns(rows):
+    columns = {name: np.empty(len(rows), dtype=dtype) for name, dtype in COLUMNS}
+    for i, (session_id, user_id, game_id, score, status, start, end, duration) in enumerate(rows):
+        columns['id'][i] = session_id
+        columns['user_id'][i] = user_id
+        columns['game_id'][i] = game_id
+        columns['score'][i] = score
+        columns['status'][i] = STATUSES.index(status)
+        columns['start_time'][i] = to_micros(start)
+        columns['end_time'][i] = to_micros(end)
+        columns['duration'][i] = NO_DURATION if duration is None else duration
+    order = np.lexsort((columns['id'], columns['start_time'], columns['user_id']))
+    return {name: values[order] for name, values in columns.items()}
+
+
+def _delete(ids):
+    """
+    Delete archived sessions by id with plain DELETE statements.
+
+    ``QuerySet.delete()`` would load every row and collect its related rows
+    first; the flags and score events that point at a session deliberately
+    outlive it, so there is nothing to collect.
+    """
+    qn = connection.ops.quote_name
+    deleted = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            # Only finished sessions are archived, so an open one is never deleted.
+            cursor.execute(
+                'DELETE FROM {} WHERE {} IN ({}) AND {} <> %s'.format(
+                    qn(GameSession._meta.db_table), qn('id'), ', '.join(['%s'] * len(chunk)), qn('status'),
+                ),
+                [*chunk, 'started'],
+            )
+            deleted += cursor.rowcount
+    return deleted
+
+
+def _hot_ids(ids):
+    found = 0
+    for start in range(0, len(ids), 500):
+        found += GameSession.objects.filter(id__in=ids[start:start + 500]).count()
+    return found
+
+
+@contextmanager
+def _exclusive(target):
+    """Hold the archive directory's lock, so only one process writes segments or the manifest at a time"""
+    with open(os.path.join(target.directory, LOCK_NAME), 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def recover(target=None):
+    """List or discard segment files left unlisted by an interrupted run; returns the number listed"""
+    target = target or store
+    if not os.path.isdir(target.directory):
+        return 0
+    with _exclusive(target):
+        return _recover(target)
+
+
+def _recover(target):
+    directory = target.directory
+    listed = {entry['file'] for entry in target.read_manifest()['segments']}
+    recovered = 0
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith('.tmp'):
+            os.remove(path)
+            continue
+        if not name.endswith('.seg') or name in listed:
+            continue
+        segment = Segment(path)
+        ids = np.concatenate([segment.column(block, 'id') for block in segment.blocks()]).tolist()
+        segment.close()
+        if _hot_ids(ids) == len(ids):
+            # The delete never committed; the rows are still live.
+            os.remove(path)
+        else:
+            writer.run(_delete, ids)
+            target.publish(name)
+            recovered += 1
+    return recovered
+
+
+def archive(before, segment_rows=SEGMENT_ROWS, target=None):
+    """Move finished sessions started before ``before`` into segments; returns (sessions, segments)"""
+    target = target or store
+    os.makedirs(target.directory, exist_ok=True)
+    with _exclusive(target):
+        _recover(target)
+        return _archive(before, segment_rows, target)
+
+
+def _archive(before, segment_rows, target):
+    finished = GameSession.objects.exclude(status='started').order_by('start_time', 'id')
+    moved = written = 0
+    while True:
+        oldest = finished.filter(start_time__lt=before).values_list('start_time', flat=True).first()
+        if oldest is None:
+            return moved, written
+        month = _month_start(oldest)
+        rows = list(finished.filter(
+            start_time__gte=month, start_time__lt=min(_next_month(month), before)
+        ).values_list(*(name for name, _ in COLUMNS))[:segment_rows])
+        columns = _columns(rows)
+        name = f"sessions-{month:%Y-%m}-{int(columns['id'].min())}-{secrets.token_hex(2)}.seg"
+        Segment.write(os.path.join(target.directory, name), columns, f'{month:%Y-%m}')
+        # One transaction per segment keeps the SQLite write lock short.
+        writer.run(_delete, columns['id'].tolist())
+        target.publish(name)
+        moved += len(rows)
+        written += 1
+
+
+def default_cutoff():
+    return _month_start(timezone.now() - timedelta(days=getattr(settings, 'ARCHIVE_AFTER_DAYS', 365)))
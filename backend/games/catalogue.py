@@ -0,0 +1,117 @@
+"""
+Versioned, pre-serialized game catalogue.
+
+The active catalogue only changes when an admin edits a ``Game``, so it is
+loaded once per version and kept as encoded JSON bytes with a strong ETag.
+Filtered views (difficulty, game type, search) are answered from
+in-memory indexes over the cached rows instead of new queries. ``Game``
+post_save/post_delete signals bump the version.
+
+The rows and the version live in the ``catalogue`` namespace of the shared
+cache (``api.cache``), so one query serves every worker process and an edit
+made through any of them reaches all of them.
+"""
+
+import hashlib
+import json
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+
+from api.cache import TieredCache
+from api.replicas import primary
+
+from .models import Game
+
+
+CATALOGUE_FIELDS = ['id', 'title', 'description', 'game_type', 'difficulty', 'max_score', 'time_limit']
+MAX_FILTERED_ENTRIES = 256
+
+
+def _encode(games):
+    body = json.dumps({'games': games}, separators=(',', ':')).encode()
+    return body, '"%s"' % hashlib.sha256(body).hexdigest()
+
+
+class CatalogueSnapshot:
+    """One immutable version of the active catalogue"""
+
+    def __init__(self, version, games):
+        self.version = version
+        self.games = games
+        self.body, self.etag = _encode(games)
+        self.by_id = {game['id']: game for game in games}
+        self.by_difficulty = defaultdict(list)
+        self.by_game_type = defaultdict(list)
+        self.search_text = []
+        for position, game in enumerate(games):
+            self.by_difficulty[game['difficulty']].append(position)
+            self.by_game_type[game['game_type']].append(position)
+            self.search_text.append(f"{game['title']}\n{game['description']}".lower())
+        self._filtered = {}
+        self._lock = threading.Lock()
+
+    def filtered(self, difficulty=None, game_type=None, search=None):
+        """(body, etag) for the subset matching the given filters"""
+        if not (difficulty or game_type or search):
+            return self.body, self.etag
+
+        key = (difficulty, game_type, search)
+        cached = self._filtered.get(key)
+        if cached is not None:
+            return cached
+
+        positions = None
+        for index, value in ((self.by_difficulty, difficulty), (self.by_game_type, game_type)):
+            if value:
+                matches = index.get(value, [])
+                positions = matches if positions is None else sorted(set(positions) & set(matches))
+        if positions is None:
+            positions = range(len(self.games))
+        if search:
+            needle = search.lower()
+            positions = [position for position in positions if needle in self.search_text[position]]
+
+        result = _encode([self.games[position] for position in positions])
+        with self._lock:
+            if len(self._filtered) >= MAX_FILTERED_ENTRIES:
+                self._filtered.clear()
+            self._filtered[key] = result
+        return result
+
+
+def _active_games():
+    # A lagging replica would cache the pre-edit rows under the version the edit just bumped.
+    with primary():
+        return list(Game.objects.filter(is_active=True).order_by('id').values(*CATALOGUE_FIELDS))
+
+
+class Catalogue:
+    def __init__(self):
+        self.cache = TieredCache('catalogue', timeout=None)
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        version = self.cache.version()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = CatalogueSnapshot(version, self.cache.get_or_set('active', _active_games))
+            return self._snapshot
+
+    async def asnapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self.cache.cached_version():
+            return snapshot
+        # Checking the shared version or loading the rows is blocking I/O.
+        return await sync_to_async(self.snapshot)()
+
+    def invalidate(self):
+        self.cache.bump()
+
+
+catalogue = Catalogue()
@@ -0,0 +1,160 @@
+"""
+Write-contention benchmark for the SQLite database profiles.
+
+Each mode copies the configured database to a scratch file and starts a
+pool of worker processes on it, the way several server processes would
+share one database. Every worker runs submitter threads that complete game
+sessions back to back for a fixed time, plus one thread reading leaderboard
+pages. A submission reads before it writes (looks for the player's open
+session, then completes it), which is the pattern that fails with
+"database is locked" once a concurrent writer commits in between.
+
+Modes:
+
+* ``default``: stock backend, rollback journal, each thread writes itself
+* ``wal``: the production pragmas (``api.sqlite3``), each thread writes itself
+* ``wal+writer``: the production profile, with writes serialized through
+  ``api.db.writer``
+"""
+
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+from . import workers as pool_tasks
+from .loadgen import percentile
+
+
+MODES = ['default', 'wal', 'wal+writer']
+
+
+def submit_one(user_id, game_id, score, duration):
+    """Complete the player's open session of a game, starting one if needed"""
+    from .models import GameSession
+
+    with transaction.atomic():
+        session = GameSession.objects.filter(user_id=user_id, game_id=game_id, status='started').first()
+        if session is None:
+            session = GameSession.objects.create(user_id=user_id, game_id=game_id)
+        session.complete(score, duration)
+
+
+def run_worker(threads, duration, user_ids, games, seed):
+    """Submit from ``threads`` threads for ``duration`` seconds; returns this process's counts"""
+    from api.db import writer
+
+    from .leaderboard import PERIODS, engine
+    from .models import Leaderboard
+
+    # Load every in-memory board up front so the timed part measures writes, not warm-up.
+    for game_id in [None, *(game_id for game_id, _ in games)]:
+        for period in PERIODS:
+            engine.board(game_id, period)
+    connection.close()
+
+    deadline = time.monotonic() + duration
+    lock = threading.Lock()
+    result = {'ok': 0, 'locked': 0, 'errors': 0, 'reads': 0, 'latencies': []}
+
+    def submitter(rng):
+        while time.monotonic() < deadline:
+            game_id, max_score = rng.choice(games)
+            started = time.perf_counter()
+            try:
+                writer.run(submit_one, rng.choice(user_ids), game_id, rng.randint(0, max_score), rng.randint(5, 300))
+                outcome = 'ok'
+            except OperationalError as e:
+                outcome = 'locked' if 'locked' in str(e) else 'errors'
+            except Exception:
+                outcome = 'errors'
+            elapsed = time.perf_counter() - started
+            with lock:
+                result[outcome] += 1
+                if outcome == 'ok':
+                    result['latencies'].append(elapsed)
+        connection.close()
+
+    def reader():
+        while time.monotonic() < deadline:
+            list(Leaderboard.objects.filter(period='all_time', game=None).order_by('rank')[:10].values_list(
+                'user_id', 'total_score'
+            ))
+            result['reads'] += 1
+        connection.close()
+
+    pool = [threading.Thread(target=submitter, args=(random.Random(seed * 1000 + n),)) for n in range(threads)]
+    pool.append(threading.Thread(target=reader))
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return result
+
+
+def _scratch_copy(source, directory, journal_mode):
+    path = os.path.join(directory, 'contention.sqlite3')
+    with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+        src.backup(dst)
+        dst.execute(f'PRAGMA journal_mode = {journal_mode}')
+    return path
+
+
+def _overrides(mode, path):
+    database = {**settings.DATABASES['default'], 'NAME': path}
+    if mode == 'default':
+        database.update({'ENGINE': 'django.db.backends.sqlite3', 'CONN_MAX_AGE': 0})
+        return {'DATABASES': {'default': database}, 'SQLITE_SERIALIZE_WRITES': False}
+    database.update({'ENGINE': 'api.sqlite3', 'CONN_MAX_AGE': None})
+    return {'DATABASES': {'default': database}, 'SQLITE_SERIALIZE_WRITES': mode == 'wal+writer'}
+
+
+def run(mode, processes=4, threads=4, duration=10.0, seed=0):
+    """Run one mode; returns a summary dict"""
+    from users.models import User
+
+    from .models import Game
+
+    if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+        raise ValueError('The contention benchmark needs a file-backed SQLite database')
+    user_ids = list(User.objects.order_by('id').values_list('id', flat=True)[:1000])
+    games = list(Game.objects.filter(is_active=True).values_list('id', 'max_score'))
+    if not user_ids or not games:
+        raise ValueError('No users or active games; run seed_data first')
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = _scratch_copy(
+            str(settings.DATABASES['default']['NAME']), directory, 'DELETE' if mode == 'default' else 'WAL'
+        )
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=pool_tasks.configure,
+            initargs=(_overrides(mode, path),),
+        ) as pool:
+            started = time.perf_counter()
+            results = list(pool.map(
+                pool_tasks.contention_worker,
+                [threads] * processes, [duration] * processes, [user_ids] * processes, [games] * processes,
+                [seed + n for n in range(processes)],
+            ))
+            elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for result in results for latency in result['latencies'])
+    total = {key: sum(result[key] for result in results) for key in ('ok', 'locked', 'errors', 'reads')}
+    return {
+        'mode': mode,
+        'elapsed': elapsed,
+        **total,
+        'submits_per_second': total['ok'] / duration,
+        'reads_per_second': total['reads'] / duration,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
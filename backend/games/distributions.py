@@ -0,0 +1,368 @@
+"""
+Score distributions from a memory-mapped columnar snapshot.
+
+Percentiles ("you beat 87% of players"), quantiles and histograms are
+answered from a snapshot of every completed session's score rather than
+from ``GameSession``. The snapshot is one ``.npy`` file of int32 scores
+holding a sorted segment per game and one per difficulty, plus a
+``current.json`` index of segment offsets. Worker processes map the file
+read-only, so the operating system shares one copy of it between them, and
+every lookup is a binary search (``np.searchsorted``) over a segment.
+
+Scores come from the ``session`` events of the score log (``ScoreEvent``),
+whose ids only grow, so the index records the last event it includes:
+
+* ``build`` streams the log in id-range chunks into segments of the new
+  file and sorts each segment in place, so memory stays bounded by the
+  largest segment rather than the whole log.
+* Between builds, each process folds newer events into a small in-memory
+  delta (sorted per segment) at most every ``SCORE_SNAPSHOT_REFRESH``
+  seconds, and lookups combine the file with the delta. New scores are
+  merged into the sorted delta in linear time rather than re-sorting it.
+* ``merge`` writes a new file from the current one plus the delta, without
+  reading the whole log again.
+
+``manage.py build_score_snapshot`` runs either; readers switch to a new
+file within ``SCORE_SNAPSHOT_REFRESH`` seconds of it being published. So
+that deltas stay small without a scheduled ``--merge``, a process whose
+delta reaches ``SCORE_SNAPSHOT_MERGE_ROWS`` scores merges in a background
+thread, holding a lease in the ``shared`` cache so one process does it.
+"""
+
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import Count, Max
+
+from .models import Game, ScoreEvent
+
+
+logger = logging.getLogger(__name__)
+BUILD_CHUNK_SIZE = 500000
+INDEX_NAME = 'current.json'
+MERGE_LEASE_KEY = 'score-snapshot:merge'
+
+
+class SnapshotMissing(Exception):
+    pass
+
+
+def game_key(game_id):
+    return f'game/{game_id}'
+
+
+def difficulty_key(difficulty):
+    return f'difficulty/{difficulty}'
+
+
+def snapshot_dir():
+    return str(getattr(settings, 'SCORE_SNAPSHOT_DIR', os.path.join(settings.BASE_DIR, 'scores')))
+
+
+def _events(after, through, chunk_size):
+    """``(game_ids, scores)`` arrays of session events with ``after < id <= through``, by id range"""
+    for low in range(after + 1, through + 1, chunk_size):
+        queryset = ScoreEvent.objects.filter(
+            kind='session', id__gte=low, id__lte=min(low + chunk_size - 1, through)
+        ).values_list('game_id', 'score')
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = np.fromiter(chain.from_iterable(cursor), dtype=np.int64).reshape(-1, 2)
+        if len(rows):
+            yield rows[:, 0], rows[:, 1].astype(np.int32)
+
+
+def _by_key(game_ids, scores, difficulties):
+    """``{segment key: scores}`` for one batch, each game's scores also under its difficulty"""
+    order = np.argsort(game_ids, kind='stable')
+    game_ids, scores = game_ids[order], scores[order]
+    unique, starts = np.unique(game_ids, return_index=True)
+    groups = {}
+    for game_id, part in zip(unique.tolist(), np.split(scores, starts[1:])):
+        groups[game_key(game_id)] = [part]
+        if game_id in difficulties:
+            groups.setdefault(difficulty_key(difficulties[game_id]), []).append(part)
+    return {key: np.concatenate(parts) if len(parts) > 1 else parts[0] for key, parts in groups.items()}
+
+
+def _publish(directory, data_name, segments, through, difficulties):
+    """Point ``current.json`` at a finished data file and drop files no index refers to"""
+    index = {
+        'file': data_name,
+        'through_event': through,
+        'built_at': time.time(),
+        'segments': segments,
+        'difficulties': {str(game_id): difficulty for game_id, difficulty in difficulties.items()},
+    }
+    temporary = os.path.join(directory, f'.{INDEX_NAME}.{secrets.token_hex(4)}')
+    with open(temporary, 'w') as f:
+        json.dump(index, f)
+    previous = _read_index(directory)
+    os.replace(temporary, os.path.join(directory, INDEX_NAME))
+    # Keep the previous file for readers that have not switched yet.
+    keep = {data_name, previous['file'] if previous else None}
+    for name in os.listdir(directory):
+        if name.endswith('.npy') and name not in keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                # Still mapped by a reader on a platform that forbids deleting open files.
+                pass
+    return index
+
+
+def _read_index(directory):
+    try:
+        with open(os.path.join(directory, INDEX_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write(directory, sizes, fill, through, difficulties):
+    """Create a data file with ``sizes`` segments, let ``fill(array, segments)`` populate it, publish it"""
+    os.makedirs(directory, exist_ok=True)
+    segments, offset = {}, 0
+    for key, size in sizes.items():
+        segments[key] = [offset, offset + size]
+        offset += size
+    data_name = f'scores-{through}-{secrets.token_hex(4)}.npy'
+    path = os.path.join(directory, data_name)
+    array = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=np.int32, shape=(offset,))
+    fill(array, segments)
+    array.flush()
+    del array
+    os.replace(path + '.tmp', path)
+    return _publish(directory, data_name, segments, through, difficulties)
+
+
+def build(chunk_size=BUILD_CHUNK_SIZE, directory=None):
+    """Write a snapshot of every session event from the log; returns its index"""
+    directory = directory or snapshot_dir()
+    through = ScoreEvent.objects.aggregate(last=Max('id'))['last'] or 0
+    difficulties = dict(Game.objects.values_list('id', 'difficulty'))
+    sizes = {}
+    counts = ScoreEvent.objects.filter(kind='session', id__lte=through).values('game_id').annotate(n=Count('id'))
+    for row in counts.order_by('game_id'):
+        sizes[game_key(row['game_id'])] = row['n']
+    for game_id, difficulty in difficulties.items():
+        key = difficulty_key(difficulty)
+        sizes[key] = sizes.get(key, 0) + sizes.get(game_key(game_id), 0)
+
+    def fill(array, segments):
+        cursors = {key: start for key, (start, _) in segments.items()}
+        for game_ids, scores in _events(0, through, chunk_size):
+            for key, part in _by_key(game_ids, scores, difficulties).items():
+                array[cursors[key]:cursors[key] + len(part)] = part
+                cursors[key] += len(part)
+        for start, end in segments.values():
+            array[start:end].sort()
+
+    return _write(directory, sizes, fill, through, difficulties)
+
+
+class _Delta:
+    """Sorted scores per segment key for session events newer than the snapshot file"""
+
+    def __init__(self, through):
+        self.through = through
+        self.segments = {}
+        self.rows = 0
+
+    def add(self, game_ids, scores, difficulties):
+        for key, part in _by_key(game_ids, scores, difficulties).items():
+            part = np.sort(part)
+            current = self.segments.get(key)
+            # Replaced, never mutated: readers may hold the previous array.
+            self.segments[key] = part if current is None else np.insert(current, np.searchsorted(current, part), part)
+        self.rows += len(scores)
+
+
+_EMPTY = np.zeros(0, dtype=np.int32)
+
+
+class _State:
+    """One mapped snapshot file and the delta on top of it"""
+
+    def __init__(self, index, array, mtime):
+        self.index = index
+        self.array = array
+        self.mtime = mtime
+        self.difficulties = {int(game_id): difficulty for game_id, difficulty in index['difficulties'].items()}
+        self.delta = _Delta(index['through_event'])
+
+    def parts(self, key):
+        bounds = self.index['segments'].get(key)
+        base = self.array[bounds[0]:bounds[1]] if bounds else _EMPTY
+        return base, self.delta.segments.get(key, _EMPTY)
+
+
+class ScoreDistributions:
+    def __init__(self):
+        self._state = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._merger = None
+
+    @property
+    def refresh_interval(self):
+        return getattr(settings, 'SCORE_SNAPSHOT_REFRESH', 5.0)
+
+    @property
+    def merge_rows(self):
+        return getattr(settings, 'SCORE_SNAPSHOT_MERGE_ROWS', 200000)
+
+    def _open(self, directory):
+        path = os.path.join(directory, INDEX_NAME)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        state = self._state
+        if state is not None and state.mtime == mtime:
+            return state
+        index = _read_index(directory)
+        array = np.load(os.path.join(directory, index['file']), mmap_mode='r')
+        return _State(index, array, mtime)
+
+    def _fold(self, state):
+        """Add session events newer than ``state``'s delta to it"""
+        through = ScoreEvent.objects.aggregate(last=Max('id'))['last'] or 0
+        if through <= state.delta.through:
+            return
+        batches = list(_events(state.delta.through, through, BUILD_CHUNK_SIZE))
+        unknown = {game_id for game_ids, _ in batches for game_id in np.unique(game_ids).tolist()}
+        unknown -= state.difficulties.keys()
+        if unknown:
+            state.difficulties.update(Game.objects.filter(id__in=unknown).values_list('id', 'difficulty'))
+        for game_ids, scores in batches:
+            state.delta.add(game_ids, scores, state.difficulties)
+        state.delta.through = through
+
+    def state(self):
+        """The current snapshot with recent events folded in; raises SnapshotMissing before the first build"""
+        state = self._state
+        if state is None or time.monotonic() - self._checked >= self.refresh_interval:
+            with self._lock:
+                if self._state is None or time.monotonic() - self._checked >= self.refresh_interval:
+                    state = self._open(snapshot_dir())
+                    if state is not None:
+                        self._fold(state)
+                        if self.merge_rows and state.delta.rows >= self.merge_rows:
+                            self._merge_in_background()
+                    self._state = state
+                    self._checked = time.monotonic()
+                state = self._state
+        if state is None:
+            raise SnapshotMissing("No score snapshot yet; run manage.py build_score_snapshot")
+        return state
+
+    def count(self, key):
+        base, delta = self.state().parts(key)
+        return len(base) + len(delta)
+
+    def percentile(self, game_id, score):
+        """Share of the game's completed sessions scoring below ``score``, in percent (None without data)"""
+        base, delta = self.state().parts(game_key(game_id))
+        total = len(base) + len(delta)
+        if not total:
+            return None
+        below = int(np.searchsorted(base, score, side='left')) + int(np.searchsorted(delta, score, side='left'))
+        return 100.0 * below / total
+
+    def _value_at(self, base, delta, rank):
+        """The score at 0-based ``rank`` in the union of two sorted arrays"""
+        if not len(delta):
+            return int(base[rank])
+        if not len(base):
+            return int(delta[rank])
+        # Scores are integers: bisect on the value until rank + 1 scores are at or below it.
+        low = int(min(base[0], delta[0]))
+        high = int(max(base[-1], delta[-1]))
+        while low < high:
+            middle = (low + high) // 2
+            at_or_below = np.searchsorted(base, middle, side='right') + np.searchsorted(delta, middle, side='right')
+            if at_or_below > rank:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def quantiles(self, key, probabilities):
+        """``{probability: score}`` by the nearest-rank method (None without data)"""
+        base, delta = self.state().parts(key)
+        total = len(base) + len(delta)
+        if not total:
+            return None
+        return {
+            probability: self._value_at(base, delta, min(max(int(np.ceil(probability * total)) - 1, 0), total - 1))
+            for probability in probabilities
+        }
+
+    def histogram(self, key, bins, low=None, high=None):
+        """``(edges, counts)`` over ``bins`` equal-width bins, the last one closed (None without data)"""
+        base, delta = self.state().parts(key)
+        if not len(base) + len(delta):
+            return None
+        ends = [part[i] for part in (base, delta) if len(part) for i in (0, -1)]
+        low = min(ends) if low is None else low
+        high = max(ends) if high is None else high
+        edges = np.linspace(low, max(high, low + 1), bins + 1)
+        counts = np.zeros(bins, dtype=np.int64)
+        for part in (base, delta):
+            positions = np.concatenate([
+                np.searchsorted(part, edges[:-1], side='left'), [np.searchsorted(part, edges[-1], side='right')]
+            ])
+            counts += np.diff(positions)
+        return edges.tolist(), counts.tolist()
+
+    def _merge_in_background(self):
+        if self._merger is not None and self._merger.is_alive():
+            return
+        shared = caches[getattr(settings, 'CACHE_SHARED_ALIAS', 'shared')]
+        # Expires on its own if the merging process dies.
+        if not shared.add(MERGE_LEASE_KEY, secrets.token_hex(4), timeout=600):
+            return
+
+        def run():
+            try:
+                self.merge()
+            except Exception:
+                logger.exception("Merging the score snapshot failed")
+            finally:
+                shared.delete(MERGE_LEASE_KEY)
+
+        self._merger = threading.Thread(target=run, name='score-snapshot-merge', daemon=True)
+        self._merger.start()
+
+    def merge(self, directory=None):
+        """Write a new snapshot file from the current one plus newer events; returns its index"""
+        directory = directory or snapshot_dir()
+        state = self._open(directory)
+        if state is None:
+            raise SnapshotMissing("No score snapshot to merge into; run a full build first")
+        # The state may be the one lookups use; folding it twice would count events twice.
+        with self._lock:
+            self._fold(state)
+        keys = list(state.index['segments']) + [key for key in state.delta.segments if key not in state.index['segments']]
+        sizes = {key: sum(len(part) for part in state.parts(key)) for key in keys}
+
+        def fill(array, segments):
+            for key, (start, end) in segments.items():
+                base, delta = state.parts(key)
+                array[start:end] = np.insert(base, np.searchsorted(base, delta), delta) if len(delta) else base
+
+        return _write(directory, sizes, fill, state.delta.through, state.difficulties)
+
+
+distributions = ScoreDistributions()
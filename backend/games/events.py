@@ -0,0 +1,51 @@
+"""
+Writing to the append-only score event log.
+
+Every completed session appends exactly one ``ScoreEvent`` with a single
+INSERT. Events are never updated; corrections are new ``adjustment``
+events, which ``adjust`` also applies to the live projections they count
+toward (user totals, experience and leaderboards) the way a rebuild would.
+``games.projections`` rebuilds everything derived from the log.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from .leaderboard import engine as leaderboard_engine
+from .levels import credit
+from .live import live_boards
+from .models import ScoreEvent
+
+
+def append(session, experience):
+    """Log a completed session; returns the new event"""
+    return ScoreEvent.objects.create(
+        user_id=session.user_id,
+        game_id=session.game_id,
+        session_id=session.pk,
+        kind='session',
+        score=session.score,
+        experience=experience,
+        duration=session.duration,
+        occurred_at=session.end_time,
+    )
+
+
+def adjust(user_id, game_id, score, experience=0, when=None):
+    """Log a correction to a user's score without touching past events, and apply it"""
+    when = when or timezone.now()
+
+    def record():
+        # Adjustments add score but no games played, as in games.rollups.
+        leaderboard_engine.record(user_id, game_id, score, when, games=0)
+        live_boards.mark(game_id)
+
+    with transaction.atomic():
+        event = ScoreEvent.objects.create(
+            user_id=user_id, game_id=game_id, kind='adjustment', score=score,
+            experience=experience, occurred_at=when,
+        )
+        credit({user_id: (score, 0, experience)})
+        # The boards live in memory and cannot roll back, so they only see committed adjustments.
+        transaction.on_commit(record)
+    return event
@@ -0,0 +1,189 @@
+"""
+Session history: keyset pages and streaming exports.
+
+Pages follow ``GameSession``'s default ``-start_time`` ordering with ``-id``
+as the tie-break. The cursor encodes the last (start_time, id) returned,
+so each page is one index range scan no matter how deep it is, unlike
+OFFSET paging.
+
+Exports stream NDJSON or CSV straight from ``iterator(chunk_size=...)``
+(``aiterator`` under ASGI), flushing the encoded rows in blocks, so memory
+does not grow with the number of rows.
+
+Sessions moved to the archive (``games.archive``) are read alongside the
+live table. A page takes up to ``limit + 1`` rows past the cursor from each
+side and merges them; the archive is skipped when the live rows alone fill
+the page with sessions newer than anything archived. Exports write the live
+rows, then the archived ones month by month.
+"""
+
+import base64
+import csv
+from datetime import datetime
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+
+from .archive import SessionQuery
+from .models import GameSession
+
+
+HISTORY_FIELDS = [
+    'id', 'user_id', 'user__username', 'game_id', 'game__title',
+    'score', 'status', 'start_time', 'end_time', 'duration',
+]
+EXPORT_COLUMNS = ['id', 'user_id', 'username', 'game_id', 'game_title', 'score', 'status',
+                  'start_time', 'end_time', 'duration']
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+FLUSH_BYTES = 64 * 1024
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(start_time, session_id):
+    raw = f'{start_time.isoformat()}|{session_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        start_time, session_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(start_time), int(session_id)
+    except (ValueError, UnicodeDecodeError):
+        raise CursorError('Invalid cursor')
+
+
+class Sessions:
+    """Live rows (a queryset) and archived rows matching the same filters"""
+
+    def __init__(self, live, archived):
+        self.live = live
+        self.archived = archived
+
+
+def history(user_id=None, game_id=None, status=None):
+    """Newest-first session rows for a user and/or game"""
+    sessions = GameSession.objects.all()
+    if user_id is not None:
+        sessions = sessions.filter(user_id=user_id)
+    if game_id is not None:
+        sessions = sessions.filter(game_id=game_id)
+    if status:
+        sessions = sessions.filter(status=status)
+    return Sessions(
+        sessions.order_by('-start_time', '-id').values(*HISTORY_FIELDS),
+        SessionQuery(user_id, game_id, status),
+    )
+
+
+def _row(values):
+    return {
+        'id': values['id'],
+        'user_id': values['user_id'],
+        'username': values['user__username'],
+        'game_id': values['game_id'],
+        'game_title': values['game__title'],
+        'score': values['score'],
+        'status': values['status'],
+        'start_time': values['start_time'],
+        'end_time': values['end_time'],
+        'duration': values['duration'],
+    }
+
+
+def page(rows, cursor=None, limit=50):
+    """(rows, next cursor or None) for the page after ``cursor``"""
+    live = rows.live
+    before = None
+    if cursor:
+        before = decode_cursor(cursor)
+        start_time, session_id = before
+        live = live.filter(Q(start_time__lt=start_time) | Q(start_time=start_time, id__lt=session_id))
+    results = [_row(values) for values in live[:limit + 1]]
+    archived_through = rows.archived.archive.max_start()
+    if archived_through is not None and (len(results) <= limit or results[-1]['start_time'] <= archived_through):
+        results += rows.archived.page(before, limit + 1)
+        results.sort(key=lambda row: (row['start_time'], row['id']), reverse=True)
+        results = results[:limit + 1]
+    if len(results) <= limit:
+        return results, None
+    results = results[:limit]
+    return results, encode_cursor(results[-1]['start_time'], results[-1]['id'])
+
+
+class _Line:
+    """File-like target for csv.writer that hands back the written line"""
+
+    def write(self, value):
+        return value
+
+
+def _encoder(export_format):
+    if export_format == 'csv':
+        writer = csv.writer(_Line())
+        return lambda row: writer.writerow([row[column] for column in EXPORT_COLUMNS])
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    return lambda row: encoder.encode(row) + '\n'
+
+
+def _header(export_format):
+    return csv.writer(_Line()).writerow(EXPORT_COLUMNS) if export_format == 'csv' else ''
+
+
+def stream(request, rows, export_format):
+    """Iterator of encoded blocks for a StreamingHttpResponse, sync or async to match the server"""
+    chunk_size = getattr(settings, 'HISTORY_EXPORT_CHUNK_SIZE', 2000)
+    encode = _encoder(export_format)
+
+    def blocks():
+        block = [_header(export_format)]
+        size = 0
+        for values in rows.live.iterator(chunk_size=chunk_size):
+            line = encode(_row(values))
+            block.append(line)
+            size += len(line)
+            if size >= FLUSH_BYTES:
+                yield ''.join(block)
+                block, size = [], 0
+        for row in rows.archived.rows():
+            line = encode(row)
+            block.append(line)
+            size += len(line)
+            if size >= FLUSH_BYTES:
+                yield ''.join(block)
+                block, size = [], 0
+        yield ''.join(block)
+
+    async def ablocks():
+        block = [_header(export_format)]
+        size = 0
+        async for values in rows.live.aiterator(chunk_size=chunk_size):
+            line = encode(_row(values))
+            block.append(line)
+            size += len(line)
+            if size >= FLUSH_BYTES:
+                yield ''.join(block)
+                block, size = [], 0
+        # Archived rows look up usernames and titles, so they are read off the event loop.
+        archived = rows.archived.rows()
+        next_row = sync_to_async(next, thread_sensitive=True)
+        while (row := await next_row(archived, None)) is not None:
+            line = encode(row)
+            block.append(line)
+            size += len(line)
+            if size >= FLUSH_BYTES:
+                yield ''.join(block)
+                block, size = [], 0
+        yield ''.join(block)
+
+    # Django buffers an iterator of the other kind completely before sending it.
+    return ablocks() if isinstance(request, ASGIRequest) else blocks()
@@ -0,0 +1,275 @@
+"""
+Write-coalescing ingestion of completed game sessions.
+
+Submissions are validated on the request path and queued in memory. A
+flusher persists the queue in one transaction per batch: new session rows
+via ``bulk_create``, submitted open sessions via an UPDATE that only completes
+rows still ``started``, and user totals via ``games.levels.credit``, one
+``bulk_update`` of F() expressions with one summed delta per user however
+many sessions they submitted in the batch, after which users whose
+experience crossed a level threshold are re-levelled.
+
+A session id can be submitted to two processes, or abandoned by the sweeper
+while queued. Only the open sessions the UPDATE actually completed are
+credited and announced; the rest are logged and dropped.
+
+A batch that fails because the database is unavailable (``OperationalError``)
+goes back on the queue whole. Any other failure is blamed on its rows: the
+batch is written again one session per transaction, and sessions that still
+fail on their own are logged and dropped, so one bad row cannot hold up the
+rest of the queue.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from api.db import writer
+
+from .levels import credit, experience_for
+from .models import GameSession
+from .signals import session_completed
+
+
+logger = logging.getLogger(__name__)
+
+# Open sessions completed per UPDATE; each adds a WHEN per field to its CASE expressions.
+OPEN_SESSION_CHUNK = 200
+
+
+class SubmissionError(ValueError):
+    pass
+
+
+def validate_submission(game, data):
+    """Return (score, duration) or raise SubmissionError"""
+    if not isinstance(data, dict):
+        raise SubmissionError('Expected a JSON object')
+    try:
+        score = int(data.get('score', 0))
+        duration = data.get('time_taken', data.get('duration'))
+        duration = int(duration) if duration is not None else None
+    except (TypeError, ValueError):
+        raise SubmissionError('Score and time_taken must be integers')
+
+    if score < 0 or score > game.max_score:
+        raise SubmissionError(f'Score must be between 0 and {game.max_score}')
+    if duration is not None:
+        if duration < 0:
+            raise SubmissionError('time_taken cannot be negative')
+        if game.time_limit and duration > game.time_limit:
+            raise SubmissionError(f'time_taken exceeds the {game.time_limit}s time limit')
+    return score, duration
+
+
+class SubmissionBuffer:
+    """Queue of completed sessions flushed to the database in batches"""
+
+    def __init__(self, flush_size=None, flush_interval=None):
+        self.flush_size = flush_size or getattr(settings, 'SUBMISSION_FLUSH_SIZE', 500)
+        self.flush_interval = flush_interval or getattr(settings, 'SUBMISSION_FLUSH_INTERVAL', 1.0)
+        self._queue = []
+        self._queued_sessions = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.metrics = {
+            'submitted': 0,
+            'flushed': 0,
+            'dropped': 0,
+            'flush_errors': 0,
+            'flushes': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+            'max_queue_depth': 0,
+        }
+
+    def submit(self, user, game, score, duration, session_id=None):
+        """Queue a completed session; returns the pending GameSession"""
+        if session_id is not None:
+            if session_id in self._queued_sessions:
+                raise SubmissionError('Session already submitted')
+            session = GameSession.objects.filter(
+                pk=session_id, user=user, game=game, status='started'
+            ).only('id', 'user_id', 'game_id', 'start_time').first()
+            if session is None:
+                raise SubmissionError('No open session with that id')
+        else:
+            session = GameSession(user_id=user.pk, game_id=game.pk)
+
+        session.score = score
+        session.duration = duration
+        session.status = 'completed'
+        session.end_time = timezone.now()
+        experience = experience_for(game, score)
+
+        with self._lock:
+            if session.pk is not None:
+                if session.pk in self._queued_sessions:
+                    raise SubmissionError('Session already submitted')
+                self._queued_sessions.add(session.pk)
+            self._queue.append((session, experience))
+            depth = len(self._queue)
+            self.metrics['submitted'] += 1
+            self.metrics['max_queue_depth'] = max(self.metrics['max_queue_depth'], depth)
+
+        self._ensure_flusher()
+        if depth >= self.flush_size:
+            self._wakeup.set()
+        return session
+
+    def _ensure_flusher(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='submission-flusher', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Keep the flusher alive; whatever could not be written is back on the queue.
+                self.metrics['flush_errors'] += 1
+                logger.exception("Flushing queued submissions failed; retrying in %ss", self.flush_interval)
+                time.sleep(self.flush_interval)
+
+    def flush(self):
+        """Persist everything queued so far; returns the number of sessions written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._queue = self._queue, []
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                written = writer.run(self._write, batch)
+            except OperationalError:
+                self._requeue(batch)
+                raise
+            except Exception:
+                logger.warning("Writing %d queued sessions failed; retrying them one at a time",
+                               len(batch), exc_info=True)
+                written = self._write_each(batch)
+            with self._lock:
+                self._queued_sessions.difference_update(s.pk for s, _ in batch if s.pk is not None)
+
+            elapsed = (time.perf_counter() - started) * 1000
+            self.metrics['flushed'] += written
+            self.metrics['flushes'] += 1
+            self.metrics['last_flush_ms'] = elapsed
+            self.metrics['max_flush_ms'] = max(self.metrics['max_flush_ms'], elapsed)
+            self.metrics['total_flush_ms'] += elapsed
+            return written
+
+    def _requeue(self, batch):
+        with self._lock:
+            self._queue[:0] = batch
+
+    def _write_each(self, batch):
+        """Write ``batch`` one session per transaction, dropping the sessions that fail"""
+        written = 0
+        for position, (session, experience) in enumerate(batch):
+            try:
+                written += writer.run(self._write, [(session, experience)])
+            except OperationalError:
+                self._requeue(batch[position:])
+                raise
+            except Exception:
+                self.metrics['dropped'] += 1
+                logger.exception("Dropped the submission of user %s for game %s (session %s, score %s)",
+                                 session.user_id, session.game_id, session.pk, session.score)
+        return written
+
+    def _write(self, batch):
+        """Write ``batch`` in one transaction; returns the number of sessions completed"""
+        new_sessions = [session for session, _ in batch if session.pk is None]
+        open_sessions = {session.pk: session for session, _ in batch if session.pk is not None}
+
+        try:
+            with transaction.atomic():
+                GameSession.objects.bulk_create(new_sessions, batch_size=self.flush_size)
+                completed = self._complete_open(open_sessions)
+                batch = [(session, experience) for session, experience in batch
+                         if session.pk not in open_sessions or session.pk in completed]
+
+                deltas = defaultdict(lambda: [0, 0, 0])
+                for session, experience in batch:
+                    delta = deltas[session.user_id]
+                    delta[0] += session.score
+                    delta[1] += 1
+                    delta[2] += experience
+                if deltas:
+                    credit(deltas, batch_size=self.flush_size)
+                for session, experience in batch:
+                    session_completed.send(sender=GameSession, session=session, experience=experience)
+        except Exception:
+            # The insert was rolled back, so the retry must insert again.
+            for session in new_sessions:
+                session.pk = None
+                session._state.adding = True
+            raise
+
+        for session_id in open_sessions.keys() - completed:
+            self.metrics['dropped'] += 1
+            logger.warning("Session %s was no longer open when its submission was written; dropped it", session_id)
+        return len(batch)
+
+    def _complete_open(self, open_sessions):
+        """Complete the sessions of ``{id: session}`` still ``started``; returns the ids completed"""
+        completed = set()
+        ids = list(open_sessions)
+        for start in range(0, len(ids), OPEN_SESSION_CHUNK):
+            chunk = ids[start:start + OPEN_SESSION_CHUNK]
+            # Locks the rows where the database can, so the UPDATE below completes exactly these.
+            still_open = list(GameSession.objects.select_for_update().filter(
+                id__in=chunk, status='started'
+            ).values_list('id', flat=True))
+            if not still_open:
+                continue
+            sessions = [open_sessions[session_id] for session_id in still_open]
+            GameSession.objects.filter(id__in=still_open, status='started').update(
+                score=_per_session(sessions, 'score'),
+                duration=_per_session(sessions, 'duration'),
+                end_time=_per_session(sessions, 'end_time'),
+                status='completed',
+            )
+            completed.update(still_open)
+        return completed
+
+    def stats(self):
+        with self._lock:
+            depth = len(self._queue)
+        flushes = self.metrics['flushes']
+        return {
+            **self.metrics,
+            'queue_depth': depth,
+            'avg_flush_ms': self.metrics['total_flush_ms'] / flushes if flushes else 0.0,
+        }
+
+
+def _per_session(sessions, field):
+    """CASE expression giving each session its own ``field`` in a single UPDATE"""
+    output_field = GameSession._meta.get_field(field)
+    return Case(
+        *(When(id=session.pk, then=Value(getattr(session, field), output_field=output_field))
+          for session in sessions),
+        output_field=output_field,
+    )
+
+
+buffer = SubmissionBuffer()
+atexit.register(buffer.flush)
@@ -0,0 +1,515 @@
+"""
+In-process leaderboard engine.
+
+Each (game, period, period_start) board keeps its players in an indexable
+skip list ordered by score, so a completed session moves one player in
+O(log n) and rank lookups never touch the database. Changed ranks are
+persisted to the ``Leaderboard`` table in write-behind batches.
+
+Every web process runs its own engine over the same rows, so a flush never
+writes a board's totals back: it adds the scores and games recorded since
+the last flush with ``total = total + delta`` updates, creating missing rows
+with ``INSERT ... ON CONFLICT DO NOTHING`` (a partial unique index covers the
+overall boards, whose ``game`` is NULL). It then reads the totals back; a
+board whose rows moved by more than its own deltas saw another process's
+sessions, so it is dropped and reloaded on next use instead of writing ranks
+from a stale order. A board loaded with stored ranks out of order rewrites
+them on its next flush.
+
+Rendered leaderboard pages are kept in the ``leaderboard`` namespace of the
+shared cache (``pages``). Those batches are bulk writes, which send no model
+signals, so the engine bumps the namespace itself whenever it writes.
+
+A rebuild (``games.rollups``) rewrites a bucket's rows behind every running
+engine's back. ``discard`` stamps the bucket in the shared cache
+(``REBUILDS_KEY``), and every engine checks the stamps at most once per
+``CACHE_LOCAL_TTL`` seconds, dropping its boards of a restamped bucket
+without flushing them, so the next access reloads the rebuilt rows.
+"""
+
+import atexit
+import random
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.cache import TieredCache
+from api.replicas import primary
+
+from .models import Leaderboard
+
+
+ALL_TIME_START = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ALL_TIME_END = datetime(9999, 12, 31, tzinfo=dt_timezone.utc)
+
+PERIODS = [period for period, _ in Leaderboard.PERIOD_CHOICES]
+REBUILDS_KEY = 'leaderboard:rebuilt'
+MAX_REBUILD_STAMPS = 1000
+
+pages = TieredCache('leaderboard', timeout=60)
+
+
+def period_bounds(period, when=None):
+    """Return the (period_start, period_end) window containing ``when``"""
+    if period == 'all_time':
+        return ALL_TIME_START, ALL_TIME_END
+
+    when = timezone.localtime(when or timezone.now())
+    day = when.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'daily':
+        return day, day + timedelta(days=1)
+    if period == 'weekly':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    if period == 'monthly':
+        start = day.replace(day=1)
+        if start.month == 12:
+            return start, start.replace(year=start.year + 1, month=1)
+        return start, start.replace(month=start.month + 1)
+    raise ValueError(f"Unknown leaderboard period: {period}")
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level
+
+
+class RankedSkipList:
+    """Sorted container with O(log n) insert, remove, rank and index lookups"""
+
+    MAX_LEVEL = 16
+    BRANCHING = 4
+
+    def __init__(self, seed=None):
+        self._head = _Node(None, self.MAX_LEVEL)
+        self._size = 0
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        return self._size
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and self._random.randrange(self.BRANCHING) == 0:
+            level += 1
+        return level
+
+    def build(self, keys):
+        """Bulk-load already sorted ``keys`` into an empty list in O(n)"""
+        if self._size:
+            raise ValueError("build() requires an empty list")
+        last = [self._head] * self.MAX_LEVEL
+        last_position = [0] * self.MAX_LEVEL
+        position = 0
+        for position, key in enumerate(keys, 1):
+            node = _Node(key, self._random_level())
+            for level in range(len(node.next)):
+                last[level].next[level] = node
+                last[level].width[level] = position - last_position[level]
+                last[level] = node
+                last_position[level] = position
+        for level in range(self.MAX_LEVEL):
+            last[level].width[level] = position + 1 - last_position[level]
+        self._size = position
+
+    def insert(self, key):
+        chain = [None] * self.MAX_LEVEL
+        steps_at_level = [0] * self.MAX_LEVEL
+        node = self._head
+        for level in reversed(range(self.MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        height = self._random_level()
+        new = _Node(key, height)
+        steps = 0
+        for level in range(height):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(height, self.MAX_LEVEL):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain = [None] * self.MAX_LEVEL
+        node = self._head
+        for level in reversed(range(self.MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self.MAX_LEVEL):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def rank(self, key):
+        """1-based position of ``key``"""
+        node = self._head
+        position = 0
+        for level in reversed(range(self.MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        target = node.next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        return position + 1
+
+    def _node_at(self, index):
+        node = self._head
+        remaining = index + 1
+        for level in reversed(range(self.MAX_LEVEL)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node
+
+    def slice(self, start, stop):
+        """Keys at 0-based positions ``start`` (inclusive) to ``stop`` (exclusive)"""
+        start = max(start, 0)
+        stop = min(stop, self._size)
+        if start >= stop:
+            return []
+        node = self._node_at(start)
+        keys = []
+        for _ in range(stop - start):
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Board:
+    """Ranking for one (game, period, period_start) leaderboard"""
+
+    def __init__(self, game_id, period, period_start, period_end):
+        self.game_id = game_id
+        self.period = period
+        self.period_start = period_start
+        self.period_end = period_end
+        # user_id -> [total_score, games_played, leaderboard row id, unsaved score, unsaved games]
+        self.entries = {}
+        self.ranking = RankedSkipList()
+        self.dirty_low = None
+        self.dirty_high = None
+
+    @property
+    def key(self):
+        return (self.game_id, self.period, self.period_start)
+
+    def load(self, rows):
+        stored = {}
+        for row_id, user_id, total_score, games_played, rank in rows:
+            self.entries[user_id] = [total_score, games_played, row_id, 0, 0]
+            stored[user_id] = rank
+        keys = sorted((-entry[0], user_id) for user_id, entry in self.entries.items())
+        self.ranking.build(keys)
+        # Ranks written by a process with a stale board are fixed by the next flush.
+        moved = [rank for rank, (_, user_id) in enumerate(keys, 1) if stored[user_id] != rank]
+        if moved:
+            self._mark_dirty(moved[0], moved[-1])
+
+    def _mark_dirty(self, low, high):
+        self.dirty_low = low if self.dirty_low is None else min(self.dirty_low, low)
+        self.dirty_high = high if self.dirty_high is None else max(self.dirty_high, high)
+
+    def add(self, user_id, score, games=1):
+        """Fold a result into the board and return the player's new rank"""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            entry = self.entries[user_id] = [0, 0, None, 0, 0]
+            old_rank = None
+        else:
+            old_key = (-entry[0], user_id)
+            old_rank = self.ranking.rank(old_key)
+            self.ranking.remove(old_key)
+
+        entry[0] += score
+        entry[1] += games
+        entry[3] += score
+        entry[4] += games
+        new_key = (-entry[0], user_id)
+        self.ranking.insert(new_key)
+        new_rank = self.ranking.rank(new_key)
+
+        if old_rank is None:
+            # Everyone below a newcomer shifts down by one.
+            self._mark_dirty(new_rank, len(self.ranking))
+        else:
+            self._mark_dirty(min(old_rank, new_rank), max(old_rank, new_rank))
+        return new_rank
+
+    def rank_of(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        return self.ranking.rank((-entry[0], user_id))
+
+    def rows(self, start, stop):
+        """Entries ranked ``start`` to ``stop`` (1-based, inclusive)"""
+        results = []
+        for offset, (neg_score, user_id) in enumerate(self.ranking.slice(start - 1, stop)):
+            entry = self.entries[user_id]
+            results.append({
+                'rank': start + offset,
+                'user_id': user_id,
+                'total_score': entry[0],
+                'games_played': entry[1],
+            })
+        return results
+
+    def take_dirty(self):
+        """Rows in the changed rank range, clearing it; ``restore_dirty`` puts it back after a failed write"""
+        if self.dirty_low is None:
+            return []
+        rows = self.rows(self.dirty_low, self.dirty_high)
+        self.dirty_low = self.dirty_high = None
+        return rows
+
+    def restore_dirty(self, rows):
+        if rows:
+            self._mark_dirty(rows[0]['rank'], rows[-1]['rank'])
+
+
+def _update_rows(rows):
+    """
+    Write (total_score, games_played, rank, id) tuples with one prepared UPDATE.
+
+    A rank shift can touch most of a board. ``bulk_update`` builds a CASE
+    expression per batch whose cost grows with every row; executemany
+    reuses one statement instead.
+    """
+    qn = connection.ops.quote_name
+    sql = 'UPDATE {} SET {} = %s, {} = %s, {} = %s WHERE {} = %s'.format(
+        qn(Leaderboard._meta.db_table), qn('total_score'), qn('games_played'), qn('rank'), qn('id'),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _add_to_rows(rows):
+    """Add (score, games, id) tuples to the stored totals, so concurrent writers never overwrite each other"""
+    qn = connection.ops.quote_name
+    sql = 'UPDATE {table} SET {score} = {score} + %s, {games} = {games} + %s WHERE {id} = %s'.format(
+        table=qn(Leaderboard._meta.db_table), score=qn('total_score'), games=qn('games_played'), id=qn('id'),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _set_ranks(rows):
+    """Write (rank, id) tuples with one prepared UPDATE"""
+    qn = connection.ops.quote_name
+    sql = 'UPDATE {} SET {} = %s WHERE {} = %s'.format(qn(Leaderboard._meta.db_table), qn('rank'), qn('id'))
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _stored(board, user_ids):
+    """``{user_id: (row id, total_score, games_played)}`` of a board's rows for ``user_ids``"""
+    stored = {}
+    ids = list(user_ids)
+    for start in range(0, len(ids), 500):
+        stored.update(
+            (user_id, (row_id, total_score, games_played))
+            for row_id, user_id, total_score, games_played in Leaderboard.objects.filter(
+                game_id=board.game_id, period=board.period, period_start=board.period_start,
+                user_id__in=ids[start:start + 500],
+            ).values_list('id', 'user_id', 'total_score', 'games_played')
+        )
+    return stored
+
+
+class LeaderboardEngine:
+    """Keeps live boards in memory and writes rank changes behind in batches"""
+
+    def __init__(self, flush_size=None, flush_interval=None):
+        self.flush_size = flush_size or getattr(settings, 'LEADERBOARD_FLUSH_SIZE', 500)
+        self.flush_interval = flush_interval or getattr(settings, 'LEADERBOARD_FLUSH_INTERVAL', 5.0)
+        self._boards = {}
+        # period -> period_start of the newest bucket seen
+        self._current = {}
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        # "period|period_start" -> stamp of the last rebuild seen; None until the first check
+        self._rebuilds = None
+        self._next_rebuild_check = 0.0
+
+    @staticmethod
+    def _bucket(period, period_start):
+        return f'{period}|{period_start.isoformat()}'
+
+    def _check_rebuilds(self):
+        """Drop boards of buckets another process rebuilt since the last check"""
+        now = time.monotonic()
+        if now < self._next_rebuild_check:
+            return
+        self._next_rebuild_check = now + getattr(settings, 'CACHE_LOCAL_TTL', 2.0)
+        stamps = pages.shared.get(REBUILDS_KEY) or {}
+        if self._rebuilds is not None:
+            rebuilt = {bucket for bucket, stamp in stamps.items() if self._rebuilds.get(bucket) != stamp}
+            if rebuilt:
+                for key in [key for key in self._boards if self._bucket(key[1], key[2]) in rebuilt]:
+                    del self._boards[key]
+        self._rebuilds = stamps
+
+    def board(self, game_id, period, when=None):
+        period_start, period_end = period_bounds(period, when)
+        key = (game_id, period, period_start)
+        with self._lock:
+            self._check_rebuilds()
+            board = self._boards.get(key)
+            if board is None:
+                board = Board(game_id, period, period_start, period_end)
+                # Boards are written back to the table, so they load from the primary even
+                # when first touched by a view reading from a replica.
+                with primary():
+                    board.load(
+                        Leaderboard.objects.filter(
+                            game_id=game_id, period=period, period_start=period_start
+                        ).values_list('id', 'user_id', 'total_score', 'games_played', 'rank')
+                    )
+                self._boards[key] = board
+                self._roll_over(period, period_start)
+            return board
+
+    def _roll_over(self, period, period_start):
+        """Retire every board of an earlier bucket once a newer one has started"""
+        current = self._current.get(period)
+        if current is not None and current >= period_start:
+            return
+        self._current[period] = period_start
+        expired = [key for key in self._boards if key[1] == period and key[2] < period_start]
+        if expired:
+            self.flush()
+            for key in expired:
+                # The flush may already have dropped a stale one.
+                self._boards.pop(key, None)
+
+    def discard(self, period, period_start):
+        """Drop every board in a bucket, here and in every other process, so the next read reloads it"""
+        bucket = self._bucket(period, period_start)
+        stamps = pages.shared.get(REBUILDS_KEY) or {}
+        stamps.pop(bucket, None)
+        stamps[bucket] = secrets.token_hex(4)
+        while len(stamps) > MAX_REBUILD_STAMPS:
+            del stamps[next(iter(stamps))]
+        pages.shared.set(REBUILDS_KEY, stamps, timeout=None)
+        with self._lock:
+            for key in [key for key in self._boards if key[1] == period and key[2] == period_start]:
+                del self._boards[key]
+            if self._rebuilds is not None:
+                self._rebuilds[bucket] = stamps[bucket]
+        pages.bump()
+
+    def record(self, user_id, game_id, score, when=None, games=1):
+        """Fold one completed session (or, with ``games=0``, a score adjustment) into its boards for every period"""
+        with self._lock:
+            for period in PERIODS:
+                self.board(game_id, period, when).add(user_id, score, games)
+                self.board(None, period, when).add(user_id, score, games)
+            self._pending += 1
+            if (self._pending >= self.flush_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self.flush()
+
+    def record_session(self, session):
+        self.record(session.user_id, session.game_id, session.score, session.end_time)
+
+    def top(self, game_id, period, limit=10, when=None):
+        with self._lock:
+            return self.board(game_id, period, when).rows(1, limit)
+
+    def around(self, game_id, period, user_id, radius=5, when=None):
+        """The player's own entry plus ``radius`` neighbours on either side"""
+        with self._lock:
+            board = self.board(game_id, period, when)
+            rank = board.rank_of(user_id)
+            if rank is None:
+                return None, []
+            return rank, board.rows(max(rank - radius, 1), rank + radius)
+
+    def flush(self):
+        """Persist the scores and ranks that changed since the last flush"""
+        with self._lock:
+            taken = [(board, board.take_dirty()) for board in self._boards.values()]
+            taken = [(board, rows) for board, rows in taken if rows]
+            if taken:
+                try:
+                    with transaction.atomic():
+                        stale, saved = self._write(taken)
+                        transaction.on_commit(pages.bump)
+                except Exception:
+                    # Nothing was written: keep the ranges dirty and the deltas unsaved for the next flush.
+                    for board, rows in taken:
+                        board.restore_dirty(rows)
+                    raise
+                for entry, row_id in saved:
+                    entry[2] = row_id
+                    entry[3] = entry[4] = 0
+                # Reloaded on next use, with every process's sessions.
+                for board in stale:
+                    self._boards.pop(board.key, None)
+
+            self._pending = 0
+            self._last_flush = time.monotonic()
+
+    def _write(self, taken):
+        """Apply the boards' deltas and ranks; returns the stale boards and the (entry, row id) pairs saved"""
+        creates = [
+            Leaderboard(user_id=row['user_id'], game_id=board.game_id, period=board.period,
+                        period_start=board.period_start, period_end=board.period_end, rank=row['rank'])
+            for board, rows in taken for row in rows if board.entries[row['user_id']][2] is None
+        ]
+        # Another process may have created some of them first; its rows are added to below.
+        Leaderboard.objects.bulk_create(creates, batch_size=self.flush_size, ignore_conflicts=True)
+
+        stored, deltas = {}, []
+        for board, rows in taken:
+            changed = [row['user_id'] for row in rows if board.entries[row['user_id']][3:] != [0, 0]
+                       or board.entries[row['user_id']][2] is None]
+            stored[board.key] = _stored(board, changed)
+            for user_id in changed:
+                entry = board.entries[user_id]
+                deltas.append((entry[3], entry[4], stored[board.key][user_id][0]))
+        _add_to_rows(deltas)
+
+        stale, ranks, saved = [], [], []
+        for board, rows in taken:
+            after = _stored(board, stored[board.key])
+            if any(after[user_id][1:] != tuple(board.entries[user_id][:2]) for user_id in after):
+                stale.append(board)
+                continue
+            for row in rows:
+                entry = board.entries[row['user_id']]
+                row_id = entry[2] if entry[2] is not None else after[row['user_id']][0]
+                ranks.append((row['rank'], row_id))
+                saved.append((entry, row_id))
+        _set_ranks(ranks)
+        return stale, saved
+
+
+engine = LeaderboardEngine()
+atexit.register(engine.flush)
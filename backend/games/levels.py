@@ -0,0 +1,107 @@
+"""
+Experience points and levels.
+
+A session earns ``XP_PER_GAME`` scaled by the fraction of the game's
+``max_score`` reached and by the game's difficulty multiplier. Levels come
+from a precomputed threshold table: reaching level ``n`` takes
+``XP_LEVEL_BASE * (n - 1) ** XP_LEVEL_EXPONENT`` experience in total, up to
+``XP_MAX_LEVEL``. Looking a level up is a binary search of that table.
+
+Experience is only ever added with F() updates, by ``credit`` for both
+``GameSession.complete`` and the submission buffer. ``relevel`` then sets
+``User.level`` with an UPDATE guarded by the XP band of the new level, so a
+concurrent award that moves the user into another band is never
+overwritten with a stale level. After retuning the curve, the
+``relevel_users`` command re-levels everyone in bulk.
+"""
+
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import F
+
+from users import profiles
+from users.models import User
+
+
+DIFFICULTY_MULTIPLIERS = {'easy': 1.0, 'medium': 1.5, 'hard': 2.0}
+
+
+class LevelCurve:
+    """Total experience needed for each level, as a sorted table"""
+
+    def __init__(self, base=None, exponent=None, max_level=None):
+        self.base = base or getattr(settings, 'XP_LEVEL_BASE', 100)
+        self.exponent = exponent or getattr(settings, 'XP_LEVEL_EXPONENT', 1.5)
+        self.max_level = max_level or getattr(settings, 'XP_MAX_LEVEL', 100)
+        # thresholds[n - 1] is the experience at which level n starts; level 1 starts at 0.
+        self.thresholds = [round(self.base * level ** self.exponent) for level in range(self.max_level)]
+
+    def level_for(self, experience):
+        return max(bisect_right(self.thresholds, experience), 1)
+
+    def band(self, level):
+        """[low, high) experience range of a level; high is None at the top level"""
+        high = self.thresholds[level] if level < self.max_level else None
+        return self.thresholds[level - 1], high
+
+    def progress(self, experience):
+        level = self.level_for(experience)
+        low, high = self.band(level)
+        return {
+            'level': level,
+            'experience_points': experience,
+            'level_experience': low,
+            'next_level_experience': high,
+            'level_progress': round((experience - low) / (high - low), 4) if high is not None else 1.0,
+        }
+
+
+curve = LevelCurve()
+
+
+def experience_for(game, score):
+    """Experience awarded for a completed session"""
+    if game.max_score <= 0:
+        return 0
+    ratio = min(max(score, 0) / game.max_score, 1.0)
+    multiplier = getattr(settings, 'XP_DIFFICULTY_MULTIPLIERS', DIFFICULTY_MULTIPLIERS).get(game.difficulty, 1.0)
+    return round(getattr(settings, 'XP_PER_GAME', 100) * ratio * multiplier)
+
+
+def credit(totals, batch_size=None):
+    """Add ``{user_id: (score, games, experience)}`` to the users' totals and re-level them"""
+    users = []
+    for user_id, (score, games, experience) in totals.items():
+        user = User(pk=user_id)
+        user.total_score = F('total_score') + score
+        user.games_played = F('games_played') + games
+        user.experience_points = F('experience_points') + experience
+        users.append(user)
+    User.objects.bulk_update(users, ['total_score', 'games_played', 'experience_points'], batch_size=batch_size)
+    relevel(list(totals))
+    profiles.invalidate(totals)
+
+
+def relevel(user_ids, table=None):
+    """Bring ``User.level`` in line with experience; returns users changed"""
+    table = table or curve
+    targets = defaultdict(list)
+    for user_id, experience, level in User.objects.filter(pk__in=user_ids).values_list(
+        'id', 'experience_points', 'level'
+    ):
+        target = table.level_for(experience)
+        if target != level:
+            targets[target].append(user_id)
+
+    changed = 0
+    for level, ids in targets.items():
+        low, high = table.band(level)
+        users = User.objects.filter(pk__in=ids)
+        if level > 1:
+            users = users.filter(experience_points__gte=low)
+        if high is not None:
+            users = users.filter(experience_points__lt=high)
+        changed += users.update(level=level)
+    return changed
@@ -0,0 +1,192 @@
+"""
+Coalesced live leaderboard diffs.
+
+Completed sessions only mark their boards as changed. Every
+``LEADERBOARD_PUSH_INTERVAL`` seconds a ticker thread re-reads the top
+``LEADERBOARD_PUSH_DEPTH`` rows of each changed board that somebody is
+watching, diffs them against what it last published, and publishes one
+frame per board. However many scores changed during a tick, each watched
+board costs at most one encoded frame, shared by all of its subscribers.
+
+Frames carry a per-board ``seq``. A watcher subscribes first and then
+takes a snapshot, and applies only diffs with a higher ``seq``, so no
+change is missed or applied twice.
+"""
+
+import json
+import threading
+import time
+
+from django.conf import settings
+
+from users.models import User
+
+from .leaderboard import engine, period_bounds
+from .pubsub import get_broker
+
+
+def topic_for(game_id, period):
+    return f"leaderboard:{game_id or 'all'}:{period}"
+
+
+class _BoardState:
+    def __init__(self, period_start):
+        self.seq = 0
+        self.period_start = period_start
+        # user_id -> (rank, total_score, games_played)
+        self.rows = {}
+
+
+class LiveBoards:
+    """Tracks watched boards and publishes per-tick rank diffs"""
+
+    def __init__(self, interval=None, depth=None):
+        self.interval = interval or getattr(settings, 'LEADERBOARD_PUSH_INTERVAL', 0.5)
+        self.depth = depth or getattr(settings, 'LEADERBOARD_PUSH_DEPTH', 50)
+        self._watchers = {}
+        self._states = {}
+        self._changed = set()
+        self._usernames = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.metrics = {'changes': 0, 'ticks': 0, 'frames': 0}
+
+    def mark(self, game_id):
+        """Note that a session for ``game_id`` completed (feeds its board and the overall one)"""
+        if not self._watchers:
+            return
+        with self._lock:
+            self._changed.add(game_id)
+            self._changed.add(None)
+            self.metrics['changes'] += 1
+
+    def watch(self, game_id, period):
+        """Register a watcher and return (seq, snapshot frame) for the board"""
+        key = (game_id, period)
+        with self._lock:
+            self._watchers[key] = self._watchers.get(key, 0) + 1
+            state = self._states.get(key)
+            if state is None:
+                state = _BoardState(period_bounds(period)[0])
+                state.rows = self._top(key)
+                self._states[key] = state
+            seq = state.seq
+            frame = self._encode('snapshot', key, state.period_start, seq, self._rows(state.rows, state.rows, {}), [])
+        self._ensure_ticker()
+        return seq, frame
+
+    def unwatch(self, game_id, period):
+        key = (game_id, period)
+        with self._lock:
+            remaining = self._watchers.get(key, 0) - 1
+            if remaining > 0:
+                self._watchers[key] = remaining
+            else:
+                self._watchers.pop(key, None)
+                self._states.pop(key, None)
+
+    def _top(self, key):
+        game_id, period = key
+        return {
+            row['user_id']: (row['rank'], row['total_score'], row['games_played'])
+            for row in engine.top(game_id, period, self.depth)
+        }
+
+    def _rows(self, current, user_ids, previous):
+        missing = [user_id for user_id in user_ids if user_id not in self._usernames]
+        if missing:
+            self._usernames.update(User.objects.filter(id__in=missing).values_list('id', 'username'))
+        rows = []
+        for user_id in user_ids:
+            rank, total_score, games_played = current[user_id]
+            before = previous.get(user_id)
+            rows.append({
+                'rank': rank,
+                'previous_rank': before[0] if before else None,
+                'user_id': user_id,
+                'username': self._usernames.get(user_id),
+                'total_score': total_score,
+                'games_played': games_played,
+            })
+        rows.sort(key=lambda row: row['rank'])
+        return rows
+
+    def _encode(self, kind, key, period_start, seq, rows, removed):
+        game_id, period = key
+        return json.dumps({
+            'type': kind,
+            'game': game_id,
+            'period': period,
+            'period_start': period_start.isoformat(),
+            'seq': seq,
+            'rows': rows,
+            'removed': removed,
+        }, separators=(',', ':'))
+
+    def _frame(self, key, state):
+        """``(period_start, rows, frame)`` bringing watchers of one board up to date, or None if unchanged"""
+        period_start = period_bounds(key[1])[0]
+        current = self._top(key)
+        if period_start != state.period_start:
+            # A new bucket started: watchers replace their board wholesale.
+            return period_start, current, self._encode('snapshot', key, period_start, state.seq + 1,
+                                                       self._rows(current, current, {}), [])
+        updated = [user_id for user_id, row in current.items() if state.rows.get(user_id) != row]
+        removed = [user_id for user_id in state.rows if user_id not in current]
+        if not updated and not removed:
+            return None
+        return period_start, current, self._encode('diff', key, period_start, state.seq + 1,
+                                                   self._rows(current, updated, state.rows), removed)
+
+    def tick(self):
+        """Publish one frame per changed, watched board; returns the number published"""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            boards = [
+                (key, state, state.seq) for key, state in self._states.items()
+                if key[0] in changed or period_bounds(key[1])[0] != state.period_start
+            ]
+        # Reading the boards and encoding frames happens outside the lock, so mark() and watch() never wait on it.
+        frames = []
+        for key, state, seq in boards:
+            frame = self._frame(key, state)
+            if frame is not None:
+                frames.append((key, state, seq, frame))
+
+        published = []
+        with self._lock:
+            for key, state, seq, (period_start, current, frame) in frames:
+                if self._states.get(key) is not state or state.seq != seq:
+                    # Unwatched meanwhile, or replaced: nothing to publish against.
+                    continue
+                state.seq += 1
+                state.period_start = period_start
+                state.rows = current
+                published.append((topic_for(*key), (state.seq, frame)))
+            self.metrics['ticks'] += 1
+            self.metrics['frames'] += len(published)
+        # Watchers subscribe before they snapshot, so a frame published after the swap is never missed.
+        broker = get_broker()
+        for topic, message in published:
+            broker.publish(topic, message)
+        return len(published)
+
+    def _ensure_ticker(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='leaderboard-ticker', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.tick()
+            except Exception:
+                # A failed read leaves the board marked for the next tick.
+                with self._lock:
+                    self._changed.update(key[0] for key in self._states)
+
+
+live_boards = LiveBoards()
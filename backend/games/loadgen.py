@@ -0,0 +1,136 @@
+"""
+In-process load driver for the JSON API.
+
+Virtual players replay register -> login -> submit x N -> stats against
+the WSGI handler (``django.test.Client`` on a thread pool) or the ASGI
+handler (``django.test.AsyncClient`` on one event loop), and latencies
+are reported per URL name.
+"""
+
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from .models import Game
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class LoadReport:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+        self.started = self.finished = None
+
+    def add(self, name, seconds, status):
+        with self._lock:
+            self.samples[name].append(seconds)
+            if status >= 400:
+                self.errors[name] += 1
+
+    def summary(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        rows = []
+        for name, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            rows.append({
+                'endpoint': name,
+                'requests': len(ordered),
+                'errors': self.errors[name],
+                'rps': len(ordered) / elapsed if elapsed else 0.0,
+                'p50_ms': percentile(ordered, 0.50) * 1000,
+                'p95_ms': percentile(ordered, 0.95) * 1000,
+                'p99_ms': percentile(ordered, 0.99) * 1000,
+            })
+        return elapsed, rows
+
+
+class Scenario:
+    """One virtual player's request sequence"""
+
+    def __init__(self, number, run_id, game_ids, submits, rng):
+        self.username = f'load{run_id}-{number}'
+        self.email = f'{self.username}@example.com'
+        self.password = f'pw-{self.username}'
+        self.steps = [
+            ('user-register', '/api/auth/register/', {
+                'username': self.username, 'email': self.email, 'password': self.password,
+            }),
+            ('user-login', '/api/auth/login/', {'email': self.email, 'password': self.password}),
+        ]
+        for _ in range(submits):
+            game_id, max_score, time_limit = rng.choice(game_ids)
+            self.steps.append(('game-submit', f'/api/games/{game_id}/submit/', {
+                'score': rng.randint(0, max_score),
+                'time_taken': rng.randint(1, time_limit or 600),
+            }))
+        self.steps.append(('user-stats', '/api/games/stats/', None))
+
+
+def _scenarios(players, submits, seed):
+    rng = random.Random(seed)
+    game_ids = list(Game.objects.filter(is_active=True).values_list('id', 'max_score', 'time_limit'))
+    if not game_ids:
+        raise ValueError('No active games; run seed_data first')
+    run_id = f'{seed}x{int(time.time())}'
+    return [Scenario(n, run_id, game_ids, submits, rng) for n in range(players)]
+
+
+def _run_wsgi(scenario, report):
+    client = Client()
+    for name, path, body in scenario.steps:
+        started = time.perf_counter()
+        if body is None:
+            response = client.get(path)
+        else:
+            response = client.post(path, json.dumps(body), content_type='application/json')
+        report.add(name, time.perf_counter() - started, response.status_code)
+
+
+async def _run_asgi(scenario, report, semaphore):
+    async with semaphore:
+        client = AsyncClient()
+        for name, path, body in scenario.steps:
+            started = time.perf_counter()
+            if body is None:
+                response = await client.get(path)
+            else:
+                response = await client.post(path, json.dumps(body), content_type='application/json')
+            report.add(name, time.perf_counter() - started, response.status_code)
+
+
+def run(players=50, concurrency=8, submits=5, interface='wsgi', seed=0):
+    """Replay ``players`` scenarios and return a LoadReport"""
+    scenarios = _scenarios(players, submits, seed)
+    report = LoadReport()
+
+    async def run_asgi():
+        semaphore = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*(_run_asgi(scenario, report, semaphore) for scenario in scenarios))
+
+    # The test clients always send Host: testserver.
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        report.started = time.perf_counter()
+        if interface == 'asgi':
+            asyncio.run(run_asgi())
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(lambda scenario: _run_wsgi(scenario, report), scenarios))
+        report.finished = time.perf_counter()
+    return report
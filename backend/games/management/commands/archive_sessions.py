@@ -0,0 +1,33 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from games import archive
+
+
+class Command(BaseCommand):
+    help = "Move finished sessions older than a cutoff from the live table into ARCHIVE_DIR segments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', default=None,
+                            help="Archive sessions started before this date, YYYY-MM-DD in UTC "
+                                 "(default: the month ARCHIVE_AFTER_DAYS ago began)")
+        parser.add_argument('--segment-rows', type=int, default=archive.SEGMENT_ROWS,
+                            help="Most sessions per segment file, and per delete transaction")
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                before = datetime.strptime(options['before'], '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+            except ValueError:
+                raise CommandError("--before must be YYYY-MM-DD")
+        else:
+            before = archive.default_cutoff()
+        started = time.perf_counter()
+        moved, segments = archive.archive(before, options['segment_rows'])
+        seconds = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} sessions started before {before:%Y-%m-%d} into {segments} segments "
+            f"in {seconds:.2f}s ({moved / seconds if seconds else 0:.0f}/s)"
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from games.achievements import backfill
+
+
+class Command(BaseCommand):
+    help = "Award achievements retroactively from completed GameSession history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help="Limit to these user ids")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        submitted = backfill(chunk_size=options['chunk_size'], user_ids=options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f"Evaluated {submitted} achievement awards"))
@@ -0,0 +1,35 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from games import contention
+
+
+class Command(BaseCommand):
+    help = "Measure concurrent session submissions against SQLite with and without the production profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help="Server processes sharing the database")
+        parser.add_argument('--threads', type=int, default=4, help="Submitting threads per process")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per mode")
+        parser.add_argument('--mode', choices=[*contention.MODES, 'all'], default='all')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        modes = contention.MODES if options['mode'] == 'all' else [options['mode']]
+        self.stdout.write(
+            f"{options['processes']} processes x {options['threads']} threads, {options['duration']:.0f}s per mode, "
+            f"{os.cpu_count() or 1} core(s); each mode runs on a scratch copy of the database"
+        )
+        self.stdout.write(f"{'mode':<12}{'submits':>9}{'locked':>8}{'errors':>8}{'submit/s':>10}"
+                          f"{'p50 ms':>9}{'p99 ms':>9}{'reads/s':>9}")
+        for mode in modes:
+            try:
+                row = contention.run(mode, options['processes'], options['threads'], options['duration'],
+                                     options['seed'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(
+                f"{mode:<12}{row['ok']:>9}{row['locked']:>8}{row['errors']:>8}{row['submits_per_second']:>10.1f}"
+                f"{row['p50_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['reads_per_second']:>9.1f}"
+            )
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from games import distributions
+
+
+class Command(BaseCommand):
+    help = "Write the memory-mapped score distribution snapshot, in full or by merging newer sessions into it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--merge', action='store_true',
+                            help="Merge sessions since the last snapshot instead of reading the whole log")
+        parser.add_argument('--chunk-size', type=int, default=distributions.BUILD_CHUNK_SIZE,
+                            help="Score events per pass of a full build")
+        parser.add_argument('--interval', type=float, default=None,
+                            help="Keep merging every N seconds after the first run")
+
+    def handle(self, *args, **options):
+        merge = options['merge']
+        while True:
+            started = time.perf_counter()
+            try:
+                if merge:
+                    index = distributions.distributions.merge()
+                else:
+                    index = distributions.build(options['chunk_size'])
+            except distributions.SnapshotMissing as e:
+                raise CommandError(str(e))
+            sessions = sum(end - start for key, (start, end) in index['segments'].items() if key.startswith('game/'))
+            self.stdout.write(self.style.SUCCESS(
+                f"{'Merged' if merge else 'Built'} a snapshot of {sessions} sessions through event "
+                f"{index['through_event']} in {time.perf_counter() - started:.1f}s ({index['file']})"
+            ))
+            if not options['interval']:
+                return
+            merge = True
+            time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from games.query_plans import check_plans, hot_queries
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the games app's hot queries and fail on full scans or temp B-tree sorts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, default=1, help="User id to bind into user-scoped queries")
+        parser.add_argument('--game', type=int, default=1, help="Game id to bind into game-scoped queries")
+        parser.add_argument('--analyze', action='store_true',
+                            help="Refresh planner statistics first; plans on a seeded database depend on them")
+
+    def handle(self, *args, **options):
+        if options['analyze']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        failures = 0
+        for name, plan, problems in check_plans(hot_queries(options['user'], options['game'])):
+            if problems:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"FAIL {name}: {', '.join(problems)}"))
+            else:
+                self.stdout.write(f"ok   {name}")
+            if problems or options['verbosity'] > 1:
+                self.stdout.write('\n'.join(f"       {line}" for line in plan.splitlines()))
+
+        if failures:
+            raise CommandError(f"{failures} hot queries no longer use an index")
+        self.stdout.write(self.style.SUCCESS("All hot query plans use indexes"))
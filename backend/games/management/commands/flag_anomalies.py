@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from games import anticheat
+
+
+def _format(value):
+    return '-' if value is None else f'{value:.2f}'
+
+
+class Command(BaseCommand):
+    help = "Recompute per-game score baselines and flag implausible completed sessions for review"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=anticheat.SCAN_CHUNK_SIZE, help="Session ids per pass")
+        parser.add_argument('--dry-run', action='store_true', help="Report baselines and flags without writing them")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        baselines, scanned, flagged = anticheat.scan(options['chunk_size'], options['dry_run'])
+        elapsed = time.perf_counter() - started
+        if options['verbosity'] > 1:
+            for baseline in baselines:
+                self.stdout.write(
+                    f"  game {baseline.game_id}: {baseline.sessions} sessions, score median "
+                    f"{baseline.score_median:.1f} MAD {baseline.score_mad:.1f} ceiling {_format(baseline.score_ceiling)}, "
+                    f"points/s median {_format(baseline.rate_median)} ceiling {_format(baseline.rate_ceiling)}"
+                )
+        verb = "would flag" if options['dry_run'] else "flagged"
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {scanned} sessions of {len(baselines)} games with a baseline, {verb} {flagged} in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from games import loadgen
+
+
+class Command(BaseCommand):
+    help = "Replay register/login/submit/stats traffic in-process and report latency per endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=50, help="Virtual players to replay")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--submits', type=int, default=5, help="Sessions submitted per player")
+        parser.add_argument('--interface', choices=['wsgi', 'asgi', 'both'], default='wsgi',
+                            help="'both' runs WSGI then ASGI and compares throughput")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        interfaces = ['wsgi', 'asgi'] if options['interface'] == 'both' else [options['interface']]
+        throughput = {}
+        for interface in interfaces:
+            try:
+                report = loadgen.run(
+                    players=options['players'],
+                    concurrency=options['concurrency'],
+                    submits=options['submits'],
+                    interface=interface,
+                    seed=options['seed'],
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+            throughput[interface] = self.print_report(interface, report, options['concurrency'])
+
+        if len(throughput) == 2 and throughput['wsgi']:
+            self.stdout.write(
+                f"ASGI/WSGI throughput: {throughput['asgi'] / throughput['wsgi']:.2f}x "
+                f"({throughput['asgi']:.1f} vs {throughput['wsgi']:.1f} req/s)"
+            )
+
+    def print_report(self, interface, report, concurrency):
+        elapsed, rows = report.summary()
+        total = sum(row['requests'] for row in rows)
+        self.stdout.write(
+            f"{interface.upper()} - {elapsed:.2f}s, concurrency {concurrency}, {total / elapsed:.1f} req/s"
+        )
+        self.stdout.write(f"{'endpoint':<16}{'requests':>9}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['endpoint']:<16}{row['requests']:>9}{row['errors']:>8}{row['rps']:>10.1f}"
+                f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+            )
+        return total / elapsed if elapsed else 0.0
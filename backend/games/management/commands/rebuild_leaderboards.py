@@ -0,0 +1,43 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from games.leaderboard import PERIODS
+from games.rollups import rebuild_window
+
+
+class Command(BaseCommand):
+    help = "Rebuild period leaderboards for a date window from the score event log"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', choices=PERIODS, action='append', dest='periods',
+                            help="Periods to rebuild (default: all)")
+        parser.add_argument('--start', help="First day of the window (YYYY-MM-DD, default: today)")
+        parser.add_argument('--end', help="Last day of the window, inclusive (default: start)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def _day(self, value, default):
+        if value is None:
+            return default
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date: {value}")
+        return day
+
+    def handle(self, *args, **options):
+        start_day = self._day(options['start'], timezone.localdate())
+        end_day = self._day(options['end'], start_day)
+        if end_day < start_day:
+            raise CommandError("--end must not be before --start")
+
+        tz = timezone.get_current_timezone()
+        start = timezone.make_aware(datetime.combine(start_day, time.min), tz)
+        end = timezone.make_aware(datetime.combine(end_day + timedelta(days=1), time.min), tz)
+
+        for period in options['periods'] or PERIODS:
+            written = rebuild_window(period, start, end, options['batch_size'])
+            for period_start, rows in written.items():
+                self.stdout.write(f"{period} {period_start:%Y-%m-%d}: {rows} rows")
+        self.stdout.write(self.style.SUCCESS("Leaderboards rebuilt"))
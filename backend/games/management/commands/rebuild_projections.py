@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from games.leaderboard import PERIODS, period_bounds
+from games.models import ScoreEvent
+from games.projections import rebuild
+from games.rollups import rebuild_bucket, rebuild_window
+
+
+class Command(BaseCommand):
+    help = "Replay the score event log into user totals, stats, achievements and leaderboards"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Processes folding partitions in parallel (default: one per core; 1 runs inline)")
+        parser.add_argument('--chunk-users', type=int, default=5000, help="User ids per partition")
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help="Limit to these user ids")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--leaderboards', choices=['live', 'all', 'none'], default='live',
+                            help="Rebuild the current bucket of each period, every bucket in the log, or none")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        users = rebuild(
+            workers=options['workers'],
+            chunk_users=options['chunk_users'],
+            user_ids=options['user_ids'],
+            batch_size=options['batch_size'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(f"Projected {users} users in {time.perf_counter() - started:.1f}s")
+
+        if options['leaderboards'] == 'live':
+            for period in PERIODS:
+                rows = rebuild_bucket(period, *period_bounds(period), batch_size=options['batch_size'])
+                self.stdout.write(f"  {rows} {period} leaderboard rows")
+        elif options['leaderboards'] == 'all':
+            first = ScoreEvent.objects.order_by('occurred_at').values_list('occurred_at', flat=True).first()
+            if first is not None:
+                for period in PERIODS:
+                    written = rebuild_window(period, first, timezone.now(), options['batch_size'])
+                    self.stdout.write(f"  {sum(written.values())} {period} leaderboard rows in {len(written)} buckets")
+
+        self.stdout.write(self.style.SUCCESS(f"Projections rebuilt in {time.perf_counter() - started:.1f}s"))
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from games.models import UserGameStats, UserStats
+from games.stats import STAT_FIELDS, STREAK_FIELDS, compute_from_sessions
+
+
+class Command(BaseCommand):
+    help = "Rebuild or verify UserStats/UserGameStats from completed GameSession rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help="Limit to these user ids")
+        parser.add_argument('--verify', action='store_true', help="Compare stored stats instead of rewriting them")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        per_user, per_game = compute_from_sessions(user_ids)
+
+        if options['verify']:
+            self.verify(user_ids, per_user, per_game)
+            return
+
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            user_stats = UserStats.objects.all()
+            game_stats = UserGameStats.objects.all()
+            if user_ids:
+                user_stats = user_stats.filter(user_id__in=user_ids)
+                game_stats = game_stats.filter(user_id__in=user_ids)
+            user_stats.delete()
+            game_stats.delete()
+
+            UserStats.objects.bulk_create(
+                (UserStats(user_id=user_id, **values) for user_id, values in per_user.items()),
+                batch_size=batch_size,
+            )
+            UserGameStats.objects.bulk_create(
+                (UserGameStats(user_id=user_id, game_id=game_id, **values)
+                 for (user_id, game_id), values in per_game.items()),
+                batch_size=batch_size,
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt stats for {len(per_user)} users ({len(per_game)} per-game rows)"
+        ))
+
+    def verify(self, user_ids, per_user, per_game):
+        stored_users = UserStats.objects.all()
+        stored_games = UserGameStats.objects.all()
+        if user_ids:
+            stored_users = stored_users.filter(user_id__in=user_ids)
+            stored_games = stored_games.filter(user_id__in=user_ids)
+
+        mismatches = 0
+        for label, expected, stored in (
+            ('user', per_user, {
+                row.pop('user_id'): row for row in stored_users.values('user_id', *STAT_FIELDS, *STREAK_FIELDS)
+            }),
+            ('user/game', per_game, {
+                (row.pop('user_id'), row.pop('game_id')): row
+                for row in stored_games.values('user_id', 'game_id', *STAT_FIELDS)
+            }),
+        ):
+            for key in expected.keys() | stored.keys():
+                if expected.get(key) != stored.get(key):
+                    mismatches += 1
+                    self.stdout.write(f"{label} {key}: stored={stored.get(key)} expected={expected.get(key)}")
+
+        if mismatches:
+            raise CommandError(f"{mismatches} stats rows differ from GameSession history")
+        self.stdout.write(self.style.SUCCESS(f"Stats for {len(per_user)} users match GameSession history"))
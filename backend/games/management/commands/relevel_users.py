@@ -0,0 +1,78 @@
+import time
+from collections import Counter
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Min
+
+from games.levels import LevelCurve, curve
+from users.models import User
+from users.profiles import profile_cache
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's level from experience points after the level curve is retuned"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=50000, help="User ids per pass")
+        parser.add_argument('--dry-run', action='store_true', help="Report level changes without writing them")
+        parser.add_argument('--base', type=float, help="Preview another XP_LEVEL_BASE (needs --dry-run)")
+        parser.add_argument('--exponent', type=float, help="Preview another XP_LEVEL_EXPONENT (needs --dry-run)")
+        parser.add_argument('--max-level', type=int, help="Preview another XP_MAX_LEVEL (needs --dry-run)")
+
+    def handle(self, *args, **options):
+        overrides = [options['base'], options['exponent'], options['max_level']]
+        if any(overrides) and not options['dry_run']:
+            # Live awards level users with the settings curve; writing another one would fight it.
+            raise CommandError("Curve overrides are only a preview; change the XP_LEVEL_* settings to apply them")
+        table = LevelCurve(*overrides) if any(overrides) else curve
+        thresholds = np.array(table.thresholds, dtype=np.int64)
+
+        started = time.perf_counter()
+        bounds = User.objects.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            self.stdout.write("No users")
+            return
+
+        scanned = changed = 0
+        moves = Counter()
+        chunk_size = options['chunk_size']
+        for low in range(bounds['low'], bounds['high'] + 1, chunk_size):
+            high = low + chunk_size
+            rows = np.array(
+                User.objects.filter(id__gte=low, id__lt=high).values_list('experience_points', 'level'),
+                dtype=np.int64,
+            ).reshape(-1, 2)
+            if not len(rows):
+                continue
+            experience, current = rows[:, 0], rows[:, 1]
+            target = np.maximum(np.searchsorted(thresholds, experience, side='right'), 1)
+            differs = target != current
+            scanned += len(rows)
+            changed += int(differs.sum())
+            moves.update(zip(current[differs].tolist(), target[differs].tolist()))
+            if options['dry_run'] or not differs.any():
+                continue
+
+            # One UPDATE per level that gained users, guarded by that level's XP band so a
+            # concurrent award is never overwritten with a stale level.
+            with transaction.atomic():
+                for level in np.unique(target[differs]).tolist():
+                    band_low, band_high = table.band(level)
+                    users = User.objects.filter(id__gte=low, id__lt=high).exclude(level=level)
+                    if level > 1:
+                        users = users.filter(experience_points__gte=band_low)
+                    if band_high is not None:
+                        users = users.filter(experience_points__lt=band_high)
+                    users.update(level=level)
+
+        if changed and not options['dry_run']:
+            profile_cache.bump()
+        if options['verbosity'] > 1:
+            for (before, after), count in sorted(moves.items()):
+                self.stdout.write(f"  level {before} -> {after}: {count} users")
+        verb = "would change" if options['dry_run'] else "changed"
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {scanned} users, {changed} {verb} level in {time.perf_counter() - started:.1f}s"
+        ))
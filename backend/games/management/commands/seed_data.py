@@ -0,0 +1,62 @@
+import time
+from datetime import datetime, time as day_start
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from games.seeding import SEED_NOW, SEED_PASSWORD, SeedError, Seeder
+
+
+class Command(BaseCommand):
+    help = "Bulk-load deterministic synthetic users, sessions, achievements and leaderboards"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed yields the same data")
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--first-user', type=int, default=0,
+                            help="Number of the first player (playerN) to create, to add players to a seeded database")
+        parser.add_argument('--now', default=None,
+                            help=f"Day the generated history ends, YYYY-MM-DD (default: {SEED_NOW:%Y-%m-%d}); "
+                                 f"pass today's date for live daily and weekly leaderboards")
+        parser.add_argument('--games', type=int, default=20, help="Total active games to ensure")
+        parser.add_argument('--sessions-per-user', type=float, default=20, help="Mean sessions per user")
+        parser.add_argument('--days', type=int, default=90, help="How far back sessions are spread")
+        parser.add_argument('--questions-per-pack', type=int, default=100,
+                            help="Question bank entries per game and difficulty, for games without any")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--skip-derived', action='store_true',
+                            help="Do not rebuild stats, achievements and leaderboards afterwards")
+
+    def handle(self, *args, **options):
+        now = None
+        if options['now']:
+            try:
+                day = parse_date(options['now'])
+            except ValueError:
+                day = None
+            if day is None:
+                raise CommandError("--now must be a YYYY-MM-DD date")
+            now = timezone.make_aware(datetime.combine(day, day_start.max))
+        started = time.perf_counter()
+        seeder = Seeder(options['seed'], options['days'], options['batch_size'], self.stdout, now)
+
+        games = seeder.games(options['games'])
+        seeder.achievements()
+        self.stdout.write(f"{len(games)} active games")
+        try:
+            users, sessions = seeder.users(
+                options['users'], games, options['sessions_per_user'], options['first_user']
+            )
+        except SeedError as e:
+            raise CommandError(str(e))
+        questions = seeder.questions(games, options['questions_per_pack'])
+        self.stdout.write(f"{questions} questions")
+        if not options['skip_derived']:
+            self.stdout.write("Building derived tables")
+            seeder.derived()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {users} users and {sessions} sessions in {time.perf_counter() - started:.1f}s "
+            f"(password for every seeded user: {SEED_PASSWORD})"
+        ))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from games.sweeper import sweeper
+
+
+class Command(BaseCommand):
+    help = "Mark sessions still open past their game's time limit plus SESSION_SWEEP_GRACE as abandoned"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help="Open sessions per UPDATE (default: SESSION_SWEEP_CHUNK)")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between chunks, leaving the write lock to others")
+        parser.add_argument('--interval', type=float, default=None,
+                            help="Keep sweeping every N seconds instead of exiting after one pass")
+
+    def handle(self, *args, **options):
+        while True:
+            abandoned = sweeper.sweep(options['chunk_size'], options['pause'])
+            stats = sweeper.stats()
+            seconds = stats['last_sweep_ms'] / 1000
+            self.stdout.write(self.style.SUCCESS(
+                f"Abandoned {abandoned} sessions in {seconds:.2f}s "
+                f"({abandoned / seconds if seconds else 0:.0f}/s); most overdue was {stats['last_lag_s']:.0f}s "
+                f"past its deadline"
+            ))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
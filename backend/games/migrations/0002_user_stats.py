@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('games', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='game_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_games', models.IntegerField(default=0)),
+                ('total_score', models.BigIntegerField(default=0)),
+                ('best_score', models.IntegerField(default=0)),
+                ('total_duration', models.BigIntegerField(default=0, help_text='Sum of durations in seconds')),
+                ('timed_games', models.IntegerField(default=0, help_text='Completed sessions that reported a duration')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'user stats',
+            },
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='game_type',
+            field=models.CharField(choices=[('quiz', 'Quiz'), ('puzzle', 'Puzzle'), ('memory', 'Memory Game'), ('word', 'Word Game'), ('math', 'Math Game'), ('shooting', 'Shooting Game'), ('history', 'History Game')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='UserGameStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_games', models.IntegerField(default=0)),
+                ('total_score', models.BigIntegerField(default=0)),
+                ('best_score', models.IntegerField(default=0)),
+                ('total_duration', models.BigIntegerField(default=0)),
+                ('timed_games', models.IntegerField(default=0)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='games.game')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'user game stats',
+                'unique_together': {('user', 'game')},
+            },
+        ),
+    ]
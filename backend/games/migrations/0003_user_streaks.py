@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0002_user_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='current_streak',
+            field=models.IntegerField(default=0, help_text='Consecutive days played, ending on last_played_on'),
+        ),
+        migrations.AddField(
+            model_name='userstats',
+            name='last_played_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userstats',
+            name='longest_streak',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0003_user_streaks'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['game_type'], name='game_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(fields=['user', 'status', 'start_time'], name='session_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(fields=['game', 'start_time'], name='session_game_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(fields=['start_time'], name='session_start_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboard',
+            index=models.Index(fields=['period', 'game', 'period_start', 'rank'], name='leaderboard_board_rank_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0004_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(fields=['user', 'start_time'], name='session_user_start_idx'),
+        ),
+    ]
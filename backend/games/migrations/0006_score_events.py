@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_events(apps, schema_editor):
+    """One 'session' event per already completed session"""
+    GameSession = apps.get_model('games', 'GameSession')
+    ScoreEvent = apps.get_model('games', 'ScoreEvent')
+    sessions = (
+        GameSession.objects.filter(status='completed')
+        .order_by('id')
+        .values_list('id', 'user_id', 'game_id', 'score', 'duration', 'end_time', 'start_time')
+    )
+    batch = []
+    for session_id, user_id, game_id, score, duration, end_time, start_time in sessions.iterator(chunk_size=5000):
+        # These sessions earned no experience, so the log records none; rebuilding
+        # the projections from it must leave experience_points as it was.
+        batch.append(ScoreEvent(
+            session_id=session_id, user_id=user_id, game_id=game_id, kind='session', score=score,
+            experience=0, duration=duration, occurred_at=end_time or start_time,
+        ))
+        if len(batch) >= 5000:
+            ScoreEvent.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    ScoreEvent.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('games', '0005_session_history_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('session', 'Session completed'), ('adjustment', 'Adjustment')], default='session', max_length=20)),
+                ('score', models.IntegerField()),
+                ('experience', models.IntegerField(default=0)),
+                ('duration', models.IntegerField(blank=True, null=True)),
+                ('occurred_at', models.DateTimeField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='games.game')),
+                ('session', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='games.gamesession')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'occurred_at'], name='score_event_user_idx'), models.Index(fields=['occurred_at'], name='score_event_time_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='scoreevent',
+            constraint=models.UniqueConstraint(condition=models.Q(('kind', 'session')), fields=('session',), name='score_event_one_per_session'),
+        ),
+        migrations.RunPython(backfill_events, migrations.RunPython.noop),
+    ]
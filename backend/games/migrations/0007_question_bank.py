@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 20:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0006_score_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Question',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('difficulty', models.CharField(choices=[('easy', 'Easy'), ('medium', 'Medium'), ('hard', 'Hard')], max_length=20)),
+                ('question_text', models.TextField()),
+                ('options', models.JSONField(default=list)),
+                ('correct_answer', models.CharField(max_length=200)),
+                ('explanation', models.TextField(blank=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('game', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='questions', to='games.game')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['game', 'difficulty', 'is_active', 'id'], name='question_pack_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('games', '0007_question_bank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreBaseline',
+            fields=[
+                ('game', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score_baseline', serialize=False, to='games.game')),
+                ('sessions', models.IntegerField(default=0)),
+                ('score_median', models.FloatField()),
+                ('score_mad', models.FloatField()),
+                ('score_ceiling', models.FloatField(blank=True, null=True)),
+                ('rate_median', models.FloatField(blank=True, help_text='Points per second', null=True)),
+                ('rate_ceiling', models.FloatField(blank=True, help_text='Points per second', null=True)),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SessionFlag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(choices=[('score', 'Score outlier'), ('rate', 'Score per second above ceiling')], max_length=20)),
+                ('source', models.CharField(choices=[('scan', 'Batch scan'), ('submission', 'Submission check')], max_length=20)),
+                ('score', models.IntegerField()),
+                ('duration', models.IntegerField(blank=True, null=True)),
+                ('value', models.FloatField(help_text='The flagged score or points per second')),
+                ('threshold', models.FloatField()),
+                ('status', models.CharField(choices=[('open', 'Open'), ('confirmed', 'Confirmed'), ('dismissed', 'Dismissed')], default='open', max_length=20)),
+                ('flagged_at', models.DateTimeField(auto_now_add=True)),
+                ('reviewed_at', models.DateTimeField(blank=True, null=True)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='games.game')),
+                ('session', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='games.gamesession')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'flagged_at'], name='session_flag_queue_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sessionflag',
+            constraint=models.UniqueConstraint(fields=('session', 'reason'), name='session_flag_unique'),
+        ),
+    ]
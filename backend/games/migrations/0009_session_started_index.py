@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0008_anticheat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(condition=models.Q(('status', 'started')), fields=['id'], name='session_started_idx'),
+        ),
+    ]
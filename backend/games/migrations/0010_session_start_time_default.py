@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:42
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0009_session_started_index'),
+    ]
+
+    # Python-side default only: the column itself is unchanged, so skip SQLite's table rebuild.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='gamesession',
+                    name='start_time',
+                    field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+def merge_overall_duplicates(apps, schema_editor):
+    """Fold duplicate overall rows (game NULL) into one before the index makes them impossible"""
+    Leaderboard = apps.get_model('games', 'Leaderboard')
+    keep = {}
+    for row in Leaderboard.objects.filter(game__isnull=True).order_by('id').iterator():
+        key = (row.user_id, row.period, row.period_start)
+        first = keep.get(key)
+        if first is None:
+            keep[key] = row
+            continue
+        first.total_score += row.total_score
+        first.games_played += row.games_played
+        first.save(update_fields=['total_score', 'games_played'])
+        row.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0010_session_start_time_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_overall_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='leaderboard',
+            constraint=models.UniqueConstraint(condition=models.Q(('game__isnull', True)), fields=('user', 'period', 'period_start'), name='leaderboard_overall_unique'),
+        ),
+    ]
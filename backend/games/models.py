@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
 
 
 class Game(models.Model):
@@ -29,6 +30,11 @@ class Game(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['game_type'], name='game_type_idx'),
+        ]
+    
     def __str__(self):
         return self.title
 
@@ -44,15 +50,38 @@ class GameSession(models.Model):
     game = models.ForeignKey(Game, on_delete=models.CASCADE)
     score = models.IntegerField(default=0)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='started')
-    start_time = models.DateTimeField(auto_now_add=True)
+    start_time = models.DateTimeField(default=timezone.now, editable=False)
     end_time = models.DateTimeField(null=True, blank=True)
     duration = models.IntegerField(help_text="Duration in seconds", null=True, blank=True)
     
     class Meta:
         ordering = ['-start_time']
+        indexes = [
+            models.Index(fields=['user', 'status', 'start_time'], name='session_user_status_idx'),
+            models.Index(fields=['user', 'start_time'], name='session_user_start_idx'),
+            models.Index(fields=['game', 'start_time'], name='session_game_start_idx'),
+            models.Index(fields=['start_time'], name='session_start_time_idx'),
+            # Open sessions only, for the sweeper (games.sweeper); small once it runs.
+            models.Index(fields=['id'], condition=models.Q(status='started'), name='session_started_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.game.title} - {self.score}"
+    
+    def complete(self, score, duration=None):
+        """Mark the session completed, credit the player and notify listeners"""
+        from .levels import credit, experience_for
+        from .signals import session_completed
+        
+        self.score = score
+        self.status = 'completed'
+        self.end_time = timezone.now()
+        self.duration = duration
+        experience = experience_for(self.game, score)
+        with transaction.atomic():
+            self.save(update_fields=['score', 'status', 'end_time', 'duration'])
+            credit({self.user_id: (score, 1, experience)})
+            session_completed.send(sender=GameSession, session=self, experience=experience)
 
 
 class Achievement(models.Model):
@@ -107,7 +136,194 @@ class Leaderboard(models.Model):
     class Meta:
         unique_together = ['user', 'game', 'period', 'period_start']
         ordering = ['rank']
+        indexes = [
+            models.Index(fields=['period', 'game', 'period_start', 'rank'], name='leaderboard_board_rank_idx'),
+        ]
+        constraints = [
+            # NULLs never collide in unique_together, so the overall boards need their own index.
+            models.UniqueConstraint(
+                fields=['user', 'period', 'period_start'], condition=models.Q(game__isnull=True),
+                name='leaderboard_overall_unique',
+            ),
+        ]
     
     def __str__(self):
         game_name = self.game.title if self.game else "Overall"
         return f"{self.user.username} - {game_name} - {self.period} - Rank {self.rank}"
+
+
+class UserStats(models.Model):
+    """Running totals over a user's completed sessions"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='game_stats')
+    total_games = models.IntegerField(default=0)
+    total_score = models.BigIntegerField(default=0)
+    best_score = models.IntegerField(default=0)
+    total_duration = models.BigIntegerField(default=0, help_text="Sum of durations in seconds")
+    timed_games = models.IntegerField(default=0, help_text="Completed sessions that reported a duration")
+    current_streak = models.IntegerField(default=0, help_text="Consecutive days played, ending on last_played_on")
+    longest_streak = models.IntegerField(default=0)
+    last_played_on = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'user stats'
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.total_games} games"
+    
+    @property
+    def average_score(self):
+        return self.total_score / self.total_games if self.total_games else 0
+    
+    @property
+    def average_duration(self):
+        return self.total_duration / self.timed_games if self.timed_games else 0
+
+
+class UserGameStats(models.Model):
+    """Per-game breakdown of a user's completed sessions"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    total_games = models.IntegerField(default=0)
+    total_score = models.BigIntegerField(default=0)
+    best_score = models.IntegerField(default=0)
+    total_duration = models.BigIntegerField(default=0)
+    timed_games = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['user', 'game']
+        verbose_name_plural = 'user game stats'
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.game_id} - {self.total_games} games"
+    
+    @property
+    def average_score(self):
+        return self.total_score / self.total_games if self.total_games else 0
+    
+    @property
+    def average_duration(self):
+        return self.total_duration / self.timed_games if self.timed_games else 0
+
+
+class ScoreEvent(models.Model):
+    """Append-only log of score changes; user totals, stats, leaderboards and achievements are projections of it"""
+    KIND_CHOICES = [
+        ('session', 'Session completed'),
+        ('adjustment', 'Adjustment'),
+    ]
+    
+    # (user, occurred_at) below serves user lookups, so the FK needs no index of its own.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
+    game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    # No database constraint: the log outlives archived or deleted sessions.
+    session = models.ForeignKey(
+        GameSession, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+        null=True, blank=True, related_name='+'
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='session')
+    score = models.IntegerField()
+    experience = models.IntegerField(default=0)
+    duration = models.IntegerField(null=True, blank=True)
+    occurred_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'occurred_at'], name='score_event_user_idx'),
+            models.Index(fields=['occurred_at'], name='score_event_time_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['session'], condition=models.Q(kind='session'), name='score_event_one_per_session'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.game_id} - {self.kind} {self.score}"
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Score events are append-only")
+        super().save(*args, **kwargs)
+
+
+class Question(models.Model):
+    """One entry of a game's question bank; served in packs by games.questions"""
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, db_index=False, related_name='questions')
+    difficulty = models.CharField(max_length=20, choices=Game.DIFFICULTY_LEVELS)
+    question_text = models.TextField()
+    options = models.JSONField(default=list)
+    correct_answer = models.CharField(max_length=200)
+    explanation = models.TextField(blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            # Compiling a pack scans one (game, difficulty) in id order; also serves the FK.
+            models.Index(fields=['game', 'difficulty', 'is_active', 'id'], name='question_pack_idx'),
+        ]
+    
+    def __str__(self):
+        return self.question_text[:50]
+
+
+class ScoreBaseline(models.Model):
+    """Per-game robust score statistics from the anti-cheat scan (games.anticheat)"""
+    game = models.OneToOneField(Game, on_delete=models.CASCADE, primary_key=True, related_name='score_baseline')
+    sessions = models.IntegerField(default=0)
+    score_median = models.FloatField()
+    score_mad = models.FloatField()
+    # Scores above a ceiling are flagged; null when the sample is too uniform to tell.
+    score_ceiling = models.FloatField(null=True, blank=True)
+    rate_median = models.FloatField(null=True, blank=True, help_text="Points per second")
+    rate_ceiling = models.FloatField(null=True, blank=True, help_text="Points per second")
+    computed_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Baseline for game {self.game_id}"
+
+
+class SessionFlag(models.Model):
+    """A completed session whose score looks implausible, queued for review"""
+    REASON_CHOICES = [
+        ('score', 'Score outlier'),
+        ('rate', 'Score per second above ceiling'),
+    ]
+    SOURCE_CHOICES = [
+        ('scan', 'Batch scan'),
+        ('submission', 'Submission check'),
+    ]
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('confirmed', 'Confirmed'),
+        ('dismissed', 'Dismissed'),
+    ]
+    
+    # No database constraint, as for ScoreEvent: a flag outlives an archived session.
+    session = models.ForeignKey(
+        GameSession, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='+'
+    )
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    score = models.IntegerField()
+    duration = models.IntegerField(null=True, blank=True)
+    value = models.FloatField(help_text="The flagged score or points per second")
+    threshold = models.FloatField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    flagged_at = models.DateTimeField(auto_now_add=True)
+    reviewed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'reason'], name='session_flag_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'flagged_at'], name='session_flag_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.session_id} - {self.reason} ({self.status})"
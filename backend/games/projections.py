@@ -0,0 +1,178 @@
+"""
+Rebuilding projections from the score event log.
+
+The log is partitioned into contiguous user-id ranges. Each range is read
+in (user, occurred_at) order, which is an index scan on
+``score_event_user_idx``, and folded in Python into that range's rows:
+
+* ``User.total_score``, ``games_played``, ``experience_points`` and ``level``
+* ``UserStats`` and ``UserGameStats``, including day streaks
+* the achievements each user has reached
+
+Ranges are folded in parallel by a process pool, and each range is then
+written by the parent in one transaction with bulk inserts. Keeping a
+single writer avoids lock contention on SQLite; on other databases the
+reads are still spread across cores. Leaderboards are rebuilt afterwards
+with ``games.rollups``, which also reads the log.
+
+``adjustment`` events count toward score and experience but are not
+sessions: they do not add games played, session stats or streaks.
+"""
+
+import multiprocessing
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import connections, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from users.models import User
+from users.profiles import profile_cache
+
+from . import workers as pool_tasks
+from .achievements import _UserMetrics, award, get_index
+from .levels import curve
+from .models import ScoreEvent, UserGameStats, UserStats
+
+
+USER_FIELDS = ['total_score', 'games_played', 'experience_points', 'level']
+
+
+class _UserFold:
+    """Running projections for one user's events, in log order"""
+
+    def __init__(self):
+        self.total_score = 0
+        self.games_played = 0
+        self.experience = 0
+        self.stats = {
+            'total_games': 0, 'total_score': 0, 'best_score': 0, 'total_duration': 0, 'timed_games': 0,
+            'current_streak': 0, 'longest_streak': 0, 'last_played_on': None,
+        }
+        self.games = {}
+        self.metrics = _UserMetrics()
+
+    def add(self, game_id, kind, score, experience, duration, occurred_at):
+        self.total_score += score
+        self.experience += experience
+        if kind != 'session':
+            return
+        self.games_played += 1
+        played_on = timezone.localdate(occurred_at)
+        game = self.games.get(game_id)
+        if game is None:
+            game = self.games[game_id] = {
+                'total_games': 0, 'total_score': 0, 'best_score': 0, 'total_duration': 0, 'timed_games': 0,
+            }
+        for totals in (self.stats, game):
+            totals['total_games'] += 1
+            totals['total_score'] += score
+            totals['best_score'] = max(totals['best_score'], score)
+            if duration is not None:
+                totals['total_duration'] += duration
+                totals['timed_games'] += 1
+
+        stats = self.stats
+        last = stats['last_played_on']
+        if last is None or played_on > last:
+            stats['current_streak'] = stats['current_streak'] + 1 if last and (played_on - last).days == 1 else 1
+            stats['longest_streak'] = max(stats['longest_streak'], stats['current_streak'])
+            stats['last_played_on'] = played_on
+        self.metrics.add(score, duration, played_on)
+
+
+def fold_partition(bounds, chunk_size=10000):
+    """
+    Fold the events of users in [low, high) into projection rows.
+
+    Returns (bounds, user totals, user stats, per-game stats, achievement pairs)
+    as plain tuples and dicts so they pickle cheaply back to the parent.
+    """
+    low, high = bounds
+    index = get_index()
+    events = (
+        ScoreEvent.objects.filter(user_id__gte=low, user_id__lt=high)
+        .order_by('user_id', 'occurred_at', 'id')
+        .values_list('user_id', 'game_id', 'kind', 'score', 'experience', 'duration', 'occurred_at')
+    )
+    folds = defaultdict(_UserFold)
+    for user_id, *event in events.iterator(chunk_size=chunk_size):
+        folds[user_id].add(*event)
+
+    totals, stats, game_stats, awards = [], [], [], []
+    for user_id, fold in folds.items():
+        totals.append((user_id, fold.total_score, fold.games_played, fold.experience))
+        if fold.games_played:
+            stats.append((user_id, fold.stats))
+            game_stats.extend((user_id, game_id, values) for game_id, values in fold.games.items())
+            awards.extend((user_id, achievement_id) for achievement_id in fold.metrics.achievement_ids(index))
+    return bounds, totals, stats, game_stats, awards
+
+
+def write_partition(result, batch_size=1000):
+    """Replace one user range's projections with freshly folded rows"""
+    (low, high), totals, stats, game_stats, awards = result
+    users = [
+        User(pk=user_id, total_score=total_score, games_played=games_played, experience_points=experience,
+             level=curve.level_for(experience))
+        for user_id, total_score, games_played, experience in totals
+    ]
+
+    with transaction.atomic():
+        in_range = {'user_id__gte': low, 'user_id__lt': high}
+        UserStats.objects.filter(**in_range).delete()
+        UserGameStats.objects.filter(**in_range).delete()
+        UserStats.objects.bulk_create(
+            [UserStats(user_id=user_id, **values) for user_id, values in stats], batch_size=batch_size
+        )
+        UserGameStats.objects.bulk_create(
+            [UserGameStats(user_id=user_id, game_id=game_id, **values) for user_id, game_id, values in game_stats],
+            batch_size=batch_size,
+        )
+        # Users without events project to zero.
+        User.objects.filter(id__gte=low, id__lt=high).update(
+            total_score=0, games_played=0, experience_points=0, level=1,
+        )
+        User.objects.bulk_update(users, USER_FIELDS, batch_size=batch_size)
+        # Achievements are only ever added, so earned_at survives a rebuild.
+        award(awards, batch_size)
+    return len(totals)
+
+
+def partitions(chunk_users, user_ids=None):
+    """Contiguous [low, high) user-id ranges covering every user"""
+    if user_ids:
+        return [(user_id, user_id + 1) for user_id in sorted(set(user_ids))]
+    bounds = User.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+    return [(low, min(low + chunk_users, bounds['high'] + 1))
+            for low in range(bounds['low'], bounds['high'] + 1, chunk_users)]
+
+
+def rebuild(workers=None, chunk_users=5000, user_ids=None, batch_size=1000, stdout=None):
+    """Rebuild user totals, stats and achievements from the log; returns users projected"""
+    ranges = partitions(chunk_users, user_ids)
+    workers = os.cpu_count() if workers is None else workers
+    projected = 0
+
+    if workers > 1 and len(ranges) > 1:
+        # Worker processes open their own connections; never share one across a process boundary.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=pool_tasks.setup,
+        ) as pool:
+            results = pool.map(pool_tasks.fold_partition, ranges)
+            for done, result in enumerate(results, 1):
+                projected += write_partition(result, batch_size)
+                if stdout:
+                    stdout.write(f"  {done}/{len(ranges)} partitions, {projected} users")
+    else:
+        for done, bounds in enumerate(ranges, 1):
+            projected += write_partition(fold_partition(bounds), batch_size)
+            if stdout:
+                stdout.write(f"  {done}/{len(ranges)} partitions, {projected} users")
+    profile_cache.bump()
+    return projected
@@ -0,0 +1,94 @@
+"""
+Topic-based publish/subscribe for live pushes.
+
+Publishers may be any thread (the leaderboard ticker, a request worker);
+subscribers are asyncio consumers such as WebSocket connections. The
+backend is chosen by ``PUBSUB_BACKEND`` and only needs ``subscribe``,
+``unsubscribe`` and ``publish``. The default ``LocalBroker`` fans out
+within this process, so it works without any external service; a
+multi-process deployment can plug in a broker backed by Redis or Postgres
+LISTEN/NOTIFY behind the same interface.
+"""
+
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """One consumer's queue of messages on a topic"""
+
+    def __init__(self, topic, max_pending=256):
+        self.topic = topic
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_pending)
+        self.dropped = False
+
+    def _deliver(self, message):
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A consumer this far behind has to resynchronise from a snapshot.
+            self.dropped = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self):
+        """Next message, or None once the subscription fell too far behind"""
+        return await self.queue.get()
+
+
+class LocalBroker:
+    """In-process broker: delivers onto each subscriber's event loop"""
+
+    def __init__(self):
+        self._topics = defaultdict(set)
+        self._lock = threading.Lock()
+
+    async def subscribe(self, topic):
+        subscription = Subscription(topic)
+        with self._lock:
+            self._topics[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._topics.get(subscription.topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[subscription.topic]
+
+    def subscriber_count(self, topic):
+        with self._lock:
+            return len(self._topics.get(topic, ()))
+
+    def publish(self, topic, message):
+        """Deliver ``message`` to every subscriber of ``topic``; returns how many"""
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, message)
+            except RuntimeError:
+                # The subscriber's loop has closed; it will never unsubscribe itself.
+                self.unsubscribe(subscription)
+        return len(subscribers)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'PUBSUB_BACKEND', 'games.pubsub.LocalBroker'))()
+    return _broker
@@ -0,0 +1,70 @@
+"""
+Hot queries of the games app and an EXPLAIN-based plan check.
+
+``check_query_plans`` runs each query in ``hot_queries`` through the
+database's query planner and reports any plan that falls back to a full
+table scan or builds a temporary B-tree to sort, which means an index no
+longer matches the access path.
+"""
+
+import re
+from datetime import timedelta
+
+from django.contrib.admin.sites import site
+from django.utils import timezone
+
+from .admin import sessions_of_game_type
+from .history import history
+from .leaderboard import period_bounds
+from .models import GameSession, Leaderboard
+
+
+FULL_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+)(?!.*\bUSING (?:COVERING )?INDEX\b)')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (?:ORDER BY|RIGHT PART OF ORDER BY|GROUP BY|DISTINCT)')
+
+
+def hot_queries(user_id=1, game_id=1):
+    """(name, queryset) pairs for the access paths the indexes are built for"""
+    now = timezone.now()
+    daily_start, _ = period_bounds('daily', now)
+    admin_ordering = GameSession.objects.order_by(
+        *site._registry[GameSession].get_ordering(None), '-pk'
+    )
+    return [
+        ('user completed sessions', GameSession.objects.filter(user_id=user_id, status='completed')),
+        ('user open sessions', GameSession.objects.filter(user_id=user_id, status='started')),
+        ('game sessions', GameSession.objects.filter(game_id=game_id)),
+        ('sweeper open session chunk', GameSession.objects.filter(status='started', id__gt=0).order_by('id')[:500]),
+        ('user history page', history(user_id=user_id).live[:50]),
+        ('game history page', history(game_id=game_id).live[:50]),
+        ('admin session changelist', admin_ordering[:100]),
+        ('admin sessions by start_time', admin_ordering.filter(
+            start_time__gte=now - timedelta(days=7), start_time__lt=now
+        )[:100]),
+        ('admin sessions by game type', sessions_of_game_type(admin_ordering, 'quiz')[:100]),
+        ('game leaderboard page', Leaderboard.objects.filter(
+            period='daily', game_id=game_id, period_start=daily_start
+        )[:100]),
+        ('overall leaderboard page', Leaderboard.objects.filter(
+            period='daily', game__isnull=True, period_start=daily_start
+        )[:100]),
+    ]
+
+
+def plan_problems(plan):
+    """Human-readable problems found in an EXPLAIN QUERY PLAN output"""
+    problems = []
+    for line in plan.splitlines():
+        scan = FULL_SCAN.search(line)
+        if scan:
+            problems.append(f"full scan of {scan.group(1)}")
+        if TEMP_SORT.search(line):
+            problems.append("temporary B-tree sort")
+    return problems
+
+
+def check_plans(queries=None):
+    """Yield (name, plan, problems) for every hot query"""
+    for name, queryset in queries or hot_queries():
+        plan = queryset.explain()
+        yield name, plan, plan_problems(plan)
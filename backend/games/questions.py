@@ -0,0 +1,123 @@
+"""
+Precompiled question packs.
+
+Questions live in the ``Question`` table, but rounds are served from packs:
+one immutable, in-process snapshot per (game, difficulty) holding every
+active question already encoded as JSON. A pack is one ``bytes`` blob of
+concatenated encoded questions plus an ``array`` of their offsets, so a
+bank of hundreds of thousands of questions costs its encoded size plus
+eight bytes a question, rather than a Python object per field.
+
+A round of N questions is ``random.sample`` over the pack's index range,
+which picks N distinct positions in O(N) regardless of the bank's size,
+and the response body is the matching slices joined together: no query
+and no serializer per request.
+
+Each pack key has a stamp in the ``questions`` namespace of the shared
+cache (``api.cache``). Saving or deleting a ``Question`` drops the stamps of
+its game once the transaction commits; bulk imports, which send no signals,
+defer ``invalidate`` to their commit themselves. Every process recompiles a pack on first use after its stamp
+changes, at most ``CACHE_LOCAL_TTL`` seconds later.
+"""
+
+import json
+import random
+import secrets
+import threading
+from array import array
+
+from asgiref.sync import sync_to_async
+from django.db.models import TextField
+from django.db.models.functions import Cast
+
+from api.cache import TieredCache
+from api.replicas import primary
+
+from .models import Game, Question
+
+
+DIFFICULTIES = [difficulty for difficulty, _ in Game.DIFFICULTY_LEVELS]
+COMPILE_CHUNK_SIZE = 5000
+# The client's ``Question`` shape (src/types/api.ts).
+ENCODED_QUESTION = '{"id":%d,"question_text":%s,"options":%s,"correct_answer":%s,"explanation":%s}'
+
+
+class QuestionPack:
+    """Immutable, array-backed set of encoded questions for one (game, difficulty)"""
+
+    def __init__(self, stamp, blob, offsets):
+        self.stamp = stamp
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @classmethod
+    def compile(cls, stamp, rows):
+        """Pack ``(id, question_text, options JSON text, correct_answer, explanation)`` rows"""
+        blob = bytearray()
+        offsets = array('Q', [0])
+        dumps = json.dumps
+        for question_id, text, options, answer, explanation in rows:
+            # ``options`` is already JSON as stored; splicing it in skips a decode and re-encode per row.
+            blob += (ENCODED_QUESTION % (question_id, dumps(text), options, dumps(answer), dumps(explanation))).encode()
+            offsets.append(len(blob))
+        return cls(stamp, bytes(blob), offsets)
+
+    def question(self, position):
+        return self.blob[self.offsets[position]:self.offsets[position + 1]]
+
+    def sample(self, count, rng=random):
+        """JSON array of ``count`` distinct questions (all of them if the pack is smaller)"""
+        positions = rng.sample(range(len(self)), min(count, len(self)))
+        return b'[' + b','.join(self.question(position) for position in positions) + b']'
+
+
+def _rows(game_id, difficulty):
+    # Packs are cached well past a replica's lag, so compile from the primary.
+    with primary():
+        yield from Question.objects.filter(
+            game_id=game_id, difficulty=difficulty, is_active=True
+        ).order_by('id').values_list(
+            'id', 'question_text', Cast('options', TextField()), 'correct_answer', 'explanation'
+        ).iterator(chunk_size=COMPILE_CHUNK_SIZE)
+
+
+class QuestionBank:
+    def __init__(self):
+        self.stamps = TieredCache('questions', timeout=None)
+        self._packs = {}
+        self._lock = threading.Lock()
+
+    def _key(self, game_id, difficulty):
+        return f'{game_id}:{difficulty}'
+
+    def pack(self, game_id, difficulty):
+        """Current pack for (game, difficulty), compiling it if the stamp moved"""
+        key = self._key(game_id, difficulty)
+        stamp = self.stamps.get_or_set(key, lambda: secrets.token_hex(4))
+        pack = self._packs.get(key)
+        if pack is not None and pack.stamp == stamp:
+            return pack
+        with self._lock:
+            pack = self._packs.get(key)
+            if pack is None or pack.stamp != stamp:
+                pack = self._packs[key] = QuestionPack.compile(stamp, _rows(game_id, difficulty))
+            return pack
+
+    async def apack(self, game_id, difficulty):
+        key = self._key(game_id, difficulty)
+        pack = self._packs.get(key)
+        if pack is not None and pack.stamp == self.stamps.local.get(key):
+            return pack
+        # Reading the shared stamp or compiling is blocking I/O.
+        return await sync_to_async(self.pack)(game_id, difficulty)
+
+    def invalidate(self, game_ids):
+        """Recompile the packs of ``game_ids``; callers in a transaction defer this to its commit"""
+        keys = [self._key(game_id, difficulty) for game_id in set(game_ids) for difficulty in DIFFICULTIES]
+        self.stamps.delete_many(keys)
+
+
+bank = QuestionBank()
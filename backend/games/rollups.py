@@ -0,0 +1,113 @@
+"""
+Catch-up rebuilds of period leaderboards.
+
+The live path folds each session into its buckets through the leaderboard
+engine. When a window needs to be recomputed (a backfill, a bug fix, a
+missed rollover), each bucket is rebuilt from the ``ScoreEvent`` log with
+one grouped query: per-game totals come straight from the query and the
+overall (``game=None``) board is summed from them in Python.
+
+Rows are updated in place, keeping their ids, because running engines write
+back to the row ids they loaded. Only players missing from the rebuilt
+bucket lose their row. ``engine.discard`` then makes every process reload
+the bucket.
+"""
+
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+
+from .leaderboard import ALL_TIME_END, ALL_TIME_START, _update_rows, engine, period_bounds
+from .models import Leaderboard, ScoreEvent
+
+
+def iter_buckets(period, start, end):
+    """Yield (period_start, period_end) for every bucket overlapping [start, end)"""
+    if period == 'all_time':
+        yield ALL_TIME_START, ALL_TIME_END
+        return
+    bucket_start, bucket_end = period_bounds(period, start)
+    while bucket_start < end:
+        yield bucket_start, bucket_end
+        bucket_start, bucket_end = period_bounds(period, bucket_end)
+
+
+def _ranked(totals):
+    ordered = sorted(totals.items(), key=lambda item: (-item[1][0], item[0]))
+    return [(rank, user_id, score, games) for rank, (user_id, (score, games)) in enumerate(ordered, 1)]
+
+
+def rebuild_bucket(period, period_start, period_end, batch_size=1000):
+    """Recompute every board in one bucket in place; returns the number of rows written"""
+    rows = (
+        ScoreEvent.objects.filter(occurred_at__gte=period_start, occurred_at__lt=period_end)
+        .order_by()
+        .values('game_id', 'user_id')
+        .annotate(total_score=Sum('score'), games_played=Count('id', filter=Q(kind='session')))
+    )
+
+    boards = defaultdict(dict)
+    for row in rows.iterator(chunk_size=5000):
+        boards[row['game_id']][row['user_id']] = (row['total_score'], row['games_played'])
+        overall = boards[None].get(row['user_id'], (0, 0))
+        boards[None][row['user_id']] = (overall[0] + row['total_score'], overall[1] + row['games_played'])
+
+    bucket = Leaderboard.objects.filter(period=period, period_start=period_start)
+    existing = {
+        (game_id, user_id): row_id for row_id, game_id, user_id in bucket.values_list('id', 'game_id', 'user_id')
+    }
+    creates, updates = [], []
+    for game_id, totals in boards.items():
+        for rank, user_id, score, games in _ranked(totals):
+            row_id = existing.pop((game_id, user_id), None)
+            if row_id is None:
+                creates.append(Leaderboard(
+                    user_id=user_id,
+                    game_id=game_id,
+                    period=period,
+                    period_start=period_start,
+                    period_end=period_end,
+                    total_score=score,
+                    games_played=games,
+                    rank=rank,
+                ))
+            else:
+                updates.append((score, games, rank, row_id))
+    stale = list(existing.values())
+
+    with transaction.atomic():
+        _delete_rows(stale, batch_size)
+        _update_rows(updates)
+        Leaderboard.objects.bulk_create(creates, batch_size=batch_size)
+
+    engine.discard(period, period_start)
+    return len(creates) + len(updates)
+
+
+def _delete_rows(ids, batch_size):
+    """
+    Delete leaderboard rows by id with plain DELETE statements.
+
+    ``QuerySet.delete()`` loads every row to send ``post_delete``, whose
+    handler bumps the page cache once per row; ``engine.discard`` bumps it
+    once for the whole bucket instead.
+    """
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            cursor.execute(
+                'DELETE FROM {} WHERE {} IN ({})'.format(
+                    qn(Leaderboard._meta.db_table), qn('id'), ', '.join(['%s'] * len(chunk))
+                ),
+                chunk,
+            )
+
+
+def rebuild_window(period, start, end, batch_size=1000):
+    """Rebuild every bucket of ``period`` overlapping [start, end)"""
+    written = {}
+    for period_start, period_end in iter_buckets(period, start, end):
+        written[period_start] = rebuild_bucket(period, period_start, period_end, batch_size)
+    return written
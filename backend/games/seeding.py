@@ -0,0 +1,209 @@
+"""
+Deterministic synthetic data for production-scale local testing.
+
+Every game and every player draws from its own ``random.Random`` keyed by
+the seed and its number, and timestamps count back from a fixed ``now``
+(``SEED_NOW`` unless given), so the same seed always produces the same
+dataset whatever the clock says or is already in the database. Rows are
+written with ``bulk_create`` in user chunks. Derived tables (user stats,
+achievements, leaderboards) are built afterwards by the same code paths
+that maintain them in production.
+"""
+
+import math
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from users.models import User, UserProfile
+
+from .levels import curve, experience_for
+from .models import Achievement, Game, GameSession, Question, ScoreEvent
+
+
+SEED_PASSWORD = 'sparkle-seed-password'
+SEED_NOW = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+GAME_TITLES = {
+    'quiz': 'Quiz', 'puzzle': 'Puzzle', 'memory': 'Memory Match', 'word': 'Word Hunt',
+    'math': 'Math Shooter', 'shooting': 'Target Practice', 'history': 'Historical Dates',
+}
+
+DEFAULT_ACHIEVEMENTS = [
+    ('First Steps', 'completion', 1, 'star'),
+    ('Regular', 'completion', 25, 'medal'),
+    ('Veteran', 'completion', 250, 'crown'),
+    ('High Scorer', 'score', 500, 'trophy'),
+    ('Perfectionist', 'score', 1000, 'gem'),
+    ('Hat Trick', 'streak', 3, 'flame'),
+    ('Dedicated', 'streak', 7, 'calendar'),
+    ('Speed Runner', 'time', 60, 'zap'),
+]
+
+
+class SeedError(ValueError):
+    pass
+
+
+class Seeder:
+    def __init__(self, seed=0, days=90, batch_size=2000, stdout=None, now=None):
+        self.seed = seed
+        self.days = days
+        self.batch_size = batch_size
+        self.stdout = stdout
+        self.now = now or SEED_NOW
+        self.password = make_password(SEED_PASSWORD, salt=f'seed{seed}')
+
+    def _random_for(self, kind, key):
+        return random.Random(f'{self.seed}:{kind}:{key}')
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def games(self, count):
+        games = list(Game.objects.filter(is_active=True))
+        types = [game_type for game_type, _ in Game.GAME_TYPES]
+        difficulties = [difficulty for difficulty, _ in Game.DIFFICULTY_LEVELS]
+        new = []
+        for n in range(len(games), count):
+            game_type = types[n % len(types)]
+            difficulty = difficulties[(n // len(types)) % len(difficulties)]
+            rng = self._random_for('game', n)
+            new.append(Game(
+                title=f"{GAME_TITLES[game_type]} {n + 1}",
+                description=f"Seeded {difficulty} {game_type} game",
+                game_type=game_type,
+                difficulty=difficulty,
+                max_score=rng.choice([100, 500, 1000, 10000]),
+                time_limit=rng.choice([None, 60, 180, 300, 600]),
+            ))
+        Game.objects.bulk_create(new)
+        return list(Game.objects.filter(is_active=True))
+
+    def achievements(self):
+        existing = set(Achievement.objects.values_list('name', flat=True))
+        Achievement.objects.bulk_create([
+            Achievement(name=name, description=f"{kind} {value}", achievement_type=kind,
+                        requirement_value=value, icon=icon)
+            for name, kind, value, icon in DEFAULT_ACHIEVEMENTS if name not in existing
+        ])
+
+    def _sessions_for(self, rng, games, skill, activity):
+        """Generate (game, status, score, duration, start_time, end_time) tuples for one player"""
+        # Pareto(2) has mean 2, so players average ``activity`` sessions with a heavy tail.
+        count = min(int(rng.paretovariate(2.0) * activity / 2), 50000)
+        sessions = []
+        for _ in range(count):
+            game = rng.choice(games)
+            start = self.now - timedelta(seconds=rng.uniform(0, self.days * 86400))
+            roll = rng.random()
+            if roll < 0.05:
+                sessions.append((game, 'started', 0, None, start, None))
+                continue
+            limit = game.time_limit or 600
+            duration = max(5, min(limit, int(rng.lognormvariate(math.log(limit * 0.4), 0.5))))
+            if roll < 0.12:
+                sessions.append((game, 'abandoned', 0, duration, start, start + timedelta(seconds=duration)))
+                continue
+            score = int(game.max_score * rng.betavariate(skill * 4 + 0.5, (1 - skill) * 4 + 0.5))
+            sessions.append((game, 'completed', score, duration, start, start + timedelta(seconds=duration)))
+        return sessions
+
+    def users(self, count, games, sessions_per_user, first=0):
+        """Create players ``first`` to ``first + count - 1``; returns (users, sessions) created"""
+        names = [f'player{n}' for n in range(first, first + count)]
+        for start in range(0, count, 500):
+            if User.objects.filter(username__in=names[start:start + 500]).exists():
+                raise SeedError(f"player{first}..player{first + count - 1} overlap existing users; "
+                                f"start after them with another first user")
+        created_users = created_sessions = 0
+        for chunk_start in range(0, count, self.batch_size):
+            chunk = range(first + chunk_start, first + min(chunk_start + self.batch_size, count))
+            users, plays, themes = [], [], []
+            for n in chunk:
+                rng = self._random_for('player', n)
+                sessions = self._sessions_for(rng, games, rng.random(), sessions_per_user)
+                completed = [s for s in sessions if s[1] == 'completed']
+                total_score = sum(s[2] for s in completed)
+                experience = sum(experience_for(s[0], s[2]) for s in completed)
+                users.append(User(
+                    username=f'player{n}',
+                    email=f'player{n}@example.com',
+                    password=self.password,
+                    date_joined=self.now - timedelta(days=self.days),
+                    total_score=total_score,
+                    games_played=len(completed),
+                    experience_points=experience,
+                    level=curve.level_for(experience),
+                ))
+                plays.append(sessions)
+                themes.append(rng.choice(['light', 'dark', 'auto']))
+
+            with transaction.atomic():
+                User.objects.bulk_create(users, batch_size=self.batch_size)
+                UserProfile.objects.bulk_create(
+                    [UserProfile(user=user, theme_preference=theme) for user, theme in zip(users, themes)],
+                    batch_size=self.batch_size,
+                )
+                rows = [
+                    GameSession(user=user, game=game, status=status, score=score, duration=duration,
+                                start_time=start, end_time=end)
+                    for user, sessions in zip(users, plays)
+                    for game, status, score, duration, start, end in sessions
+                ]
+                GameSession.objects.bulk_create(rows, batch_size=self.batch_size)
+                ScoreEvent.objects.bulk_create(
+                    [ScoreEvent(user_id=row.user_id, game_id=row.game_id, session_id=row.pk, score=row.score,
+                                experience=experience_for(row.game, row.score), duration=row.duration,
+                                occurred_at=row.end_time)
+                     for row in rows if row.status == 'completed'],
+                    batch_size=self.batch_size,
+                )
+
+            created_users += len(users)
+            created_sessions += len(rows)
+            self.log(f"  {created_users}/{count} users, {created_sessions} sessions")
+        return created_users, created_sessions
+
+    def questions(self, games, per_pack):
+        """``per_pack`` arithmetic questions per difficulty for games that have none yet"""
+        from .questions import DIFFICULTIES, bank
+
+        stocked = set(Question.objects.values_list('game_id', flat=True).distinct())
+        games = [game for game in games if game.pk not in stocked]
+        spans = {difficulty: 10 ** (n + 1) for n, difficulty in enumerate(DIFFICULTIES)}
+        created = 0
+        for game in games:
+            rng = self._random_for('questions', game.title)
+            rows = []
+            for difficulty in DIFFICULTIES:
+                for _ in range(per_pack):
+                    a, b = rng.randrange(spans[difficulty]), rng.randrange(spans[difficulty])
+                    answer = a + b
+                    options = sorted({answer, *(answer + rng.randint(-9, 9) for _ in range(3))})
+                    rows.append(Question(
+                        game=game, difficulty=difficulty, question_text=f"What is {a} + {b}?",
+                        options=[str(option) for option in options], correct_answer=str(answer),
+                    ))
+            Question.objects.bulk_create(rows, batch_size=self.batch_size)
+            created += len(rows)
+        game_ids = [game.pk for game in games]
+        transaction.on_commit(lambda: bank.invalidate(game_ids))
+        return created
+
+    def derived(self, workers=None):
+        """Build stats, achievements and leaderboards from the seeded score events"""
+        from .achievements import invalidate_index
+        from .leaderboard import PERIODS, period_bounds
+        from .projections import rebuild
+        from .rollups import rebuild_bucket
+
+        invalidate_index()
+        rebuild(workers=workers, batch_size=self.batch_size, stdout=self.stdout)
+        # Only the live bucket of each period; rebuild_leaderboards can fill in history.
+        for period in PERIODS:
+            rows = rebuild_bucket(period, *period_bounds(period, self.now), batch_size=self.batch_size)
+            self.log(f"  {rows} {period} leaderboard rows")
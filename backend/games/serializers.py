@@ -1,21 +1,56 @@
+from django.db.models import Manager, QuerySet
 from rest_framework import serializers
 from .models import Game, GameSession, Achievement, UserAchievement, Leaderboard
 
 
+class EagerLoadingListSerializer(serializers.ListSerializer):
+    """Applies the child's eager loading to a queryset before iterating it"""
+
+    def to_representation(self, data):
+        if isinstance(data, (Manager, QuerySet)):
+            data = self.child.setup_eager_loading(data.all())
+        return super().to_representation(data)
+
+
+class EagerLoadingMixin:
+    """
+    Declares the joins and columns a serializer reads, so ``many=True``
+    serialization costs one query however many rows it renders.
+    """
+
+    select_related_fields = ()
+    only_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if queryset._result_cache is not None:
+            return queryset
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.only_fields:
+            queryset = queryset.only(*cls.only_fields)
+        return queryset
+
+
 class GameSerializer(serializers.ModelSerializer):
     class Meta:
         model = Game
         fields = ['id', 'title', 'description', 'game_type', 'difficulty', 'max_score', 'time_limit', 'is_active', 'created_at']
 
 
-class GameSessionSerializer(serializers.ModelSerializer):
+class GameSessionSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     game_title = serializers.CharField(source='game.title', read_only=True)
     user_username = serializers.CharField(source='user.username', read_only=True)
     
+    select_related_fields = ('user', 'game')
+    only_fields = ('id', 'user', 'game', 'score', 'status', 'start_time', 'end_time', 'duration',
+                   'user__username', 'game__title')
+    
     class Meta:
         model = GameSession
         fields = ['id', 'user', 'game', 'game_title', 'user_username', 'score', 'status', 'start_time', 'end_time', 'duration']
         read_only_fields = ['user', 'start_time']
+        list_serializer_class = EagerLoadingListSerializer
 
 
 class AchievementSerializer(serializers.ModelSerializer):
@@ -24,19 +59,26 @@ class AchievementSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'achievement_type', 'icon', 'requirement_value', 'points', 'is_active']
 
 
-class UserAchievementSerializer(serializers.ModelSerializer):
+class UserAchievementSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     achievement = AchievementSerializer(read_only=True)
     
+    select_related_fields = ('achievement',)
+    
     class Meta:
         model = UserAchievement
         fields = ['id', 'achievement', 'earned_at']
+        list_serializer_class = EagerLoadingListSerializer
 
 
-class LeaderboardSerializer(serializers.ModelSerializer):
+class LeaderboardSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     user_username = serializers.CharField(source='user.username', read_only=True)
-    user_avatar = serializers.ImageField(source='user.avatar', read_only=True)
-    game_title = serializers.CharField(source='game.title', read_only=True)
+    game_title = serializers.CharField(source='game.title', read_only=True, default=None)
+    
+    select_related_fields = ('user', 'game')
+    only_fields = ('id', 'user', 'game', 'period', 'total_score', 'games_played', 'rank', 'period_start', 'period_end',
+                   'user__username', 'game__title')
     
     class Meta:
         model = Leaderboard
-        fields = ['id', 'user_username', 'user_avatar', 'game_title', 'period', 'total_score', 'games_played', 'rank', 'period_start', 'period_end']
+        fields = ['id', 'user_username', 'game_title', 'period', 'total_score', 'games_played', 'rank', 'period_start', 'period_end']
+        list_serializer_class = EagerLoadingListSerializer
@@ -0,0 +1,96 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from users.models import User
+
+from . import achievements, anticheat, events, stats
+from .catalogue import catalogue
+from .leaderboard import engine as leaderboard_engine, pages as leaderboard_pages
+from .live import live_boards
+from .models import Achievement, Game, Leaderboard, Question
+from .questions import bank as question_bank
+
+
+# Sent with ``session`` and the ``experience`` it earned once a GameSession
+# transitions to ``completed``, inside the transaction that saved it.
+session_completed = Signal()
+
+
+@receiver(session_completed)
+def append_score_event(sender, session, experience=0, **kwargs):
+    events.append(session, experience)
+
+
+@receiver(session_completed)
+def update_leaderboards(sender, session, **kwargs):
+    # The boards live in memory and cannot roll back, so they only see committed sessions.
+    def record():
+        leaderboard_engine.record_session(session)
+        live_boards.mark(session.game_id)
+
+    transaction.on_commit(record)
+
+
+@receiver(session_completed)
+def update_user_stats(sender, session, **kwargs):
+    stats.record_session(session)
+
+
+@receiver(session_completed)
+def award_achievements(sender, session, **kwargs):
+    # Runs after update_user_stats, so the stats row already includes this session.
+    achievements.evaluate_session(session)
+
+
+@receiver(session_completed)
+def check_plausibility(sender, session, **kwargs):
+    anticheat.flag_session(session)
+
+
+@receiver(post_save, sender=Achievement)
+@receiver(post_delete, sender=Achievement)
+def invalidate_achievement_index(sender, **kwargs):
+    # After commit, so no other process can cache the old rules under the new version.
+    transaction.on_commit(achievements.invalidate_index)
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def invalidate_catalogue(sender, **kwargs):
+    # After commit, so no other process can cache the old rows under the new version.
+    transaction.on_commit(catalogue.invalidate)
+    # Score limits include max_score.
+    anticheat.invalidate()
+
+
+@receiver(pre_save, sender=Question)
+def remember_question_game(sender, instance, **kwargs):
+    # A question moved to another game must also leave the old game's packs.
+    if instance.pk is not None:
+        instance._previous_game_id = (
+            Question.objects.filter(pk=instance.pk).values_list('game_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_question_packs(sender, instance, **kwargs):
+    game_ids = {instance.game_id, getattr(instance, '_previous_game_id', None)} - {None}
+    # A pack rebuilt before the commit would cache the old questions again.
+    transaction.on_commit(lambda: question_bank.invalidate(game_ids))
+
+
+@receiver(post_save, sender=Leaderboard)
+@receiver(post_delete, sender=Leaderboard)
+def invalidate_leaderboard_pages(sender, **kwargs):
+    transaction.on_commit(leaderboard_pages.bump)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_leaderboard_usernames(sender, update_fields=None, **kwargs):
+    # Pages show usernames; saves that cannot have renamed anyone leave them alone.
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    transaction.on_commit(leaderboard_pages.bump)
@@ -0,0 +1,172 @@
+"""
+Maintained per-user aggregates over completed game sessions.
+
+``record_session`` folds one completed session into ``UserStats`` and
+``UserGameStats`` with F() updates, so concurrent completions never lose
+increments. ``compute_from_sessions`` rebuilds the same numbers from raw
+``GameSession`` rows for the ``rebuild_user_stats`` command, including
+sessions moved to the archive (``games.archive``).
+"""
+
+import heapq
+from datetime import timedelta
+
+import numpy as np
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from . import archive
+from .models import GameSession, UserGameStats, UserStats
+
+
+STAT_FIELDS = ['total_games', 'total_score', 'best_score', 'total_duration', 'timed_games']
+STREAK_FIELDS = ['current_streak', 'longest_streak', 'last_played_on']
+
+
+def _increments(session):
+    timed = session.duration is not None
+    return {
+        'total_games': F('total_games') + 1,
+        'total_score': F('total_score') + session.score,
+        'best_score': Greatest(F('best_score'), Value(session.score)),
+        'total_duration': F('total_duration') + (session.duration or 0),
+        'timed_games': F('timed_games') + (1 if timed else 0),
+    }
+
+
+def _streak_updates(session):
+    played_on = timezone.localdate(session.end_time)
+    # All expressions read the pre-update row, so longest_streak sees the new streak.
+    streak = Case(
+        When(last_played_on=played_on, then=F('current_streak')),
+        When(last_played_on=played_on - timedelta(days=1), then=F('current_streak') + 1),
+        When(last_played_on__gt=played_on, then=F('current_streak')),
+        default=Value(1),
+        output_field=IntegerField(),
+    )
+    return {
+        'current_streak': streak,
+        'longest_streak': Greatest(F('longest_streak'), streak),
+        'last_played_on': Greatest(Coalesce(F('last_played_on'), Value(played_on)), Value(played_on)),
+    }
+
+
+def record_session(session):
+    """Fold one completed session into the user's running totals"""
+    with transaction.atomic():
+        for model, lookup, updates in (
+            (UserStats, {'user_id': session.user_id}, {**_increments(session), **_streak_updates(session)}),
+            (UserGameStats, {'user_id': session.user_id, 'game_id': session.game_id}, _increments(session)),
+        ):
+            if not model.objects.filter(**lookup).update(**updates):
+                model.objects.get_or_create(**lookup)
+                model.objects.filter(**lookup).update(**updates)
+
+
+def compute_from_sessions(user_ids=None):
+    """Recompute (user stats, per-game stats) dicts from raw completed sessions"""
+    sessions = GameSession.objects.filter(status='completed')
+    if user_ids:
+        sessions = sessions.filter(user_id__in=user_ids)
+
+    rows = (
+        sessions.order_by()
+        .values('user_id', 'game_id')
+        .annotate(
+            total_games=Count('id'),
+            total_score=Coalesce(Sum('score'), 0),
+            best_score=Coalesce(Max('score'), 0),
+            total_duration=Coalesce(Sum('duration'), 0),
+            timed_games=Count('duration'),
+        )
+    )
+
+    archived, archived_days = _archived(user_ids)
+    per_user, per_game = {}, {}
+    for key, values in _merge_games(rows.iterator(chunk_size=5000), archived):
+        per_game[key] = values
+        totals = per_user.setdefault(key[0], {
+            **dict.fromkeys(STAT_FIELDS, 0), 'current_streak': 0, 'longest_streak': 0, 'last_played_on': None,
+        })
+        for field in STAT_FIELDS:
+            if field == 'best_score':
+                totals[field] = max(totals[field], values[field])
+            else:
+                totals[field] += values[field]
+
+    for user_id, streaks in _streaks(sessions, archived_days).items():
+        per_user[user_id].update(streaks)
+    return per_user, per_game
+
+
+def _merge_games(rows, archived):
+    """``((user_id, game_id), stat values)`` for live aggregate rows combined with archived ones"""
+    for row in rows:
+        key = (row['user_id'], row['game_id'])
+        values = {field: row[field] for field in STAT_FIELDS}
+        extra = archived.pop(key, None)
+        if extra is not None:
+            values = {
+                field: max(values[field], extra[field]) if field == 'best_score' else values[field] + extra[field]
+                for field in STAT_FIELDS
+            }
+        yield key, values
+    yield from archived.items()
+
+
+def _archived(user_ids=None):
+    """Per-(user, game) stat values and sorted distinct (user_id, date) play days of archived completed sessions"""
+    per_game, quarters = {}, []
+    for batch in archive.completed(user_ids):
+        order = np.lexsort((batch['game_id'], batch['user_id']))
+        users, games = batch['user_id'][order], batch['game_id'][order]
+        scores = batch['score'][order].astype(np.int64)
+        durations = batch['duration'][order].astype(np.int64)
+        timed = durations != archive.NO_DURATION
+        starts = np.flatnonzero(np.r_[True, (users[1:] != users[:-1]) | (games[1:] != games[:-1])])
+        groups = zip(
+            users[starts].tolist(), games[starts].tolist(), np.diff(np.r_[starts, len(users)]).tolist(),
+            np.add.reduceat(scores, starts).tolist(), np.maximum.reduceat(scores, starts).tolist(),
+            np.add.reduceat(np.where(timed, durations, 0), starts).tolist(),
+            np.add.reduceat(timed.astype(np.int64), starts).tolist(),
+        )
+        for user_id, game_id, count, total, best, duration, timed_count in groups:
+            values = per_game.setdefault((user_id, game_id), dict.fromkeys(STAT_FIELDS, 0))
+            values['total_games'] += count
+            values['total_score'] += total
+            values['best_score'] = max(values['best_score'], best)
+            values['total_duration'] += duration
+            values['timed_games'] += timed_count
+        quarters.append(archive.quarter_hours(batch))
+    return per_game, archive.play_days(quarters)
+
+
+def _streaks(sessions, archived_days=()):
+    """Consecutive-day streaks per user, from the distinct days they played"""
+    days = (
+        sessions.order_by()
+        .annotate(played_on=TruncDate('end_time'))
+        .exclude(played_on=None)
+        .values_list('user_id', 'played_on')
+        .distinct()
+        .order_by('user_id', 'played_on')
+    )
+    streaks = {}
+    previous = None
+    for user_id, played_on in heapq.merge(days.iterator(chunk_size=5000), archived_days):
+        if (user_id, played_on) == previous:
+            continue
+        previous = (user_id, played_on)
+        state = streaks.get(user_id)
+        if state is None:
+            state = streaks[user_id] = {'current_streak': 0, 'longest_streak': 0, 'last_played_on': None}
+        if state['last_played_on'] == played_on - timedelta(days=1):
+            state['current_streak'] += 1
+        else:
+            state['current_streak'] = 1
+        state['longest_streak'] = max(state['longest_streak'], state['current_streak'])
+        state['last_played_on'] = played_on
+    return streaks
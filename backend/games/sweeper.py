@@ -0,0 +1,163 @@
+"""
+Closing sessions that were started and never submitted.
+
+A session left in ``started`` is abandoned once ``start_time`` is further
+back than its game's ``time_limit`` (``SESSION_ABANDON_AFTER`` for games
+without one) plus ``SESSION_SWEEP_GRACE``. The sweeper walks the open
+sessions in id order through the partial index ``session_started_idx``,
+``SESSION_SWEEP_CHUNK`` sessions at a time, and closes the overdue ones of
+each chunk with one set-based UPDATE by primary key. Selecting by id list
+rather than by id range keeps every UPDATE to at most a chunk of rows even
+when the open sessions are spread thinly over a large table.
+
+Every chunk is its own short transaction, run through ``api.db.writer``, so
+on SQLite the write lock is never held for longer than one chunk and
+submissions queued behind it wait for milliseconds. The UPDATE only
+touches rows still ``started``: a session completed between two chunks
+stays completed.
+
+Run it from cron with ``manage.py sweep_sessions``; that is the primary
+path. Setting ``SESSION_SWEEP_INTERVAL`` instead starts a thread in every
+web process with the first submission; the threads take turns through a
+lease in the ``shared`` cache, so one sweep runs per interval however many
+workers there are. ``stats`` reports sessions closed, throughput, lag (how
+long past its deadline the most overdue session was when found), sweeps
+skipped for another worker's lease and sweeps that failed.
+"""
+
+import logging
+import secrets
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from api.db import writer
+
+from .models import Game, GameSession
+
+
+logger = logging.getLogger(__name__)
+LEASE_KEY = 'sweeper:lease'
+
+
+class SessionSweeper:
+    def __init__(self):
+        self._thread = None
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self.metrics = {
+            'sweeps': 0,
+            'abandoned': 0,
+            'chunks': 0,
+            'last_sweep_at': None,
+            'last_sweep_ms': 0.0,
+            'last_abandoned': 0,
+            'last_lag_s': 0.0,
+            'max_lag_s': 0.0,
+            'total_sweep_ms': 0.0,
+            'skipped': 0,
+            'errors': 0,
+        }
+
+    @property
+    def chunk_size(self):
+        return getattr(settings, 'SESSION_SWEEP_CHUNK', 500)
+
+    @property
+    def interval(self):
+        return getattr(settings, 'SESSION_SWEEP_INTERVAL', None)
+
+    def _cutoffs(self, now):
+        """``{game_id: start_time cutoff}``: sessions started before it are overdue at ``now``"""
+        grace = getattr(settings, 'SESSION_SWEEP_GRACE', 300)
+        default = getattr(settings, 'SESSION_ABANDON_AFTER', 3600)
+        return {
+            game_id: now - timedelta(seconds=(time_limit or default) + grace)
+            for game_id, time_limit in Game.objects.values_list('id', 'time_limit')
+        }
+
+    def _close(self, ids, now):
+        return GameSession.objects.filter(id__in=ids, status='started').update(status='abandoned', end_time=now)
+
+    def sweep(self, chunk_size=None, pause=0.0):
+        """Abandon every overdue open session; returns the number closed"""
+        chunk_size = chunk_size or self.chunk_size
+        with self._sweep_lock:
+            started = time.perf_counter()
+            now = timezone.now()
+            cutoffs = self._cutoffs(now)
+            open_sessions = GameSession.objects.filter(status='started').order_by('id').values_list(
+                'id', 'game_id', 'start_time'
+            )
+            after, abandoned, chunks, lag = 0, 0, 0, 0.0
+            while True:
+                # Keyset chunks of open sessions, read through session_started_idx.
+                rows = list(open_sessions.filter(id__gt=after)[:chunk_size])
+                overdue = []
+                for session_id, game_id, start_time in rows:
+                    cutoff = cutoffs.get(game_id)
+                    if cutoff is not None and start_time < cutoff:
+                        overdue.append(session_id)
+                        lag = max(lag, (cutoff - start_time).total_seconds())
+                if overdue:
+                    # By primary key, and only if still open: a session completed meanwhile stays completed.
+                    abandoned += writer.run(self._close, overdue, now)
+                chunks += 1
+                if len(rows) < chunk_size:
+                    break
+                after = rows[-1][0]
+                if pause and overdue:
+                    time.sleep(pause)
+
+            elapsed = (time.perf_counter() - started) * 1000
+            self.metrics['sweeps'] += 1
+            self.metrics['abandoned'] += abandoned
+            self.metrics['chunks'] += chunks
+            self.metrics['last_sweep_at'] = now.isoformat()
+            self.metrics['last_sweep_ms'] = elapsed
+            self.metrics['last_abandoned'] = abandoned
+            self.metrics['last_lag_s'] = lag
+            self.metrics['max_lag_s'] = max(self.metrics['max_lag_s'], lag)
+            self.metrics['total_sweep_ms'] += elapsed
+            return abandoned
+
+    def ensure_running(self):
+        """Start the periodic sweep thread if ``SESSION_SWEEP_INTERVAL`` is set"""
+        if not self.interval or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='session-sweeper', daemon=True)
+                self._thread.start()
+
+    def _take_lease(self):
+        """Whether this process sweeps this interval; the lease expires with it"""
+        shared = caches[getattr(settings, 'CACHE_SHARED_ALIAS', 'shared')]
+        return shared.add(LEASE_KEY, secrets.token_hex(4), timeout=self.interval)
+
+    def _run(self):
+        while True:
+            try:
+                if self._take_lease():
+                    self.sweep()
+                else:
+                    self.metrics['skipped'] += 1
+            except Exception:
+                # Keep sweeping; the next pass retries whatever this one left open.
+                self.metrics['errors'] += 1
+                logger.exception("Sweeping abandoned sessions failed; retrying in %ss", self.interval)
+            time.sleep(self.interval)
+
+    def stats(self):
+        total_ms = self.metrics['total_sweep_ms']
+        return {
+            **self.metrics,
+            'abandoned_per_s': self.metrics['abandoned'] / (total_ms / 1000) if total_ms else 0.0,
+        }
+
+
+sweeper = SessionSweeper()
@@ -0,0 +1,1005 @@
+import fcntl
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from api.cache import TieredCache
+from users.models import User, UserProfile
+
+from . import achievements, anticheat, archive, events, history, stats
+from .distributions import ScoreDistributions, _Delta, difficulty_key, game_key
+from .ingest import SubmissionBuffer, SubmissionError, validate_submission
+from .leaderboard import LeaderboardEngine, RankedSkipList, period_bounds
+from .levels import curve, experience_for
+from .live import LiveBoards, topic_for
+from .models import (
+    Achievement, Game, GameSession, Leaderboard, Question, ScoreBaseline, ScoreEvent, SessionFlag, UserAchievement,
+    UserGameStats, UserStats,
+)
+from .questions import bank as question_bank
+from .query_plans import check_plans, hot_queries
+from .rollups import rebuild_bucket
+from .seeding import SEED_NOW, SeedError, Seeder
+from .serializers import GameSessionSerializer, LeaderboardSerializer, UserAchievementSerializer
+from .sweeper import SessionSweeper
+
+
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-shared'},
+}
+# The shared tier in memory and no local tier, so no test sees values cached by another (or by a dev server).
+isolated_caches = override_settings(CACHES=LOCAL_CACHES, CACHE_LOCAL_TTL=0)
+
+
+class IsolatedCacheMixin:
+    def setUp(self):
+        super().setUp()
+        caches['shared'].clear()
+
+
+@isolated_caches
+class QueryPlanTests(IsolatedCacheMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seeder = Seeder(seed=7, days=30)
+        cls.games = seeder.games(14)
+        seeder.users(200, cls.games, 20)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_hot_queries_use_indexes(self):
+        for name, plan, problems in check_plans(hot_queries(game_id=self.games[0].id)):
+            with self.subTest(name):
+                self.assertEqual(problems, [], plan)
+
+
+@isolated_caches
+class SeederTests(IsolatedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.seeder = Seeder(seed=3, days=10, batch_size=4)
+        self.games = self.seeder.games(4)
+
+    def _players(self, names):
+        sessions = GameSession.objects.filter(user__username__in=names).order_by('user__username', 'start_time')
+        return (
+            list(User.objects.filter(username__in=names).order_by('username').values_list(
+                'username', 'date_joined', 'total_score', 'experience_points')),
+            list(sessions.values_list('user__username', 'game_id', 'status', 'score', 'start_time', 'end_time')),
+        )
+
+    def test_players_do_not_depend_on_count_or_clock(self):
+        names = [f'player{n}' for n in range(5, 10)]
+        self.seeder.users(10, self.games, 6)
+        whole = self._players(names)
+        User.objects.all().delete()
+
+        Seeder(seed=3, days=10, batch_size=3).users(5, self.games, 6, first=5)
+        self.assertEqual(self._players(names), whole)
+        self.assertTrue(whole[1])
+        self.assertTrue(all(start <= SEED_NOW for _, _, _, _, start, _ in whole[1]))
+
+    def test_overlapping_players_are_refused(self):
+        self.seeder.users(5, self.games, 2)
+        with self.assertRaises(SeedError):
+            self.seeder.users(5, self.games, 2, first=3)
+        self.assertEqual(User.objects.count(), 5)
+
+
+ADMIN_PAGES = [
+    ('admin session changelist', '/admin/games/gamesession/'),
+    ('admin leaderboard changelist', '/admin/games/leaderboard/'),
+    ('admin user achievement changelist', '/admin/games/userachievement/'),
+    ('admin user stats changelist', '/admin/games/userstats/'),
+    ('admin user game stats changelist', '/admin/games/usergamestats/'),
+    ('admin profile changelist', '/admin/users/userprofile/'),
+    ('admin score event changelist', '/admin/games/scoreevent/'),
+    ('admin question changelist', '/admin/games/question/'),
+    ('admin session flag changelist', '/admin/games/sessionflag/'),
+]
+
+SERIALIZERS = [
+    ('session serializer', GameSessionSerializer, GameSession),
+    ('leaderboard serializer', LeaderboardSerializer, Leaderboard),
+    ('user achievement serializer', UserAchievementSerializer, UserAchievement),
+]
+
+
+def _fixture(rows, tag):
+    """``rows`` rows in every table the checks read, each with its own user and game"""
+    now = timezone.now()
+    start, end = period_bounds('daily', now)
+    users = User.objects.bulk_create([
+        User(username=f'qc{tag}-{n}', email=f'qc{tag}-{n}@example.com', password='!') for n in range(rows)
+    ])
+    games = Game.objects.bulk_create([
+        Game(title=f'qc{tag} {n}', description='', game_type='quiz', difficulty='easy') for n in range(rows)
+    ])
+    achievements = Achievement.objects.bulk_create([
+        Achievement(name=f'qc{tag} {n}', description='', achievement_type='score', requirement_value=n)
+        for n in range(rows)
+    ])
+    pairs = list(zip(users, games, achievements))
+    UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+    sessions = GameSession.objects.bulk_create([
+        GameSession(user=user, game=game, score=n, status='completed', end_time=now - timedelta(minutes=n))
+        for n, (user, game, _) in enumerate(pairs)
+    ])
+    SessionFlag.objects.bulk_create([
+        SessionFlag(session=session, user_id=session.user_id, game_id=session.game_id, reason='score',
+                    source='scan', score=session.score, value=session.score, threshold=0)
+        for session in sessions
+    ])
+    ScoreEvent.objects.bulk_create([
+        ScoreEvent(user=user, game=game, score=n, occurred_at=now - timedelta(minutes=n))
+        for n, (user, game, _) in enumerate(pairs)
+    ])
+    Leaderboard.objects.bulk_create([
+        Leaderboard(user=user, game=game if n % 2 else None, period='daily', period_start=start,
+                    period_end=end, total_score=n, rank=n + 1)
+        for n, (user, game, _) in enumerate(pairs)
+    ])
+    UserAchievement.objects.bulk_create([
+        UserAchievement(user=user, achievement=achievement) for user, _, achievement in pairs
+    ])
+    UserStats.objects.bulk_create([UserStats(user=user, total_games=1) for user in users])
+    Question.objects.bulk_create([
+        Question(game=game, difficulty='easy', question_text=f'qc{tag}-{n}', options=['a', 'b'], correct_answer='a')
+        for n, game in enumerate(games)
+    ])
+    UserGameStats.objects.bulk_create([
+        UserGameStats(user=user, game=game, total_games=1) for user, game, _ in pairs
+    ])
+
+
+@isolated_caches
+class QueryCountTests(IsolatedCacheMixin, TestCase):
+    """List pages cost the same number of queries at 5 rows as at 100 (no N+1)"""
+
+    SMALL = 5
+    LARGE = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='qc-admin', email='qc-admin@example.com', password=None)
+        _fixture(cls.SMALL, 'small')
+        _fixture(cls.LARGE, 'large')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def _count(self, func):
+        with CaptureQueriesContext(connection) as captured:
+            func()
+        return len(captured.captured_queries)
+
+    def test_admin_changelists(self):
+        for name, url in ADMIN_PAGES:
+            with self.subTest(name):
+                # Search for one fixture's usernames so the other stays out of the page.
+                self.client.get(url, {'q': 'qcsmall-'})
+                small = self._count(lambda: self.assertEqual(self.client.get(url, {'q': 'qcsmall-'}).status_code, 200))
+                with self.assertNumQueries(small):
+                    response = self.client.get(url, {'q': 'qclarge-'})
+                self.assertEqual(response.status_code, 200)
+
+    def test_list_serializers(self):
+        for name, serializer_class, model in SERIALIZERS:
+            with self.subTest(name):
+                small = self._count(lambda: serializer_class(
+                    model.objects.filter(user__username__startswith='qcsmall-'), many=True
+                ).data)
+                with self.assertNumQueries(small):
+                    data = serializer_class(model.objects.filter(user__username__startswith='qclarge-'), many=True).data
+                self.assertEqual(len(data), self.LARGE)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class RankedSkipListTests(SimpleTestCase):
+    def test_matches_a_sorted_list(self):
+        rng = random.Random(3)
+        ranking, expected = RankedSkipList(seed=3), []
+        for _ in range(2000):
+            if expected and rng.random() < 0.4:
+                key = expected.pop(rng.randrange(len(expected)))
+                ranking.remove(key)
+            else:
+                key = (rng.randrange(-1000, 0), rng.randrange(10 ** 6))
+                if key in expected:
+                    continue
+                ranking.insert(key)
+                expected.append(key)
+                expected.sort()
+        self.assertEqual(len(ranking), len(expected))
+        self.assertEqual(ranking.slice(0, len(expected)), expected)
+        for position, key in enumerate(expected, 1):
+            self.assertEqual(ranking.rank(key), position)
+        self.assertEqual(ranking.slice(10, 20), expected[10:20])
+
+    def test_build_matches_inserts(self):
+        keys = sorted((-n * 7 % 101, n) for n in range(500))
+        built = RankedSkipList(seed=1)
+        built.build(keys)
+        self.assertEqual(built.slice(0, 500), keys)
+        self.assertEqual([built.rank(key) for key in keys[::50]], list(range(1, 501, 50)))
+        built.insert((-1000, 0))
+        self.assertEqual(built.rank((-1000, 0)), 1)
+
+    def test_missing_keys(self):
+        ranking = RankedSkipList()
+        ranking.insert((1, 1))
+        with self.assertRaises(KeyError):
+            ranking.rank((2, 2))
+        with self.assertRaises(KeyError):
+            ranking.remove((2, 2))
+
+
+@isolated_caches
+class LeaderboardEngineTests(IsolatedCacheMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lb-player', email='lb-player@example.com', password=None)
+        cls.game = Game.objects.create(title='lb game', description='', game_type='quiz', difficulty='easy')
+
+    def setUp(self):
+        super().setUp()
+        self.engine = LeaderboardEngine(flush_size=1000, flush_interval=3600)
+        patcher = mock.patch('games.signals.leaderboard_engine', self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _complete(self, score):
+        session = GameSession.objects.create(user=self.user, game=self.game)
+        session.complete(score, 30)
+
+    def test_rolled_back_sessions_never_reach_the_boards(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self._complete(70)
+                    raise _Rollback()
+            except _Rollback:
+                pass
+        self.assertEqual(self.engine.top(self.game.id, 'all_time'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._complete(70)
+        top = self.engine.top(self.game.id, 'all_time')
+        self.assertEqual([(row['user_id'], row['total_score'], row['games_played']) for row in top],
+                         [(self.user.id, 70, 1)])
+
+    def test_failed_flush_keeps_ranks_dirty(self):
+        self.engine.record(self.user.id, self.game.id, 50)
+        with mock.patch('games.leaderboard.Leaderboard.objects.bulk_create', side_effect=RuntimeError('down')):
+            with self.assertRaises(RuntimeError):
+                self.engine.flush()
+        self.assertFalse(Leaderboard.objects.filter(user=self.user).exists())
+        self.engine.flush()
+        rows = Leaderboard.objects.filter(user=self.user, game=self.game, period='all_time')
+        self.assertEqual(list(rows.values_list('total_score', 'rank')), [(50, 1)])
+
+    def test_engines_in_separate_processes_add_up(self):
+        other = LeaderboardEngine(flush_size=1000, flush_interval=3600)
+        rival = User.objects.create_user(username='lb-rival', email='lb-rival@example.com', password=None)
+        # Both create the player's rows from empty boards.
+        self.engine.record(self.user.id, self.game.id, 50)
+        other.record(self.user.id, self.game.id, 30)
+        other.record(rival.id, self.game.id, 60)
+        self.engine.flush()
+        other.flush()
+
+        rows = Leaderboard.objects.filter(game=self.game, period='all_time')
+        self.assertEqual(rows.get(user=self.user).total_score, 80)
+        overall = Leaderboard.objects.filter(game=None, period='all_time', user=self.user)
+        self.assertEqual(list(overall.values_list('total_score', 'games_played')), [(80, 2)])
+
+        # The second engine saw rows move under it and reloads them, ranking the player first.
+        top = other.top(self.game.id, 'all_time')
+        self.assertEqual([(row['user_id'], row['total_score']) for row in top], [(self.user.id, 80), (rival.id, 60)])
+        other.flush()
+        self.assertEqual(list(rows.order_by('rank').values_list('user_id', 'rank')), [(self.user.id, 1), (rival.id, 2)])
+
+        self.engine.record(self.user.id, self.game.id, 5)
+        self.engine.flush()
+        self.assertEqual(rows.get(user=self.user).total_score, 85)
+
+
+@isolated_caches
+class SessionCompletionTests(IsolatedCacheMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.game = Game.objects.create(title='xp game', description='', game_type='quiz', difficulty='hard',
+                                       max_score=100)
+        cls.users = [
+            User.objects.create_user(username=f'xp-{n}', email=f'xp-{n}@example.com', password=None) for n in range(2)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('games.signals.leaderboard_engine', LeaderboardEngine())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _totals(self, user):
+        user.refresh_from_db()
+        return user.total_score, user.games_played, user.experience_points, user.level
+
+    def test_complete_credits_the_player_like_a_submission(self):
+        for score in (100, 60):
+            GameSession.objects.create(user=self.users[0], game=self.game).complete(score, 30)
+        buffer = SubmissionBuffer(flush_size=10, flush_interval=3600)
+        for score in (100, 60):
+            buffer.submit(self.users[1], self.game, score, 30)
+        buffer.flush()
+
+        experience = experience_for(self.game, 100) + experience_for(self.game, 60)
+        self.assertEqual(self._totals(self.users[0]), (160, 2, experience, curve.level_for(experience)))
+        self.assertGreater(curve.level_for(experience), 1)
+        self.assertEqual(self._totals(self.users[1]), self._totals(self.users[0]))
+
+    def test_adjustment_applies_to_totals_and_boards(self):
+        engine = LeaderboardEngine()
+        with mock.patch('games.signals.leaderboard_engine', engine), \
+                mock.patch('games.events.leaderboard_engine', engine):
+            with self.captureOnCommitCallbacks(execute=True):
+                GameSession.objects.create(user=self.users[0], game=self.game).complete(60, 30)
+            with self.captureOnCommitCallbacks(execute=True):
+                event = events.adjust(self.users[0].id, self.game.id, -20, experience=-10)
+
+        self.assertEqual(event.kind, 'adjustment')
+        experience = experience_for(self.game, 60) - 10
+        self.assertEqual(self._totals(self.users[0]), (40, 1, experience, curve.level_for(experience)))
+        top = engine.top(self.game.id, 'all_time')
+        self.assertEqual([(row['user_id'], row['total_score'], row['games_played']) for row in top],
+                         [(self.users[0].id, 40, 1)])
+
+
+@isolated_caches
+class UserStatsTests(IsolatedCacheMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.games = [
+            Game.objects.create(title=f'stats game {n}', description='', game_type='quiz', difficulty='easy')
+            for n in range(2)
+        ]
+        cls.user = User.objects.create_user(username='stats-player', email='stats-player@example.com', password=None)
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('games.signals.leaderboard_engine', LeaderboardEngine(flush_interval=3600))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _played(self, game, score, duration, days_ago):
+        session = GameSession.objects.create(user=self.user, game=game)
+        session.score, session.duration, session.status = score, duration, 'completed'
+        session.end_time = timezone.now() - timedelta(days=days_ago)
+        session.save()
+        stats.record_session(session)
+
+    def test_completed_sessions_update_the_totals(self):
+        GameSession.objects.create(user=self.user, game=self.games[0]).complete(40, 20)
+        GameSession.objects.create(user=self.user, game=self.games[1]).complete(90)
+
+        row = UserStats.objects.get(user=self.user)
+        self.assertEqual((row.total_games, row.total_score, row.best_score, row.timed_games), (2, 130, 90, 1))
+        # Untimed sessions stay out of the average duration.
+        self.assertEqual((row.average_score, row.average_duration), (65, 20))
+        per_game = UserGameStats.objects.filter(user=self.user).order_by('game_id')
+        self.assertEqual(list(per_game.values_list('total_games', 'total_score')), [(1, 40), (1, 90)])
+
+        # The maintained rows agree with a rebuild from the sessions (raises CommandError otherwise).
+        call_command('rebuild_user_stats', '--verify', stdout=io.StringIO())
+
+    def test_streaks_count_consecutive_days(self):
+        for days_ago in (5, 3, 2, 2, 1):
+            self._played(self.games[0], 10, 10, days_ago)
+        row = UserStats.objects.get(user=self.user)
+        self.assertEqual((row.current_streak, row.longest_streak), (3, 3))
+        self.assertEqual(row.last_played_on, timezone.localdate(timezone.now() - timedelta(days=1)))
+
+        # A late-arriving session from before the streak leaves it alone.
+        self._played(self.games[0], 10, 10, 4)
+        row.refresh_from_db()
+        self.assertEqual((row.total_games, row.current_streak, row.longest_streak), (6, 3, 3))
+
+    def test_user_stats_response(self):
+        self.assertEqual(self.client.get(reverse('user-stats')).status_code, 401)
+
+        self.client.force_login(self.user)
+        empty = self.client.get(reverse('user-stats')).json()
+        self.assertEqual((empty['total_games'], empty['average_score'], empty['level']), (0, 0, 1))
+
+        GameSession.objects.create(user=self.user, game=self.games[0]).complete(35, 10)
+        GameSession.objects.create(user=self.user, game=self.games[0]).complete(50, 15)
+        self.user.refresh_from_db()
+        body = self.client.get(reverse('user-stats')).json()
+        self.assertEqual(body, {
+            'total_games': 2,
+            'total_score': 85,
+            'average_score': 42.5,
+            'best_score': 50,
+            'average_duration': 12.5,
+            **curve.progress(self.user.experience_points),
+        })
+
+
+@isolated_caches
+class SubmissionBufferTests(IsolatedCacheMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.game = Game.objects.create(title='ingest game', description='', game_type='quiz', difficulty='easy')
+        self.alice = User.objects.create_user(username='ingest-alice', email='ingest-alice@example.com', password=None)
+        self.bob = User.objects.create_user(username='ingest-bob', email='ingest-bob@example.com', password=None)
+        self.buffer = SubmissionBuffer(flush_size=100, flush_interval=3600)
+        self.buffer._ensure_flusher = lambda: None
+        patcher = mock.patch('games.signals.leaderboard_engine', LeaderboardEngine(flush_interval=3600))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_a_bad_session_does_not_hold_up_the_batch(self):
+        self.buffer.submit(self.alice, self.game, 50, 10)
+        self.buffer.submit(self.bob, self.game, 70, 10)
+        User.objects.filter(pk=self.alice.pk).delete()
+
+        with self.assertLogs('games.ingest', 'WARNING'):
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.buffer.stats()['queue_depth'], 0)
+        self.assertEqual(self.buffer.metrics['dropped'], 1)
+        self.assertEqual(list(GameSession.objects.values_list('user_id', 'score')), [(self.bob.pk, 70)])
+        self.bob.refresh_from_db()
+        self.assertEqual((self.bob.total_score, self.bob.games_played), (70, 1))
+
+    def test_unavailable_database_requeues_the_batch(self):
+        self.buffer.submit(self.bob, self.game, 70, 10)
+        with mock.patch.object(self.buffer, '_write', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.stats()['queue_depth'], 1)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(GameSession.objects.filter(user=self.bob, status='completed').count(), 1)
+
+    def test_an_open_session_submitted_to_two_processes_is_credited_once(self):
+        session = GameSession.objects.create(user=self.bob, game=self.game)
+        other = SubmissionBuffer(flush_size=100, flush_interval=3600)
+        other._ensure_flusher = lambda: None
+        self.buffer.submit(self.bob, self.game, 70, 10, session.pk)
+        other.submit(self.bob, self.game, 40, 10, session.pk)
+        self.buffer.submit(self.bob, self.game, 20, 10)
+
+        self.assertEqual(self.buffer.flush(), 2)
+        with self.assertLogs('games.ingest', 'WARNING'):
+            self.assertEqual(other.flush(), 0)
+        self.assertEqual(other.metrics['dropped'], 1)
+        session.refresh_from_db()
+        self.assertEqual((session.status, session.score, session.duration), ('completed', 70, 10))
+        self.bob.refresh_from_db()
+        self.assertEqual((self.bob.total_score, self.bob.games_played), (90, 2))
+
+    def test_validate_submission_rejects_non_objects(self):
+        for body in ([1, 2], 'score', 3, None):
+            with self.subTest(body), self.assertRaises(SubmissionError):
+                validate_submission(self.game, body)
+
+
+@isolated_caches
+class AchievementIndexTests(IsolatedCacheMixin, TestCase):
+    def test_index_follows_the_shared_version(self):
+        Achievement.objects.create(name='Score 10', description='', achievement_type='score', requirement_value=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            Achievement.objects.create(name='Score 20', description='', achievement_type='score', requirement_value=20)
+        self.assertEqual(achievements.get_index().thresholds['score'], [10, 20])
+
+        # Another worker edits the rules: no signal reaches this process, only the shared version moves.
+        Achievement.objects.bulk_create([
+            Achievement(name='Score 30', description='', achievement_type='score', requirement_value=30),
+        ])
+        TieredCache('achievements', timeout=None).bump()
+        self.assertEqual(achievements.get_index().thresholds['score'], [10, 20, 30])
+
+
+@isolated_caches
+class RebuildBucketTests(IsolatedCacheMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.game = Game.objects.create(title='rollup game', description='', game_type='quiz', difficulty='easy')
+        cls.users = [
+            User.objects.create_user(username=f'rollup-{n}', email=f'rollup-{n}@example.com', password=None)
+            for n in range(3)
+        ]
+
+    def _event(self, user, score):
+        ScoreEvent.objects.create(user=user, game=self.game, score=score, occurred_at=timezone.now())
+
+    def _rows(self):
+        return dict(Leaderboard.objects.filter(game=self.game, period='all_time').values_list('user_id', 'total_score'))
+
+    def test_rebuild_keeps_row_ids_and_other_workers_reload(self):
+        start, end = period_bounds('all_time')
+        worker = LeaderboardEngine(flush_size=1000, flush_interval=3600)
+        for user, score in zip(self.users, (30, 20, 10)):
+            self._event(user, score)
+            worker.record(user.id, self.game.id, score)
+        worker.flush()
+        ids = dict(Leaderboard.objects.filter(game=self.game, period='all_time').values_list('user_id', 'id'))
+
+        # The log changed under the boards: user 0 is corrected to 5, user 2 leaves the board.
+        ScoreEvent.objects.filter(user=self.users[0]).update(score=5)
+        ScoreEvent.objects.filter(user=self.users[2]).delete()
+        with mock.patch('games.rollups.engine', LeaderboardEngine()):
+            rebuild_bucket('all_time', start, end)
+        self.assertEqual(self._rows(), {self.users[0].id: 5, self.users[1].id: 20})
+        after = dict(Leaderboard.objects.filter(game=self.game, period='all_time').values_list('user_id', 'id'))
+        self.assertEqual(after, {user_id: ids[user_id] for user_id in after})
+
+        # The running worker drops its stale board instead of writing its old totals back.
+        worker.record(self.users[0].id, self.game.id, 1)
+        worker.flush()
+        self.assertEqual(self._rows(), {self.users[0].id: 6, self.users[1].id: 20})
+        self.assertEqual(worker.top(self.game.id, 'all_time')[0]['user_id'], self.users[1].id)
+
+
+@isolated_caches
+class ArchiveTests(IsolatedCacheMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.game = Game.objects.create(title='archive game', description='', game_type='quiz', difficulty='easy')
+        cls.user = User.objects.create_user(username='archive-player', email='archive-player@example.com',
+                                            password=None)
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.archive = archive.Archive(directory.name)
+        # Three consecutive days in January, then one in March.
+        self.old = timezone.now().replace(year=2024, month=1, day=1, hour=12, minute=0, second=0, microsecond=0)
+        self.sessions = [
+            GameSession.objects.create(user=self.user, game=self.game, status='completed', score=score,
+                                       duration=duration, start_time=self.old + timedelta(days=day),
+                                       end_time=self.old + timedelta(days=day, seconds=30))
+            for day, score, duration in ((0, 10, 30), (1, 40, None), (2, 20, 12), (60, 5, 50))
+        ]
+        GameSession.objects.create(user=self.user, game=self.game, status='started')
+
+    def test_round_trip(self):
+        self.assertEqual(archive.archive(timezone.now(), segment_rows=2, target=self.archive), (4, 3))
+        self.assertEqual(GameSession.objects.filter(user=self.user).count(), 1)
+
+        rows = archive.SessionQuery(user_id=self.user.id, archive=self.archive).page(limit=10)
+        expected = sorted(self.sessions, key=lambda s: (s.start_time, s.id), reverse=True)
+        self.assertEqual([row['id'] for row in rows], [s.id for s in expected])
+        self.assertEqual(
+            [(row['score'], row['duration'], row['start_time'], row['end_time'], row['username']) for row in rows],
+            [(s.score, s.duration, s.start_time, s.end_time, 'archive-player') for s in expected],
+        )
+        cursor = (rows[1]['start_time'], rows[1]['id'])
+        page = archive.SessionQuery(user_id=self.user.id, archive=self.archive).page(cursor, limit=10)
+        self.assertEqual([row['id'] for row in page], [s.id for s in expected[2:]])
+        self.assertEqual(archive.SessionQuery(user_id=self.user.id + 1, archive=self.archive).page(), [])
+
+    def test_recover_lists_a_segment_whose_delete_committed(self):
+        columns = archive._columns(GameSession.objects.filter(id__in=[s.id for s in self.sessions]).values_list(
+            *(name for name, _ in archive.COLUMNS)))
+        archive.Segment.write(os.path.join(self.archive.directory, 'sessions-2024-01-1-0000.seg'), columns, '2024-01')
+        # Still live: the run died before its delete, so the file is discarded.
+        self.assertEqual(archive.recover(self.archive), 0)
+        self.assertEqual(self.archive.current(), [])
+
+        archive.Segment.write(os.path.join(self.archive.directory, 'sessions-2024-01-1-0001.seg'), columns, '2024-01')
+        archive._delete(columns['id'].tolist())
+        self.assertEqual(archive.recover(self.archive), 1)
+        self.assertEqual(sum(segment.header['rows'] for segment in self.archive.current()), 4)
+
+    def test_runs_exclude_each_other(self):
+        with archive._exclusive(self.archive), open(os.path.join(self.archive.directory, archive.LOCK_NAME)) as f:
+            with self.assertRaises(BlockingIOError):
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_backfill_counts_archived_sessions(self):
+        Achievement.objects.bulk_create([
+            Achievement(name=name, description='', achievement_type=kind, requirement_value=value)
+            for name, kind, value in (
+                ('Played 5', 'completion', 5), ('Played 6', 'completion', 6), ('Streak 3', 'streak', 3),
+                ('Streak 4', 'streak', 4), ('Score 40', 'score', 40), ('Fast 12', 'time', 12),
+                ('Fast 11', 'time', 11),
+            )
+        ])
+        archive.archive(timezone.now(), target=self.archive)
+        GameSession.objects.filter(status='started').update(status='completed', score=1, duration=100,
+                                                            end_time=self.old + timedelta(days=61))
+        with mock.patch('games.archive.store', self.archive):
+            achievements.backfill(index=achievements.AchievementIndex(
+                Achievement.objects.values_list('id', 'achievement_type', 'requirement_value')))
+        earned = set(UserAchievement.objects.filter(user=self.user).values_list('achievement__name', flat=True))
+        self.assertEqual(earned, {'Played 5', 'Streak 3', 'Score 40', 'Fast 12'})
+
+
+@isolated_caches
+@override_settings(SESSION_SWEEP_INTERVAL=60)
+class SessionSweeperTests(IsolatedCacheMixin, TestCase):
+    def _one_pass(self, sweeper):
+        with mock.patch('games.sweeper.time.sleep', side_effect=_Rollback):
+            with self.assertRaises(_Rollback):
+                sweeper._run()
+
+    def test_failures_are_counted_and_logged(self):
+        sweeper = SessionSweeper()
+        with mock.patch.object(sweeper, 'sweep', side_effect=OperationalError('database is locked')):
+            with self.assertLogs('games.sweeper', 'ERROR'):
+                self._one_pass(sweeper)
+        self.assertEqual(sweeper.stats()['errors'], 1)
+
+    def test_one_worker_sweeps_per_interval(self):
+        first, second = SessionSweeper(), SessionSweeper()
+        with mock.patch.object(first, 'sweep') as first_sweep, mock.patch.object(second, 'sweep') as second_sweep:
+            self._one_pass(first)
+            self._one_pass(second)
+        self.assertEqual((first_sweep.call_count, second_sweep.call_count), (1, 0))
+        self.assertEqual(second.stats()['skipped'], 1)
+
+
+class ScoreDeltaTests(SimpleTestCase):
+    def test_batches_merge_into_sorted_segments(self):
+        rng = np.random.default_rng(5)
+        delta, seen = _Delta(0), []
+        for _ in range(20):
+            game_ids = rng.integers(1, 4, size=int(rng.integers(0, 50)))
+            scores = rng.integers(0, 100, size=len(game_ids)).astype(np.int32)
+            delta.add(game_ids, scores, {1: 'easy', 2: 'easy', 3: 'hard'})
+            seen.append((game_ids, scores))
+        game_ids = np.concatenate([ids for ids, _ in seen])
+        scores = np.concatenate([part for _, part in seen])
+        self.assertEqual(delta.rows, len(scores))
+        for game_id in (1, 2, 3):
+            with self.subTest(game_id):
+                np.testing.assert_array_equal(delta.segments[game_key(game_id)], np.sort(scores[game_ids == game_id]))
+        np.testing.assert_array_equal(delta.segments[difficulty_key('easy')], np.sort(scores[game_ids != 3]))
+
+
+@isolated_caches
+class ScoreSnapshotMergeTests(IsolatedCacheMixin, SimpleTestCase):
+    def test_one_process_merges_at_a_time(self):
+        release = threading.Event()
+        first, second = ScoreDistributions(), ScoreDistributions()
+        with mock.patch.object(first, 'merge', side_effect=lambda: release.wait(5)) as first_merge, \
+                mock.patch.object(second, 'merge') as second_merge:
+            first._merge_in_background()
+            second._merge_in_background()
+            release.set()
+            first._merger.join(5)
+            # The lease is given back once the merge is done.
+            second._merge_in_background()
+            second._merger.join(5)
+        self.assertEqual((first_merge.call_count, second_merge.call_count), (1, 1))
+
+
+@isolated_caches
+class GameListTests(IsolatedCacheMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.quiz = Game.objects.create(title='Capital Cities', description='Name the capital', game_type='quiz',
+                                       difficulty='easy')
+        cls.puzzle = Game.objects.create(title='Sliding Tiles', description='', game_type='puzzle', difficulty='hard')
+        Game.objects.create(title='Retired', description='', game_type='quiz', difficulty='easy', is_active=False)
+
+    def _titles(self, response):
+        return [game['title'] for game in response.json()['games']]
+
+    def test_unchanged_catalogue_answers_304(self):
+        first = self.client.get(reverse('game-list'))
+        self.assertEqual(self._titles(first), ['Capital Cities', 'Sliding Tiles'])
+        again = self.client.get(reverse('game-list'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual((again.status_code, again.content, again['ETag']), (304, b'', first['ETag']))
+
+    def test_filters_have_their_own_etags(self):
+        whole = self.client.get(reverse('game-list'))
+        for query, titles in [({'difficulty': 'hard'}, ['Sliding Tiles']), ({'game_type': 'quiz'}, ['Capital Cities']),
+                              ({'search': 'CAPITAL'}, ['Capital Cities']), ({'difficulty': 'medium'}, [])]:
+            with self.subTest(query):
+                response = self.client.get(reverse('game-list'), query, HTTP_IF_NONE_MATCH=whole['ETag'])
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self._titles(response), titles)
+
+    def test_edits_invalidate_the_catalogue(self):
+        before = self.client.get(reverse('game-list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.puzzle.title = 'Sliding Blocks'
+            self.puzzle.save()
+        after = self.client.get(reverse('game-list'), HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(self._titles(after), ['Capital Cities', 'Sliding Blocks'])
+        self.assertNotEqual(after['ETag'], before['ETag'])
+
+    def test_edits_made_by_another_process_are_seen(self):
+        self.client.get(reverse('game-list'))
+        # No signal reaches this process: only the shared version moves.
+        Game.objects.filter(pk=self.quiz.pk).update(is_active=False)
+        self.assertEqual(self._titles(self.client.get(reverse('game-list'))), ['Capital Cities', 'Sliding Tiles'])
+        TieredCache('catalogue', timeout=None).bump()
+        self.assertEqual(self._titles(self.client.get(reverse('game-list'))), ['Sliding Tiles'])
+
+
+@isolated_caches
+class AnticheatTests(IsolatedCacheMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.game = Game.objects.create(title='watched game', description='', game_type='quiz', difficulty='easy',
+                                       max_score=1000)
+        cls.new_game = Game.objects.create(title='new game', description='', game_type='quiz', difficulty='easy',
+                                           max_score=1000)
+        cls.user = User.objects.create_user(username='suspect', email='suspect@example.com', password=None)
+        rng = random.Random(5)
+        sessions = [
+            GameSession(user=cls.user, game=cls.game, status='completed', score=int(rng.gauss(500, 50)),
+                        duration=rng.randint(50, 70), end_time=timezone.now())
+            for _ in range(150)
+        ]
+        sessions += [
+            # At twice the usual duration, so only the score stands out.
+            GameSession(user=cls.user, game=cls.game, status='completed', score=990, duration=120),
+            GameSession(user=cls.user, game=cls.game, status='completed', score=500, duration=1),
+            GameSession(user=cls.user, game=cls.game, status='completed', score=995),
+            GameSession(user=cls.user, game=cls.new_game, status='completed', score=990, duration=60),
+        ]
+        GameSession.objects.bulk_create(sessions, batch_size=500)
+        cls.score_outlier, cls.rate_outlier, cls.untimed_outlier = (session.pk for session in sessions[-4:-1])
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('games.signals.leaderboard_engine', LeaderboardEngine(flush_interval=3600))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _flags(self):
+        return sorted(SessionFlag.objects.values_list('session_id', 'reason', 'source'))
+
+    def test_baselines_follow_the_median_and_mad(self):
+        games = list(Game.objects.order_by('id').values_list('id', 'max_score'))
+        [baseline] = anticheat.compute_baselines(games, chunk_size=40)
+        scores = np.array(GameSession.objects.filter(game=self.game).values_list('score', flat=True), dtype=float)
+        median = np.median(scores)
+        # Read off 4096-bin histograms, so good to about a bin (0.25 points here).
+        self.assertEqual((baseline.game_id, baseline.sessions), (self.game.id, 153))
+        self.assertAlmostEqual(baseline.score_median, median, delta=0.5)
+        self.assertAlmostEqual(baseline.score_mad, np.median(np.abs(scores - median)), delta=0.5)
+        self.assertAlmostEqual(baseline.score_ceiling, baseline.score_median + 3.5 * 1.4826 * baseline.score_mad,
+                               places=6)
+        self.assertLess(baseline.score_ceiling, 990)
+        self.assertLess(baseline.rate_ceiling, 500)
+
+    def test_scan_flags_each_outlier_once(self):
+        expected = [(self.score_outlier, 'score', 'scan'), (self.rate_outlier, 'rate', 'scan'),
+                    (self.untimed_outlier, 'score', 'scan')]
+        baselines, scanned, flagged = anticheat.scan(chunk_size=40, dry_run=True)
+        self.assertEqual((len(baselines), scanned, flagged), (1, 154, 3))
+        self.assertEqual((self._flags(), ScoreBaseline.objects.count()), ([], 0))
+
+        anticheat.scan(chunk_size=40)
+        self.assertEqual(self._flags(), sorted(expected))
+        SessionFlag.objects.update(status='dismissed')
+        anticheat.scan(chunk_size=40)
+        self.assertEqual(SessionFlag.objects.filter(status='open').count(), 0)
+        # The new game has too few sessions for a baseline; only max_score bounds it.
+        self.assertFalse(ScoreBaseline.objects.filter(game=self.new_game).exists())
+
+    def test_submissions_are_checked_against_the_baseline(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            anticheat.scan(chunk_size=40)
+        SessionFlag.objects.all().delete()
+
+        flagged = GameSession.objects.create(user=self.user, game=self.game)
+        flagged.complete(980, 120)
+        GameSession.objects.create(user=self.user, game=self.game).complete(520, 60)
+        GameSession.objects.create(user=self.user, game=self.new_game).complete(980, 60)
+        self.assertEqual(self._flags(), [(flagged.pk, 'score', 'submission')])
+
+    def test_max_score_changes_reach_the_limits(self):
+        self.assertEqual(anticheat.check(self.new_game.id, 990, None), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.new_game.max_score = 900
+            self.new_game.save()
+        self.assertEqual(anticheat.check(self.new_game.id, 990, None), [('score', 990.0, 900.0)])
+
+
+@isolated_caches
+class SubmitGameTests(IsolatedCacheMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='submitter', email='submitter@example.com', password=None)
+        cls.game = Game.objects.create(title='submit game', description='', game_type='quiz', difficulty='easy')
+
+    def test_percentile_failure_does_not_fail_the_submission(self):
+        self.client.force_login(self.user)
+        session = GameSession(pk=1, user=self.user, game=self.game, end_time=timezone.now())
+        with mock.patch('games.views.submission_buffer.submit', return_value=session), \
+                mock.patch('games.views.score_distributions.percentile', side_effect=ValueError('bad index')), \
+                self.assertLogs('games.views', 'ERROR'):
+            response = self.client.post(reverse('game-submit', args=[self.game.id]), {'score': 10, 'time_taken': 5},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertIsNone(response.json()['percentile'])
+
+    def test_new_sessions_have_no_id_until_written(self):
+        self.client.force_login(self.user)
+        with mock.patch('games.views.submission_buffer._ensure_flusher'), \
+                mock.patch('games.views.session_sweeper.ensure_running'), \
+                mock.patch('games.views.submission_buffer._queue', []):
+            response = self.client.post(reverse('game-submit', args=[self.game.id]), {'score': 10, 'time_taken': 5},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertNotIn('id', response.json())
+
+
+@isolated_caches
+class QuestionBankTests(IsolatedCacheMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.games = [
+            Game.objects.create(title=f'bank game {n}', description='', game_type='quiz', difficulty='easy')
+            for n in range(2)
+        ]
+
+    def _texts(self, game):
+        pack = question_bank.pack(game.id, 'easy')
+        return sorted(question['question_text'] for question in json.loads(pack.sample(len(pack))))
+
+    def test_moved_question_leaves_the_old_game(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            question = Question.objects.create(game=self.games[0], difficulty='easy', question_text='1 + 1?',
+                                               options=['1', '2'], correct_answer='2')
+        self.assertEqual((self._texts(self.games[0]), self._texts(self.games[1])), (['1 + 1?'], []))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            question.game = self.games[1]
+            question.save()
+        self.assertEqual((self._texts(self.games[0]), self._texts(self.games[1])), ([], ['1 + 1?']))
+
+    def test_packs_are_invalidated_on_commit(self):
+        self.assertEqual(self._texts(self.games[0]), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Question.objects.create(game=self.games[0], difficulty='easy', question_text='2 + 2?',
+                                    options=['3', '4'], correct_answer='4')
+            # Rebuilt before the commit, the pack must not be cached for good.
+            self.assertEqual(self._texts(self.games[0]), [])
+        self.assertEqual(self._texts(self.games[0]), ['2 + 2?'])
+
+    def test_import_requires_question_text(self):
+        lines = [
+            {'game': self.games[0].id, 'difficulty': 'easy', 'options': ['1', '2'], 'correct_answer': '2'},
+            {'game': self.games[0].id, 'difficulty': 'easy', 'question_text': ' ', 'options': ['1', '2'],
+             'correct_answer': '2'},
+        ]
+        for entry in lines:
+            with self.subTest(entry), tempfile.NamedTemporaryFile('w', suffix='.jsonl') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                with self.assertRaises(CommandError):
+                    call_command('import_questions', f.name, stdout=io.StringIO())
+        self.assertFalse(Question.objects.exists())
+
+
+class LiveBoardsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'live-{n}', email=f'live-{n}@example.com', password=None)
+            for n in range(2)
+        ]
+
+    def test_tick_reads_boards_outside_the_lock(self):
+        live = LiveBoards(depth=10)
+        rows = [{'user_id': self.users[0].id, 'rank': 1, 'total_score': 10, 'games_played': 1}]
+
+        def top(game_id, period, limit):
+            self.assertFalse(live._lock.locked())
+            return rows
+
+        broker = mock.Mock()
+        with mock.patch.object(live, '_ensure_ticker'), mock.patch('games.live.get_broker', return_value=broker), \
+                mock.patch('games.live.engine') as engine:
+            engine.top.side_effect = lambda *args: rows
+            seq, _ = live.watch(5, 'all_time')
+            engine.top.side_effect = top
+            rows = [{'user_id': self.users[1].id, 'rank': 1, 'total_score': 20, 'games_played': 1},
+                    {'user_id': self.users[0].id, 'rank': 2, 'total_score': 10, 'games_played': 1}]
+            live.mark(5)
+            self.assertEqual(live.tick(), 1)
+            self.assertEqual(live.tick(), 0)
+
+        frames = {topic: message for (topic, message), _ in broker.publish.call_args_list}
+        seq, frame = frames[topic_for(5, 'all_time')]
+        frame = json.loads(frame)
+        self.assertEqual((seq, frame['type'], frame['seq']), (1, 'diff', 1))
+        self.assertEqual([(row['username'], row['rank'], row['previous_rank']) for row in frame['rows']],
+                         [('live-1', 1, None), ('live-0', 2, 1)])
+
+
+@isolated_caches
+class HistoryTests(IsolatedCacheMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.game = Game.objects.create(title='history game', description='', game_type='quiz', difficulty='easy')
+        cls.user = User.objects.create_user(username='history-player', email='history-player@example.com',
+                                            password=None)
+        cls.start = start = timezone.now().replace(year=2024, month=1, day=1, microsecond=0)
+        # Pairs of sessions share a start_time, so pages must break ties by id.
+        GameSession.objects.bulk_create([
+            GameSession(user=cls.user, game=cls.game, status='completed', score=n, duration=10,
+                        start_time=start + timedelta(days=n // 2), end_time=start + timedelta(days=n // 2, seconds=10))
+            for n in range(24)
+        ])
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.archive = archive.Archive(directory.name)
+
+    def _sessions(self):
+        rows = history.history(user_id=self.user.id)
+        rows.archived.archive = self.archive
+        return rows
+
+    def _walk(self, limit):
+        ids, cursor = [], None
+        while True:
+            rows, cursor = history.page(self._sessions(), cursor, limit)
+            ids += [row['id'] for row in rows]
+            if cursor is None:
+                return ids
+
+    def _expected(self):
+        sessions = GameSession.objects.filter(user=self.user).order_by('-start_time', '-id')
+        return list(sessions.values_list('id', flat=True))
+
+    def test_cursor_round_trip(self):
+        when = timezone.now()
+        self.assertEqual(history.decode_cursor(history.encode_cursor(when, 42)), (when, 42))
+        for bad in ('', 'not base64!', history.encode_cursor(when, 1)[:-3], 'bm8tc2VwYXJhdG9y'):
+            with self.subTest(bad), self.assertRaises(history.CursorError):
+                history.decode_cursor(bad)
+
+    def test_pages_cover_every_session_once(self):
+        expected = self._expected()
+        for limit in (1, 5, 24, 50):
+            with self.subTest(limit):
+                self.assertEqual(self._walk(limit), expected)
+
+    def test_pages_merge_archived_sessions(self):
+        expected = self._expected()
+        archive.archive(self.start + timedelta(days=6), target=self.archive)
+        self.assertEqual(GameSession.objects.filter(user=self.user).count(), 12)
+        for limit in (1, 5, 7, 50):
+            with self.subTest(limit):
+                self.assertEqual(self._walk(limit), expected)
+
+    def test_export_streams_live_then_archived_rows(self):
+        expected = self._expected()
+        archive.archive(self.start + timedelta(days=6), target=self.archive)
+        body = ''.join(history.stream(RequestFactory().get('/'), self._sessions(), 'ndjson'))
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()], expected)
+        body = ''.join(history.stream(RequestFactory().get('/'), self._sessions(), 'csv'))
+        lines = body.splitlines()
+        self.assertEqual(lines[0].split(','), history.EXPORT_COLUMNS)
+        self.assertEqual([int(line.split(',')[0]) for line in lines[1:]], expected)
@@ -4,4 +4,17 @@ from . import views
 urlpatterns = [
     path('', views.game_list, name='game-list'),
     path('stats/', views.user_stats, name='user-stats'),
+    path('stats/games/', views.user_game_stats, name='user-game-stats'),
+    path('<int:game_id>/questions/', views.game_questions, name='game-questions'),
+    path('<int:game_id>/submit/', views.submit_game, name='game-submit'),
+    path('<int:game_id>/history/', views.game_history, name='game-history'),
+    path('<int:game_id>/history/export/', views.game_history_export, name='game-history-export'),
+    path('history/', views.session_history, name='session-history'),
+    path('history/export/', views.session_history_export, name='session-history-export'),
+    path('ingest/', views.ingest_stats, name='ingest-stats'),
+    path('scores/percentile/', views.score_percentile, name='score-percentile'),
+    path('scores/quantiles/', views.score_quantiles, name='score-quantiles'),
+    path('scores/histogram/', views.score_histogram, name='score-histogram'),
+    path('leaderboard/', views.leaderboard_view, name='leaderboard'),
+    path('leaderboard/me/', views.my_rank_view, name='leaderboard-me'),
 ]
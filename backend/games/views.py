@@ -1,45 +1,341 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.utils import timezone
-from django.db.models import Q, Sum, Count
+from django.utils.cache import get_conditional_response
 import json
-from .models import Game, GameSession, Achievement, UserAchievement, Leaderboard
+import logging
+from .models import Game, Leaderboard, UserStats, UserGameStats
+from .catalogue import catalogue
+from .leaderboard import engine as leaderboard_engine, pages as leaderboard_pages
+from .levels import curve as level_curve
+from .ingest import buffer as submission_buffer, validate_submission, SubmissionError
+from .distributions import SnapshotMissing, difficulty_key, distributions as score_distributions, game_key
+from .questions import DIFFICULTIES, bank as question_bank
+from .sweeper import sweeper as session_sweeper
+from . import history
+from api.replicas import pin as pin_to_primary, primary, read_replica
+from users.auth import aget_user, aload
+from users.models import User
 
 
-def game_list(request):
+logger = logging.getLogger(__name__)
+
+
+async def game_list(request):
     """List all active games"""
-    games = Game.objects.filter(is_active=True)
-    games_data = []
-    for game in games:
-        games_data.append({
-            'id': game.id,
-            'title': game.title,
-            'description': game.description,
-            'game_type': game.game_type,
-            'difficulty': game.difficulty,
-            'max_score': game.max_score,
-            'time_limit': game.time_limit
-        })
-    return JsonResponse({'games': games_data})
-
-
-def user_stats(request):
+    snapshot = await catalogue.asnapshot()
+    body, etag = snapshot.filtered(
+        difficulty=request.GET.get('difficulty'),
+        game_type=request.GET.get('game_type'),
+        search=request.GET.get('search'),
+    )
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+async def game_questions(request, game_id):
+    """Random round of distinct questions from the game's question bank (?count=&difficulty=)"""
+    snapshot = await catalogue.asnapshot()
+    game = snapshot.by_id.get(game_id)
+    if game is None:
+        return JsonResponse({'error': 'Game not found'}, status=404)
+    
+    difficulty = request.GET.get('difficulty') or game['difficulty']
+    if difficulty not in DIFFICULTIES:
+        return JsonResponse({'error': 'Invalid difficulty'}, status=400)
+    try:
+        count = min(int(request.GET.get('count', 10)), 50)
+    except ValueError:
+        return JsonResponse({'error': 'count must be an integer'}, status=400)
+    if count < 1:
+        return JsonResponse({'error': 'count must be positive'}, status=400)
+    
+    pack = await question_bank.apack(game_id, difficulty)
+    body = b'{"game":%d,"difficulty":"%s","questions":%s}' % (game_id, difficulty.encode(), pack.sample(count))
+    response = HttpResponse(body, content_type='application/json')
+    # Every round is a fresh sample.
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@read_replica
+async def user_stats(request):
     """Get user statistics"""
-    if not request.user.is_authenticated:
+    user = await aget_user(request)
+    if not user.is_authenticated:
         return JsonResponse({'error': 'Not authenticated'}, status=401)
     
-    user = request.user
-    sessions = GameSession.objects.filter(user=user, status='completed')
-    
-    total_games = sessions.count()
-    total_score = sessions.aggregate(Sum('score'))['score__sum'] or 0
-    avg_score = total_score / total_games if total_games > 0 else 0
+    stats = await UserStats.objects.filter(pk=user.pk).afirst() or UserStats(user=user)
+    await aload(user, 'experience_points')
     
     return JsonResponse({
-        'total_games': total_games,
-        'total_score': total_score,
-        'average_score': round(avg_score, 2),
-        'level': user.level,
-        'experience_points': user.experience_points,
+        'total_games': stats.total_games,
+        'total_score': stats.total_score,
+        'average_score': round(stats.average_score, 2),
+        'best_score': stats.best_score,
+        'average_duration': round(stats.average_duration, 2),
+        **level_curve.progress(user.experience_points),
     })
+
+
+@read_replica
+def user_game_stats(request):
+    """Per-game breakdown of user statistics"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+    
+    breakdown = UserGameStats.objects.filter(user=request.user).select_related('game')
+    return JsonResponse({'games': [
+        {
+            'game_id': row.game_id,
+            'game_title': row.game.title,
+            'total_games': row.total_games,
+            'total_score': row.total_score,
+            'average_score': round(row.average_score, 2),
+            'best_score': row.best_score,
+            'average_duration': round(row.average_duration, 2),
+        }
+        for row in breakdown
+    ]})
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def submit_game(request, game_id):
+    """Submit a completed game session"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+    
+    game = Game.objects.filter(pk=game_id, is_active=True).first()
+    if game is None:
+        return JsonResponse({'error': 'Game not found'}, status=404)
+    
+    try:
+        data = json.loads(request.body)
+        score, duration = validate_submission(game, data)
+        session = submission_buffer.submit(request.user, game, score, duration, data.get('session_id'))
+    except (ValueError, SubmissionError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    pin_to_primary(request.user.id)
+    session_sweeper.ensure_running()
+    # The submission is already queued; a missing or unreadable snapshot only costs the percentile.
+    try:
+        percentile = score_distributions.percentile(game.id, score)
+    except SnapshotMissing:
+        percentile = None
+    except Exception:
+        logger.exception("Score percentile lookup failed for game %s", game.id)
+        percentile = None
+    
+    result = {
+        'game': game.id,
+        'score': score,
+        'max_score': game.max_score,
+        'time_taken': duration,
+        'completed_at': session.end_time.isoformat(),
+        'status': 'queued',
+        'percentile': percentile,
+    }
+    # New sessions get their id when the queue is flushed, after this response.
+    if session.pk is not None:
+        result['id'] = session.pk
+    return JsonResponse(result, status=202)
+
+
+def ingest_stats(request):
+    """Submission queue depth and flush latency, and the stale-session sweeper's progress"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Not authorized'}, status=403)
+    return JsonResponse({**submission_buffer.stats(), 'sweeper': session_sweeper.stats()})
+
+
+DEFAULT_QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+MAX_HISTOGRAM_BINS = 200
+
+
+def _distribution_key(request):
+    game_id = request.GET.get('game')
+    difficulty = request.GET.get('difficulty')
+    if bool(game_id) == bool(difficulty):
+        raise ValueError('Pass exactly one of game and difficulty')
+    if difficulty:
+        if difficulty not in DIFFICULTIES:
+            raise ValueError('Invalid difficulty')
+        return difficulty_key(difficulty), {'difficulty': difficulty}
+    return game_key(int(game_id)), {'game': int(game_id)}
+
+
+def _distribution_view(request, answer):
+    try:
+        return JsonResponse(answer())
+    except SnapshotMissing as e:
+        return JsonResponse({'error': str(e)}, status=503)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+def score_percentile(request):
+    """Share of a game's completed sessions that scored below ?score="""
+    def answer():
+        game_id, score = int(request.GET['game']), int(request.GET['score'])
+        return {'game': game_id, 'score': score, 'percentile': score_distributions.percentile(game_id, score),
+                'sessions': score_distributions.count(game_key(game_id))}
+
+    if 'game' not in request.GET or 'score' not in request.GET:
+        return JsonResponse({'error': 'game and score are required'}, status=400)
+    return _distribution_view(request, answer)
+
+
+def score_quantiles(request):
+    """Score quantiles for a game or a difficulty (?q=0.5,0.9)"""
+    def answer():
+        key, scope = _distribution_key(request)
+        probabilities = DEFAULT_QUANTILES
+        if request.GET.get('q'):
+            probabilities = [float(q) for q in request.GET['q'].split(',')]
+        if not all(0 <= probability <= 1 for probability in probabilities):
+            raise ValueError('Quantiles must be between 0 and 1')
+        quantiles = score_distributions.quantiles(key, probabilities)
+        return {**scope, 'sessions': score_distributions.count(key), 'quantiles': quantiles and [
+            {'q': probability, 'score': value} for probability, value in quantiles.items()
+        ]}
+
+    return _distribution_view(request, answer)
+
+
+def score_histogram(request):
+    """Score histogram for a game or a difficulty (?bins=&min=&max=)"""
+    def answer():
+        key, scope = _distribution_key(request)
+        bins = int(request.GET.get('bins', 20))
+        if not 1 <= bins <= MAX_HISTOGRAM_BINS:
+            raise ValueError(f'bins must be between 1 and {MAX_HISTOGRAM_BINS}')
+        low, high = request.GET.get('min'), request.GET.get('max')
+        histogram = score_distributions.histogram(
+            key, bins, int(low) if low else None, int(high) if high else None
+        )
+        edges, counts = histogram or (None, None)
+        return {**scope, 'sessions': score_distributions.count(key), 'edges': edges, 'counts': counts}
+
+    return _distribution_view(request, answer)
+
+
+def _leaderboard_params(request):
+    period = request.GET.get('period', 'all_time')
+    if period not in dict(Leaderboard.PERIOD_CHOICES):
+        raise ValueError('Invalid period')
+    game_id = request.GET.get('game')
+    return (int(game_id) if game_id else None), period
+
+
+def _with_usernames(rows):
+    user_ids = [row['user_id'] for row in rows]
+    usernames = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+    missing = [user_id for user_id in user_ids if user_id not in usernames]
+    if missing:
+        # Players who signed up after the replica's last sync.
+        with primary():
+            usernames.update(User.objects.filter(id__in=missing).values_list('id', 'username'))
+    for row in rows:
+        row['username'] = usernames.get(row['user_id'])
+    return rows
+
+
+@read_replica
+def leaderboard_view(request):
+    """Top players for a game/period board"""
+    try:
+        game_id, period = _leaderboard_params(request)
+        limit = min(int(request.GET.get('limit', 10)), 100)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    rows = leaderboard_pages.get_or_set(
+        f'top:{game_id}:{period}:{limit}',
+        lambda: _with_usernames(leaderboard_engine.top(game_id, period, limit)),
+    )
+    return JsonResponse({'period': period, 'game': game_id, 'leaderboard': rows})
+
+
+@read_replica
+def my_rank_view(request):
+    """Current user's rank plus neighbouring players"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+    
+    try:
+        game_id, period = _leaderboard_params(request)
+        radius = min(int(request.GET.get('radius', 5)), 50)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    rank, rows = leaderboard_engine.around(game_id, period, request.user.id, radius)
+    return JsonResponse({'period': period, 'game': game_id, 'rank': rank, 'leaderboard': _with_usernames(rows)})
+
+
+def _history_scope(request, game_id=None):
+    """(user_id, game_id) filters the requester may read; raises PermissionError"""
+    if not request.user.is_authenticated:
+        raise PermissionError('Not authenticated')
+    if request.user.is_staff:
+        user_id = request.GET.get('user')
+        return (int(user_id) if user_id else None), game_id
+    if game_id is not None:
+        # Other players' sessions of a game are staff only; players see their own.
+        return request.user.id, game_id
+    return request.user.id, None
+
+
+def _history_response(request, game_id=None):
+    try:
+        user_id, game_id = _history_scope(request, game_id)
+        limit = min(int(request.GET.get('limit', 50)), 200)
+        rows = history.history(user_id, game_id, request.GET.get('status'))
+        results, next_cursor = history.page(rows, request.GET.get('cursor'), limit)
+    except PermissionError as e:
+        return JsonResponse({'error': str(e)}, status=401)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'results': results, 'next': next_cursor})
+
+
+def _export_response(request, game_id=None):
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in history.EXPORT_FORMATS:
+        return JsonResponse({'error': 'format must be ndjson or csv'}, status=400)
+    try:
+        user_id, game_id = _history_scope(request, game_id)
+    except PermissionError as e:
+        return JsonResponse({'error': str(e)}, status=401)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    rows = history.history(user_id, game_id, request.GET.get('status'))
+    response = StreamingHttpResponse(
+        history.stream(request, rows, export_format),
+        content_type=history.EXPORT_FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="sessions.{export_format}"'
+    return response
+
+
+def session_history(request):
+    """Keyset-paginated session history, newest first (?cursor=&limit=&status=)"""
+    return _history_response(request)
+
+
+def game_history(request, game_id):
+    """Keyset-paginated session history for one game"""
+    return _history_response(request, game_id)
+
+
+def session_history_export(request):
+    """Stream the full session history as NDJSON or CSV (?format=)"""
+    return _export_response(request)
+
+
+def game_history_export(request, game_id):
+    """Stream one game's session history as NDJSON or CSV"""
+    return _export_response(request, game_id)
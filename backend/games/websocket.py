@@ -0,0 +1,92 @@
+"""
+WebSocket endpoints, served by the ASGI application next to Django.
+
+``/ws/leaderboard/?game=<id>&period=<period>`` sends a ``snapshot`` frame
+with the top of the board, then one ``diff`` frame per ticker interval in
+which the board changed (see ``games.live``). Leave ``game`` out to follow
+the overall board.
+"""
+
+import asyncio
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+
+from .live import live_boards, topic_for
+from .models import Leaderboard
+from .pubsub import get_broker
+
+
+# Close codes: 4400 for bad parameters, 1013 (try again later) for a consumer that fell behind.
+CLOSE_BAD_REQUEST = 4400
+CLOSE_TRY_AGAIN = 1013
+
+
+def _board_params(query_string):
+    params = parse_qs(query_string.decode())
+    period = params.get('period', ['all_time'])[0]
+    if period not in dict(Leaderboard.PERIOD_CHOICES):
+        raise ValueError('Invalid period')
+    game_id = params.get('game', [''])[0]
+    return (int(game_id) if game_id else None), period
+
+
+async def leaderboard_socket(scope, receive, send):
+    """Push live rank diffs for one (game, period) board"""
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    try:
+        game_id, period = _board_params(scope.get('query_string', b''))
+    except ValueError:
+        await send({'type': 'websocket.close', 'code': CLOSE_BAD_REQUEST})
+        return
+
+    broker = get_broker()
+    # Subscribe before the snapshot so no diff published in between is lost.
+    subscription = await broker.subscribe(topic_for(game_id, period))
+    try:
+        seq, snapshot = await sync_to_async(live_boards.watch)(game_id, period)
+    except Exception:
+        broker.unsubscribe(subscription)
+        raise
+
+    await send({'type': 'websocket.accept'})
+    await send({'type': 'websocket.send', 'text': snapshot})
+    incoming = asyncio.ensure_future(receive())
+    outgoing = asyncio.ensure_future(subscription.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({incoming, outgoing}, return_when=asyncio.FIRST_COMPLETED)
+            if incoming in done:
+                if incoming.result()['type'] == 'websocket.disconnect':
+                    break
+                # Client messages (pings) need no reply.
+                incoming = asyncio.ensure_future(receive())
+            if outgoing in done:
+                message = outgoing.result()
+                if message is None:
+                    await send({'type': 'websocket.close', 'code': CLOSE_TRY_AGAIN})
+                    break
+                frame_seq, frame = message
+                if frame_seq > seq:
+                    await send({'type': 'websocket.send', 'text': frame})
+                outgoing = asyncio.ensure_future(subscription.get())
+    finally:
+        incoming.cancel()
+        outgoing.cancel()
+        broker.unsubscribe(subscription)
+        live_boards.unwatch(game_id, period)
+
+
+ROUTES = {
+    '/ws/leaderboard/': leaderboard_socket,
+}
+
+
+async def websocket_application(scope, receive, send):
+    handler = ROUTES.get(scope['path'])
+    if handler is None:
+        await receive()
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    await handler(scope, receive, send)
@@ -0,0 +1,34 @@
+"""
+Entry points for process pools.
+
+Spawned workers import this module to unpickle their tasks before Django
+is set up, so it must not import models at module level; each task
+imports what it needs once ``setup`` has run.
+"""
+
+
+def setup():
+    import django
+
+    django.setup()
+
+
+def fold_partition(bounds):
+    from .projections import fold_partition
+
+    return fold_partition(bounds)
+
+
+def configure(overrides):
+    """``setup`` with some settings replaced, before any connection is opened"""
+    from django.conf import settings
+
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    setup()
+
+
+def contention_worker(threads, duration, user_ids, games, seed):
+    from .contention import run_worker
+
+    return run_worker(threads, duration, user_ids, games, seed)
@@ -30,11 +30,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.TokenAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -67,6 +69,71 @@ DATABASES = {
     }
 }
 
+# DB_PROFILE=production tunes SQLite for concurrent traffic (see api.sqlite3
+# and api.db): WAL and the pragmas below on every connection, connections
+# kept open between requests, and write transactions serialized on one thread.
+DB_PROFILE = os.environ.get('DB_PROFILE', 'development')
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+}
+SQLITE_SERIALIZE_WRITES = DB_PROFILE == 'production'
+SQLITE_WRITER_BATCH = 64
+SQLITE_WRITER_RETRIES = 3
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'ENGINE': 'api.sqlite3',
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+    })
+
+# Read replicas (see api.replicas): views marked read_replica read from one of
+# REPLICA_DATABASES, except for users pinned to the primary after a write.
+# DB_REPLICA=<path> adds a local stand-in, a copy of the SQLite primary that
+# `manage.py sync_replica` refreshes every REPLICA_SYNC_INTERVAL seconds.
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+REPLICA_DATABASES = []
+if os.environ.get('DB_REPLICA'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['DB_REPLICA'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES = ['replica']
+REPLICA_SYNC_INTERVAL = float(os.environ.get('REPLICA_SYNC_INTERVAL', 2.0))
+REPLICA_PIN_SECONDS = 10
+
+# Caches (see api.cache): 'shared' is the cross-process tier behind each
+# worker's in-memory LRU. Files under BASE_DIR by default (not the system temp
+# directory, which tmp cleaners empty and other users can write); point it at
+# django.core.cache.backends.db.DatabaseCache (after createcachetable) or
+# Redis/memcached with SHARED_CACHE_BACKEND and SHARED_CACHE_LOCATION.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': os.environ.get('SHARED_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('SHARED_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+CACHE_LOCAL_SIZE = 1024
+CACHE_LOCAL_TTL = 2.0
+CACHE_LOCK_TIMEOUT = 5.0
+
+# Stateless API tokens (see users.tokens), sent as "Authorization: Token ...".
+# AUTH_TOKEN_KEYS="new-id:secret,old-id:secret": the first key signs, all of
+# them verify. Rotate by prepending a key; drop the old one after AUTH_TOKEN_TTL.
+if os.environ.get('AUTH_TOKEN_KEYS'):
+    AUTH_TOKEN_KEYS = [tuple(key.split(':', 1)) for key in os.environ['AUTH_TOKEN_KEYS'].split(',')]
+else:
+    AUTH_TOKEN_KEYS = [('default', SECRET_KEY)]
+AUTH_TOKEN_TTL = int(os.environ.get('AUTH_TOKEN_TTL', 24 * 3600))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -83,6 +150,20 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing: the first hasher encodes new passwords; the rest only verify
+# legacy hashes, which are re-encoded with the first on the next login.
+PASSWORD_HASHERS = [
+    'users.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 600000))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', PASSWORD_HASH_WORKERS * 8 or 8))
+PASSWORD_CACHE_TTL = 60
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -102,3 +183,48 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Custom user model
 AUTH_USER_MODEL = 'users.User'
+
+# Experience and level curve (see games.levels); run relevel_users after changing the curve
+XP_PER_GAME = 100
+XP_LEVEL_BASE = 100
+XP_LEVEL_EXPONENT = 1.5
+XP_MAX_LEVEL = 100
+
+# Abandoning open sessions (see games.sweeper): a session still 'started' this long
+# after its game's time_limit (SESSION_ABANDON_AFTER without one) is closed.
+# Run `manage.py sweep_sessions` from cron; failing that, SESSION_SWEEP_INTERVAL
+# sweeps from the web processes, one of them per interval.
+SESSION_SWEEP_GRACE = 300
+SESSION_ABANDON_AFTER = 3600
+SESSION_SWEEP_CHUNK = 500
+SESSION_SWEEP_INTERVAL = float(os.environ['SESSION_SWEEP_INTERVAL']) if os.environ.get('SESSION_SWEEP_INTERVAL') else None
+
+# Score distribution snapshot (see games.distributions), rebuilt or merged by
+# `manage.py build_score_snapshot`; each process folds newer sessions in every
+# SCORE_SNAPSHOT_REFRESH seconds
+SCORE_SNAPSHOT_DIR = os.environ.get('SCORE_SNAPSHOT_DIR', os.path.join(BASE_DIR, 'scores'))
+SCORE_SNAPSHOT_REFRESH = 5.0
+# A process whose in-memory delta reaches this many scores merges it into a new
+# snapshot file itself (one process at a time); None leaves it to --merge
+SCORE_SNAPSHOT_MERGE_ROWS = 200000
+
+# Session archive (see games.archive): `manage.py archive_sessions` moves finished
+# sessions older than ARCHIVE_AFTER_DAYS (whole months) into segment files here.
+# This is the only copy of those sessions, so keep it on durable storage.
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+ARCHIVE_AFTER_DAYS = 365
+
+# Anti-cheat (see games.anticheat): robust z-scores above which a session's score or
+# points per second are flagged, and the completed sessions a game needs for a baseline
+ANTICHEAT_SCORE_Z = 3.5
+ANTICHEAT_RATE_Z = 3.5
+ANTICHEAT_MIN_SAMPLES = 100
+
+# Live leaderboard pushes over WebSockets (see games.live)
+PUBSUB_BACKEND = 'games.pubsub.LocalBroker'
+LEADERBOARD_PUSH_INTERVAL = 0.5
+
+# Request instrumentation (see api.middleware); adds Server-Timing headers when enabled
+PERF_SERVER_TIMING = DEBUG
+# Bearer token a scraper sends to read /api/metrics/ without a staff login
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
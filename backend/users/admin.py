@@ -23,5 +23,6 @@ class UserAdmin(BaseUserAdmin):
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'theme_preference', 'notifications_enabled', 'privacy_level')
+    list_select_related = ('user',)
     list_filter = ('theme_preference', 'notifications_enabled', 'privacy_level')
     search_fields = ('user__username', 'user__email')
@@ -0,0 +1,18 @@
+from asgiref.sync import sync_to_async
+
+
+def _resolve_user(request):
+    # Touching an attribute evaluates the lazy object AuthenticationMiddleware installs.
+    request.user.is_authenticated
+    return request.user
+
+
+async def aget_user(request):
+    """Resolve ``request.user`` from an async view without blocking the event loop"""
+    return await sync_to_async(_resolve_user)(request)
+
+
+async def aload(user, *fields):
+    """Load ``fields`` of a token principal before async code reads them"""
+    if set(fields) & user.get_deferred_fields():
+        await user.arefresh_from_db(fields=fields)
@@ -0,0 +1,54 @@
+"""
+Password hasher with a tunable work factor, and the functions the hashing
+pool runs in its worker processes.
+
+``TunablePBKDF2PasswordHasher`` keeps the ``pbkdf2_sha256`` algorithm name,
+so existing hashes still verify and any hash with a different iteration
+count (or a legacy algorithm) reports ``must_update`` and is re-encoded on
+the next successful login.
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    PBKDF2PasswordHasher,
+    get_hasher,
+    identify_hasher,
+    make_password,
+)
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with ``PASSWORD_PBKDF2_ITERATIONS`` iterations"""
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+def init_worker(overrides):
+    """Give a worker process the parent's hasher settings"""
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+
+def encode(password):
+    return make_password(password)
+
+
+def verify(password, encoded):
+    """
+    Return (valid, upgraded) for ``password`` against ``encoded``.
+
+    ``upgraded`` is a new encoding with the preferred hasher when the stored
+    one is valid but uses a legacy algorithm or work factor, else None.
+    """
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False, None
+    if not hasher.verify(password, encoded):
+        return False, None
+    preferred = get_hasher('default')
+    if hasher.algorithm != preferred.algorithm or preferred.must_update(encoded):
+        return True, make_password(password, hasher=preferred)
+    return True, None
@@ -0,0 +1,78 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from games.loadgen import percentile
+from users import tokens
+from users.models import User
+
+
+ENDPOINTS = [
+    ('profile', '/api/auth/profile/'),
+    ('stats', '/api/games/stats/'),
+    ('stats/games', '/api/games/stats/games/'),
+    ('leaderboard/me', '/api/games/leaderboard/me/'),
+    ('history', '/api/games/history/?limit=20'),
+]
+
+
+class Command(BaseCommand):
+    help = "Compare queries and latency per authenticated request with session cookies and API tokens"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="User id to authenticate as (default: the most active player)")
+        parser.add_argument('--requests', type=int, default=200, help="Timed requests per endpoint and mode")
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.filter(pk=options['user']).first()
+        else:
+            user = User.objects.order_by('-games_played').first()
+        if user is None:
+            raise CommandError("No such user; run seed_data first")
+
+        session_client = Client()
+        session_client.force_login(user)
+        token_client = Client(HTTP_AUTHORIZATION=f'Token {tokens.issue(user)}')
+        modes = [('session', session_client), ('token', token_client)]
+
+        self.stdout.write(f"user {user.pk} ({user.username}), {options['requests']} requests per endpoint and mode")
+        self.stdout.write(f"{'endpoint':<16}{'session q':>10}{'token q':>9}{'removed':>9}"
+                          f"{'session p50':>13}{'token p50':>11}")
+        removed = 0
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, url in ENDPOINTS:
+                row = {}
+                for mode, client in modes:
+                    # Warm caches and connections, then count the queries of one steady-state request
+                    # (CaptureQueriesContext would be emptied by the request_started signal).
+                    response = client.get(url)
+                    if response.status_code != 200:
+                        raise CommandError(f"{mode} {url} answered {response.status_code}")
+                    queries = []
+
+                    def count(execute, sql, *args):
+                        queries.append(sql)
+                        return execute(sql, *args)
+
+                    with connection.execute_wrapper(count):
+                        client.get(url)
+                    latencies = []
+                    for _ in range(options['requests']):
+                        started = time.perf_counter()
+                        client.get(url)
+                        latencies.append(time.perf_counter() - started)
+                    row[mode] = (len(queries), percentile(sorted(latencies), 0.50) * 1000)
+                removed += row['session'][0] - row['token'][0]
+                self.stdout.write(
+                    f"{name:<16}{row['session'][0]:>10}{row['token'][0]:>9}"
+                    f"{row['session'][0] - row['token'][0]:>9}"
+                    f"{row['session'][1]:>11.2f}ms{row['token'][1]:>9.2f}ms"
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f"Tokens saved {removed} queries across {len(ENDPOINTS)} authenticated requests"
+        ))
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+from django.test.utils import override_settings
+
+from games.loadgen import percentile
+from users import passwords
+from users.models import User
+
+
+BENCH_PASSWORD = 'bench-login-password'
+MODES = {
+    # Hash on a thread inside the web process with no credential cache (the old path).
+    'inline': {'PASSWORD_HASH_WORKERS': 0, 'PASSWORD_CACHE_TTL': 0},
+    'pool': {'PASSWORD_CACHE_TTL': 0},
+    'pool+cache': {},
+}
+
+
+class Command(BaseCommand):
+    help = "Measure login throughput with inline hashing, the hashing pool and the credential cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help="Distinct accounts to log in as")
+        parser.add_argument('--rounds', type=int, default=3, help="Logins per account")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--mode', choices=[*MODES, 'all'], default='all')
+
+    def handle(self, *args, **options):
+        emails = self.accounts(options['users'])
+        modes = list(MODES) if options['mode'] == 'all' else [options['mode']]
+        cores = os.cpu_count() or 1
+        self.stdout.write(f"{len(emails)} accounts x {options['rounds']} rounds, "
+                          f"concurrency {options['concurrency']}, {cores} core(s)")
+        self.stdout.write(f"{'mode':<12}{'logins':>8}{'busy':>6}{'failed':>8}{'login/s':>10}"
+                          f"{'per core':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for mode in modes:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], **MODES[mode]):
+                passwords.pool.shutdown()
+                passwords.credentials.clear()
+                elapsed, latencies, statuses = asyncio.run(
+                    self.run(emails, options['rounds'], options['concurrency'])
+                )
+                passwords.pool.shutdown()
+            ordered = sorted(latencies)
+            ok = statuses.count(200)
+            self.stdout.write(
+                f"{mode:<12}{ok:>8}{statuses.count(503):>6}{len(statuses) - ok - statuses.count(503):>8}"
+                f"{ok / elapsed:>10.1f}{ok / elapsed / cores:>10.1f}"
+                f"{percentile(ordered, 0.50) * 1000:>10.1f}{percentile(ordered, 0.95) * 1000:>10.1f}"
+            )
+
+    def accounts(self, count):
+        emails = [f'bench-login-{n}@example.com' for n in range(count)]
+        encoded = make_password(BENCH_PASSWORD)
+        User.objects.bulk_create(
+            [User(username=email.split('@')[0], email=email, password=encoded) for email in emails],
+            ignore_conflicts=True,
+        )
+        User.objects.filter(email__in=emails).update(password=encoded)
+        return emails
+
+    async def run(self, emails, rounds, concurrency):
+        # Start the worker processes outside the timed section.
+        await passwords.amake_password(BENCH_PASSWORD)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, statuses = [], []
+
+        async def login(email):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await AsyncClient().post(
+                    '/api/auth/login/',
+                    json.dumps({'email': email, 'password': BENCH_PASSWORD}),
+                    content_type='application/json',
+                )
+                latencies.append(time.perf_counter() - started)
+                statuses.append(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(login(email) for _ in range(rounds) for email in emails))
+        return time.perf_counter() - started, latencies, statuses
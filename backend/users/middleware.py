@@ -0,0 +1,32 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import tokens
+
+
+class TokenAuthenticationMiddleware:
+    """Token-authenticated requests replace the session user; others are left alone"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.process_request(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        user = await tokens.aauthenticate(request)
+        if user is not None:
+            request.user = user
+        return await self.get_response(request)
+
+    def process_request(self, request):
+        user = tokens.authenticate(request)
+        if user is not None:
+            request.user = user
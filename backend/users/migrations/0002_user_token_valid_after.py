@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='token_valid_after',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -9,6 +9,8 @@ class User(AbstractUser):
     birth_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Tokens issued at or before this are refused (users.tokens.revoke).
+    token_valid_after = models.DateTimeField(null=True, blank=True, editable=False)
     
     # Gaming related fields
     total_score = models.IntegerField(default=0)
@@ -22,6 +24,13 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
     
+    def refresh_from_db(self, using=None, fields=None):
+        # Token principals (users.tokens) load every deferred field on the first
+        # one a view touches, rather than one query per field.
+        if fields is not None and self.__dict__.pop('_load_deferred_together', False):
+            fields = {*fields, *self.get_deferred_fields()}
+        super().refresh_from_db(using=using, fields=fields)
+    
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}".strip()
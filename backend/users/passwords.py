@@ -0,0 +1,232 @@
+"""
+Password hashing off the request path.
+
+Hashing and verification run in a bounded process pool so a login storm
+saturates the pool rather than every request worker. At most
+``PASSWORD_HASH_MAX_PENDING`` jobs may be queued or running; past that,
+callers get ``HashingBusy`` straight away and the views answer 503 with a
+``Retry-After`` header instead of piling up.
+
+Successful verifications are remembered for ``PASSWORD_CACHE_TTL`` seconds
+under a keyed BLAKE2 digest of (email, password), using a per-process
+random key, so repeated logins skip the hash. A hit only counts while the
+user's stored hash is unchanged, so a password change invalidates it.
+"""
+
+import asyncio
+import atexit
+import hashlib
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import _clean_credentials, _get_backends
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.signals import user_login_failed
+from django.core.exceptions import PermissionDenied
+
+from api.db import writer
+
+from . import hashers
+from .models import User
+
+
+WORKER_SETTINGS = ['PASSWORD_HASHERS', 'PASSWORD_PBKDF2_ITERATIONS']
+
+
+class HashingBusy(Exception):
+    """The hashing pool is at its pending-job cap"""
+
+    retry_after = 1
+
+
+class CredentialCache:
+    """Short-lived LRU of verified (email, password) digests"""
+
+    def __init__(self, ttl=None, max_entries=None):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._key = secrets.token_bytes(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else getattr(settings, 'PASSWORD_CACHE_TTL', 60)
+
+    @property
+    def max_entries(self):
+        return self._max_entries or getattr(settings, 'PASSWORD_CACHE_SIZE', 10000)
+
+    def _digest(self, email, password):
+        return hashlib.blake2b(f'{email}\0{password}'.encode(), key=self._key, digest_size=32).digest()
+
+    def get(self, email, password):
+        """Return the stored hash this pair was verified against, or None"""
+        if not self.ttl:
+            return None
+        digest = self._digest(email, password)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, email, password, encoded):
+        if not self.ttl:
+            return
+        digest = self._digest(email, password)
+        with self._lock:
+            self._entries[digest] = (encoded, time.monotonic() + self.ttl)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class HashingPool:
+    """Process pool for password hashing with a cap on pending jobs"""
+
+    def __init__(self, workers=None, max_pending=None):
+        self._workers = workers
+        self._max_pending = max_pending
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    @property
+    def workers(self):
+        if self._workers is not None:
+            return self._workers
+        return getattr(settings, 'PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+
+    @property
+    def max_pending(self):
+        return self._max_pending or getattr(settings, 'PASSWORD_HASH_MAX_PENDING', self.workers * 8 or 8)
+
+    def _start(self):
+        with self._lock:
+            if self._slots is None:
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+            if self._executor is None and self.workers:
+                overrides = {name: getattr(settings, name) for name in WORKER_SETTINGS if hasattr(settings, name)}
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # Forking a process that holds DB connections and threads is unsafe.
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=hashers.init_worker,
+                    initargs=(overrides,),
+                )
+
+    async def run(self, func, *args):
+        """Run ``func(*args)`` in the pool, or raise HashingBusy"""
+        if self._slots is None or (self._executor is None and self.workers):
+            self._start()
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingBusy()
+        try:
+            if self._executor is None:
+                # PASSWORD_HASH_WORKERS = 0 hashes in a thread, as before.
+                return await sync_to_async(func, thread_sensitive=False)(*args)
+            return await asyncio.wrap_future(self._executor.submit(func, *args))
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+
+pool = HashingPool()
+credentials = CredentialCache()
+atexit.register(pool.shutdown)
+
+
+async def amake_password(password):
+    return await pool.run(hashers.encode, password)
+
+
+async def acreate_user(username, email, password, **extra_fields):
+    """``User.objects.create_user`` with the hash computed in the pool"""
+    user = User(
+        username=User.normalize_username(username),
+        email=User.objects.normalize_email(email),
+        **extra_fields,
+    )
+    user.password = await amake_password(password)
+    await writer.arun(user.save)
+    return user
+
+
+async def _amodel_authenticate(backend, email, password):
+    """
+    ``ModelBackend.authenticate`` with the hash computed in the pool.
+
+    Unknown emails still pay for one hash so response time does not reveal
+    which accounts exist.
+    """
+    user = await User.objects.filter(email=email).afirst()
+    if user is None:
+        await amake_password(password)
+        return None
+
+    if credentials.get(email, password) == user.password:
+        valid, upgraded = True, None
+    else:
+        valid, upgraded = await pool.run(hashers.verify, password, user.password)
+    if not valid or not backend.user_can_authenticate(user):
+        return None
+
+    if upgraded:
+        await writer.arun(User.objects.filter(pk=user.pk, password=user.password).update, password=upgraded)
+        user.password = upgraded
+    credentials.put(email, password, user.password)
+    return user
+
+
+async def aauthenticate(request, email, password):
+    """
+    Return the user for these credentials, or None.
+
+    Mirrors ``django.contrib.auth.authenticate``: every backend in
+    ``AUTHENTICATION_BACKENDS`` is tried in order, ``ModelBackend`` and its
+    subclasses with the hash in the pool and any other backend in a thread,
+    and a failure sends ``user_login_failed``.
+    """
+    if email is not None and password is not None:
+        for backend, backend_path in _get_backends(return_tuples=True):
+            try:
+                if isinstance(backend, ModelBackend):
+                    user = await _amodel_authenticate(backend, email, password)
+                else:
+                    user = await sync_to_async(backend.authenticate)(request, username=email, password=password)
+            except PermissionDenied:
+                # This backend says to stop here.
+                break
+            if user is not None:
+                user.backend = backend_path
+                return user
+    await sync_to_async(user_login_failed.send)(
+        sender=__name__, credentials=_clean_credentials({'username': email, 'password': password}), request=request,
+    )
+    return None
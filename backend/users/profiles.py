@@ -0,0 +1,39 @@
+"""
+Cached profile payloads.
+
+``profile_view`` renders a user's profile from the ``profile`` namespace of
+the shared cache (``api.cache``), keyed by user id. ``User`` post_save and
+post_delete drop the entry; bulk writes of user totals, which send no
+signals, drop it explicitly (``invalidate``).
+"""
+
+from django.db import transaction
+
+from api.cache import TieredCache
+from games.levels import curve
+
+
+profile_cache = TieredCache('profile')
+
+
+def payload(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'total_score': user.total_score,
+        'games_played': user.games_played,
+        **curve.progress(user.experience_points),
+    }
+
+
+async def aprofile(user):
+    return await profile_cache.aget_or_set(user.pk, lambda: payload(user))
+
+
+def invalidate(user_ids):
+    """Drop cached profiles once the current transaction commits"""
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: profile_cache.delete_many(user_ids))
@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import User
+from .profiles import profile_cache
+from .tokens import revoke
+
+
+TOKEN_CLAIM_FIELDS = {'password', 'username', 'is_staff', 'is_superuser', 'is_active'}
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_profile(sender, instance, update_fields=None, **kwargs):
+    # Logging in only saves last_login, which the profile does not show.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    user_id = instance.pk
+    transaction.on_commit(lambda: profile_cache.delete(user_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def revoke_tokens(sender, instance, created=False, update_fields=None, **kwargs):
+    # Tokens carry the username and permission flags, and must not outlive a password change.
+    if created or (update_fields is not None and not TOKEN_CLAIM_FIELDS & set(update_fields)):
+        return
+    user_id = instance.pk
+    transaction.on_commit(lambda: revoke(user_id))
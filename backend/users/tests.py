@@ -0,0 +1,216 @@
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from . import passwords, tokens, views
+from .models import User
+
+
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'users-tests-shared'},
+}
+
+
+@override_settings(CACHES=LOCAL_CACHES, AUTH_TOKEN_KEYS=[('new', 'new-secret'), ('old', 'old-secret')])
+class TokenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='token-user', email='token-user@example.com', password=None)
+
+    def setUp(self):
+        caches['shared'].clear()
+
+    def test_round_trip(self):
+        token = tokens.issue(self.user)
+        self.assertTrue(token.startswith('new.'))
+        claims = tokens.verify(token)
+        self.assertEqual((claims['uid'], claims['usr'], claims['stf']), (self.user.id, 'token-user', False))
+
+        principal = tokens.principal(claims)
+        self.assertEqual(principal.get_deferred_fields() & {'id', 'username'}, set())
+        with self.assertNumQueries(1):
+            self.assertEqual((principal.email, principal.level), ('token-user@example.com', 1))
+
+    def test_refused_tokens(self):
+        token = tokens.issue(self.user)
+        kid, payload, signature = token.split('.')
+        refused = {
+            'malformed': 'not-a-token',
+            'unknown key': f'gone.{payload}.{signature}',
+            'tampered claims': f'{kid}.{payload[:-2]}AA.{signature}',
+            'other key': f'old.{payload}.{signature}',
+        }
+        for name, bad in refused.items():
+            with self.subTest(name), self.assertRaises(tokens.InvalidToken):
+                tokens.verify(bad)
+        with self.settings(AUTH_TOKEN_TTL=-1), self.assertRaises(tokens.InvalidToken):
+            tokens.verify(tokens.issue(self.user))
+
+    def test_rotated_key_still_verifies(self):
+        with self.settings(AUTH_TOKEN_KEYS=[('old', 'old-secret')]):
+            token = tokens.issue(self.user)
+        self.assertEqual(tokens.verify(token)['uid'], self.user.id)
+
+    def test_revocation_outlives_the_cache(self):
+        token = tokens.issue(self.user)
+        time.sleep(0.002)
+        tokens.revoke(self.user.id)
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.verify(token)
+
+        caches['shared'].clear()
+        with self.assertNumQueries(1), self.assertRaises(tokens.InvalidToken):
+            tokens.verify(token)
+        # Cached again: no query on the next check.
+        with self.assertNumQueries(0), self.assertRaises(tokens.InvalidToken):
+            tokens.verify(token)
+
+        time.sleep(0.002)
+        fresh = tokens.issue(self.user)
+        self.assertEqual(tokens.verify(fresh)['uid'], self.user.id)
+
+    def test_saving_the_password_revokes(self):
+        token = tokens.issue(self.user)
+        time.sleep(0.002)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('changed')
+            self.user.save()
+        caches['shared'].clear()
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.verify(token)
+
+    def test_deleted_user_is_refused(self):
+        token = tokens.issue(self.user)
+        User.objects.filter(pk=self.user.pk).delete()
+        caches['shared'].clear()
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.verify(token)
+
+    def test_logout_revokes_the_token(self):
+        token = tokens.issue(self.user)
+        time.sleep(0.002)
+        response = self.client.post('/api/auth/logout/', HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.token_valid_after)
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.verify(token)
+
+    def test_async_authentication(self):
+        token = tokens.issue(self.user)
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(async_to_sync(tokens.aauthenticate)(request).id, self.user.id)
+        tokens.revoke(self.user.id)
+        caches['shared'].clear()
+        self.assertFalse(async_to_sync(tokens.aauthenticate)(request).is_authenticated)
+        self.assertIsNone(async_to_sync(tokens.aauthenticate)(RequestFactory().get('/')))
+
+MODEL_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+
+
+class DenyingBackend:
+    def authenticate(self, request, username=None, password=None):
+        raise PermissionDenied
+
+
+class StaticBackend:
+    def authenticate(self, request, username=None, password=None):
+        return User.objects.filter(email=username).first() if password == 'static' else None
+
+
+@override_settings(CACHES=LOCAL_CACHES, PASSWORD_HASH_WORKERS=0, PASSWORD_PBKDF2_ITERATIONS=1000, PASSWORD_CACHE_TTL=0)
+class PasswordAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='login-user', email='login-user@example.com', password='right')
+
+    def _login(self, password, email='login-user@example.com'):
+        failures = []
+
+        def receiver(sender, credentials, **kwargs):
+            failures.append(credentials)
+
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+        return async_to_sync(passwords.aauthenticate)(RequestFactory().post('/'), email, password), failures
+
+    def test_valid_credentials(self):
+        user, failures = self._login('right')
+        self.assertEqual((user.pk, user.backend), (self.user.pk, MODEL_BACKEND))
+        self.assertEqual(failures, [])
+
+        response = self.client.post('/api/auth/login/', {'email': 'login-user@example.com', 'password': 'right'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('token', response.json())
+
+    def test_failures_send_the_signal(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        for name, email, password in (('wrong password', 'login-user@example.com', 'wrong'),
+                                      ('unknown email', 'nobody@example.com', 'right'),
+                                      ('inactive user', 'login-user@example.com', 'right')):
+            with self.subTest(name):
+                user, failures = self._login(password, email)
+                self.assertIsNone(user)
+                self.assertEqual(len(failures), 1)
+                self.assertEqual(failures[0]['username'], email)
+                self.assertNotEqual(failures[0]['password'], password)
+
+    @override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.AllowAllUsersModelBackend'])
+    def test_backend_decides_who_can_authenticate(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        user, _ = self._login('right')
+        self.assertEqual(user.backend, 'django.contrib.auth.backends.AllowAllUsersModelBackend')
+
+    @override_settings(AUTHENTICATION_BACKENDS=['users.tests.StaticBackend', MODEL_BACKEND])
+    def test_backends_are_tried_in_order(self):
+        user, _ = self._login('static')
+        self.assertEqual(user.backend, 'users.tests.StaticBackend')
+        user, _ = self._login('right')
+        self.assertEqual(user.backend, MODEL_BACKEND)
+
+    @override_settings(AUTHENTICATION_BACKENDS=['users.tests.DenyingBackend', MODEL_BACKEND])
+    def test_permission_denied_stops(self):
+        user, failures = self._login('right')
+        self.assertIsNone(user)
+        self.assertEqual(len(failures), 1)
+
+
+@override_settings(CACHES=LOCAL_CACHES, PASSWORD_HASH_WORKERS=0, PASSWORD_PBKDF2_ITERATIONS=1000, PASSWORD_CACHE_TTL=0)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        # The views are csrf_exempt; a client that enforces CSRF proves the async decorators kept the mark.
+        self.client = AsyncClient(enforce_csrf_checks=True)
+
+    def test_views_are_coroutines(self):
+        for view in (views.register_view, views.login_view, views.logout_view, views.profile_view):
+            with self.subTest(view.__name__):
+                self.assertTrue(iscoroutinefunction(view))
+
+    async def test_session_round_trip(self):
+        account = {'username': 'async-user', 'email': 'async-user@example.com', 'password': 'secret'}
+        response = await self.client.post(reverse('user-register'), account, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(await User.objects.filter(username='async-user', profile__isnull=False).aexists())
+
+        response = await self.client.post(reverse('user-login'), {'email': 'async-user@example.com',
+                                                                  'password': 'secret'},
+                                          content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        profile = await self.client.get(reverse('user-profile'))
+        self.assertEqual((profile.status_code, profile.json()['username']), (200, 'async-user'))
+
+        self.assertEqual((await self.client.post(reverse('user-logout'))).status_code, 200)
+        self.assertEqual((await self.client.get(reverse('user-profile'))).status_code, 401)
+
+    async def test_methods_are_enforced(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            response = await self.client.get(reverse('user-login'))
+        self.assertEqual(response.status_code, 405)
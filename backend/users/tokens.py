@@ -0,0 +1,188 @@
+"""
+Stateless API tokens.
+
+A token is ``<key id>.<claims>.<signature>``: base64url JSON claims (user
+id, username, staff flags, issue and expiry times) signed with HMAC-SHA256
+under one of ``AUTH_TOKEN_KEYS``. The first key signs new tokens and every
+listed key verifies, so a key is rotated by putting a new one first and
+removing the old one once ``AUTH_TOKEN_TTL`` has passed.
+
+``users.middleware.TokenAuthenticationMiddleware`` turns an
+``Authorization: Token ...`` header into ``request.user`` without touching
+the session table or the ``User`` row. The principal is a ``User`` with only the claimed fields
+loaded; the first access to any other field loads all of them in one query.
+
+Tokens cannot be recalled one by one. ``revoke(user_id)`` instead stores a
+cut-off in ``User.token_valid_after``, before which every token of that user
+is refused: logging out, and any save that changes the password, username or
+permission flags, revokes the user's existing tokens. Verification reads the
+cut-off through the ``shared`` cache and only queries the row when the entry
+is missing, so an evicted entry costs one query rather than a revocation.
+"""
+
+import base64
+import json
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .models import User
+
+
+KEY_SALT = 'users.tokens'
+# Claim name -> User field; everything else is loaded on first use.
+CLAIM_FIELDS = {'uid': 'id', 'usr': 'username', 'stf': 'is_staff', 'su': 'is_superuser'}
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _keys():
+    return getattr(settings, 'AUTH_TOKEN_KEYS', None) or [('default', settings.SECRET_KEY)]
+
+
+def _ttl():
+    return getattr(settings, 'AUTH_TOKEN_TTL', 24 * 3600)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _signature(secret, signed):
+    return _b64encode(salted_hmac(KEY_SALT, signed, secret=secret, algorithm='sha256').digest())
+
+
+def issue(user):
+    """Signed token for ``user`` with the current signing key"""
+    kid, secret = _keys()[0]
+    now = time.time()
+    claims = {claim: getattr(user, field) for claim, field in CLAIM_FIELDS.items()}
+    claims.update(iat=round(now, 3), exp=int(now + _ttl()))
+    signed = f'{kid}.{_b64encode(json.dumps(claims, separators=(",", ":")).encode())}'
+    return f'{signed}.{_signature(secret, signed)}'
+
+
+def _claims(token):
+    try:
+        kid, payload, signature = token.split('.')
+    except ValueError:
+        raise InvalidToken('Malformed token')
+    secret = dict(_keys()).get(kid)
+    if secret is None:
+        raise InvalidToken('Unknown signing key')
+    if not constant_time_compare(signature, _signature(secret, f'{kid}.{payload}')):
+        raise InvalidToken('Bad signature')
+    claims = json.loads(_b64decode(payload))
+    if claims['exp'] < time.time():
+        raise InvalidToken('Token expired')
+    return claims
+
+
+def _check_cutoff(claims, cutoff):
+    if cutoff is None:
+        raise InvalidToken('Unknown user')
+    if claims['iat'] <= cutoff:
+        raise InvalidToken('Token revoked')
+    return claims
+
+
+def verify(token):
+    """Claims of a valid, unexpired, unrevoked token; raises InvalidToken"""
+    claims = _claims(token)
+    cutoff = _shared().get(_revoked_key(claims['uid']))
+    if cutoff is None:
+        cutoff = _stored_cutoff(claims['uid'])
+    return _check_cutoff(claims, cutoff)
+
+
+async def averify(token):
+    """``verify`` for async callers; the row is only read on a cache miss"""
+    claims = _claims(token)
+    cutoff = _shared().get(_revoked_key(claims['uid']))
+    if cutoff is None:
+        cutoff = await sync_to_async(_stored_cutoff)(claims['uid'])
+    return _check_cutoff(claims, cutoff)
+
+
+def principal(claims):
+    """``User`` with the claimed fields loaded and the rest deferred"""
+    values = {field: claims[claim] for claim, field in CLAIM_FIELDS.items()}
+    # Deactivating a user revokes their tokens, so a valid token implies an active account.
+    values['is_active'] = True
+    names = [f.attname for f in User._meta.concrete_fields if f.attname in values]
+    user = User.from_db(DEFAULT_DB_ALIAS, names, [values[name] for name in names])
+    user._load_deferred_together = True
+    return user
+
+
+def _shared():
+    return caches[getattr(settings, 'CACHE_SHARED_ALIAS', 'shared')]
+
+
+def _revoked_key(user_id):
+    return f'auth-token:revoked:{user_id}'
+
+
+def _timestamp(value):
+    # 0 stands for "never revoked", so a cached miss is told apart from an evicted entry.
+    return value.timestamp() if value is not None else 0
+
+
+def _stored_cutoff(user_id):
+    """Cut-off from the user row, cached again; None for a deleted user"""
+    stored = User.objects.filter(pk=user_id).values_list('token_valid_after', flat=True)
+    if not stored:
+        return None
+    cutoff = _timestamp(stored[0])
+    _shared().set(_revoked_key(user_id), cutoff, timeout=_ttl())
+    return cutoff
+
+
+def revoke(user_id):
+    """Refuse every token issued to ``user_id`` until now"""
+    now = datetime.now(dt_timezone.utc)
+    # update() sends no post_save, so this does not revoke itself again.
+    User.objects.filter(pk=user_id).update(token_valid_after=now)
+    # Older tokens have expired once the entry does; the row answers any miss before that.
+    _shared().set(_revoked_key(user_id), _timestamp(now), timeout=_ttl())
+
+
+def _authorization(request):
+    header = request.headers.get('Authorization', '')
+    scheme, _, token = header.partition(' ')
+    return token.strip() if scheme == 'Token' and token else None
+
+
+def authenticate(request):
+    """Principal for the request's ``Authorization: Token`` header, None without one"""
+    token = _authorization(request)
+    if token is None:
+        return None
+    try:
+        request.auth_claims = verify(token)
+    except (InvalidToken, ValueError, KeyError, TypeError):
+        return AnonymousUser()
+    return principal(request.auth_claims)
+
+
+async def aauthenticate(request):
+    token = _authorization(request)
+    if token is None:
+        return None
+    try:
+        request.auth_claims = await averify(token)
+    except (InvalidToken, ValueError, KeyError, TypeError):
+        return AnonymousUser()
+    return principal(request.auth_claims)
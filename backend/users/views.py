@@ -1,14 +1,25 @@
+from asgiref.sync import sync_to_async
 from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
-from django.contrib.auth import login, logout, authenticate
-from django.views.decorators.http import require_http_methods
+from django.contrib.auth import login, logout
 import json
+from api.db import writer
+from api.decorators import csrf_exempt, require_http_methods
+from .auth import aget_user
 from .models import User, UserProfile
+from .passwords import HashingBusy, aauthenticate, acreate_user
+from .profiles import aprofile
+from .tokens import issue as issue_token, revoke as revoke_tokens
+
+
+def _busy(exc):
+    response = JsonResponse({'error': 'Server busy, please retry'}, status=503)
+    response['Retry-After'] = str(exc.retry_after)
+    return response
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def register_view(request):
+async def register_view(request):
     """Basic user registration"""
     try:
         data = json.loads(request.body)
@@ -16,20 +27,20 @@ def register_view(request):
         email = data.get('email')
         password = data.get('password')
         
-        if User.objects.filter(username=username).exists():
+        if await User.objects.filter(username=username).aexists():
             return JsonResponse({'error': 'Username already exists'}, status=400)
         
-        if User.objects.filter(email=email).exists():
+        if await User.objects.filter(email=email).aexists():
             return JsonResponse({'error': 'Email already exists'}, status=400)
             
-        user = User.objects.create_user(
+        user = await acreate_user(
             username=username,
             email=email,
             password=password,
             first_name=data.get('first_name', ''),
             last_name=data.get('last_name', '')
         )
-        UserProfile.objects.create(user=user)
+        await writer.arun(UserProfile.objects.create, user=user)
         
         return JsonResponse({
             'message': 'User created successfully',
@@ -41,24 +52,27 @@ def register_view(request):
                 'last_name': user.last_name
             }
         })
+    except HashingBusy as e:
+        return _busy(e)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def login_view(request):
+async def login_view(request):
     """Basic user login"""
     try:
         data = json.loads(request.body)
         email = data.get('email')
         password = data.get('password')
         
-        user = authenticate(username=email, password=password)
+        user = await aauthenticate(request, email, password)
         if user:
-            login(request, user)
+            await sync_to_async(login)(request, user)
             return JsonResponse({
                 'message': 'Login successful',
+                'token': issue_token(user),
                 'user': {
                     'id': user.id,
                     'username': user.username,
@@ -69,32 +83,27 @@ def login_view(request):
             })
         else:
             return JsonResponse({'error': 'Invalid credentials'}, status=400)
+    except HashingBusy as e:
+        return _busy(e)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def logout_view(request):
+async def logout_view(request):
     """Basic user logout"""
-    logout(request)
+    if getattr(request, 'auth_claims', None):
+        # Writes the cut-off to the user row, so not on the event loop.
+        await writer.arun(revoke_tokens, request.auth_claims['uid'])
+    await sync_to_async(logout)(request)
     return JsonResponse({'message': 'Successfully logged out'})
 
 
-def profile_view(request):
+async def profile_view(request):
     """Get user profile"""
-    if not request.user.is_authenticated:
+    user = await aget_user(request)
+    if not user.is_authenticated:
         return JsonResponse({'error': 'Not authenticated'}, status=401)
     
-    user = request.user
-    return JsonResponse({
-        'id': user.id,
-        'username': user.username,
-        'email': user.email,
-        'first_name': user.first_name,
-        'last_name': user.last_name,
-        'total_score': user.total_score,
-        'games_played': user.games_played,
-        'level': user.level,
-        'experience_points': user.experience_points
-    })
+    return JsonResponse(await aprofile(user))